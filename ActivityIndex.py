@@ -0,0 +1,99 @@
+import numpy as np
+
+
+class ActivityIndex:
+    """ An activity profile of a video built from the compressed size of its frames, no frame is decoded.
+    In a SEQ file every frame is a JPEG image, and its size changes noticeably when larvae move or food is added to
+    the tank, while it stays almost constant when nothing happens. The sizes are read from the frame headers (see
+    SEQReader.compressed_sizes), which only costs a few bytes per frame.
+    The activity of a frame is the rolling z-score of the frame to frame size change: how unusual the change is
+    compared to the window frames before it. Frames whose activity stays below a threshold are idle, long idle
+    stretches can be skipped by the Movie Cutter before decoding them."""
+
+    def __init__(self, sizes, window=250, threshold=3.0, pad=100):
+        """ Build the activity profile. inputs:
+        sizes - compressed size of every frame, in bytes
+        window - number of preceding frames the z-scores are computed against
+        threshold - z-score above which a frame is active
+        pad - frames within pad frames of an active frame are considered active too"""
+        self.sizes = np.asarray(sizes, dtype='float64')
+        self.window = window
+        self.threshold = threshold
+        self.pad = pad
+        self.changes = np.abs(np.diff(self.sizes, prepend=self.sizes[:1]))  # frame to frame size change
+        self.zscores = self.rolling_zscore(self.changes, window)
+        self.active = self._padded(np.abs(self.zscores) > threshold, pad)
+
+    @staticmethod
+    def rolling_zscore(values, window):
+        """ Z-score of every value against the mean and standard deviation of the window values before it.
+        The first values are scored against whatever values precede them."""
+        values = np.asarray(values, dtype='float64')
+        sums = np.concatenate([[0], np.cumsum(values)])
+        squares = np.concatenate([[0], np.cumsum(values ** 2)])
+        stop = np.arange(len(values))
+        start = np.maximum(stop - window, 0)
+        counts = np.maximum(stop - start, 1)
+        mean = (sums[stop] - sums[start]) / counts
+        var = (squares[stop] - squares[start]) / counts - mean ** 2
+        std = np.sqrt(np.maximum(var, 0))
+        # Avoid dividing by zero on perfectly constant stretches, a tiny change there is still unusual:
+        std = np.maximum(std, 1.0)
+        zscores = (values - mean) / std
+        zscores[:1] = 0  # no frames before the first one, also fine for empty videos
+        return zscores
+
+    @staticmethod
+    def _padded(mask, pad):
+        """ Extend every True run of a mask by pad entries on both sides."""
+        if pad <= 0 or not mask.any():
+            return mask
+        # A frame is within pad frames of an active frame if the running count of active frames changes between
+        # pad frames before it and pad frames after it:
+        counts = np.concatenate([[0], np.cumsum(mask)])
+        idx = np.arange(len(mask))
+        return counts[np.minimum(idx + pad + 1, len(mask))] - counts[np.maximum(idx - pad, 0)] > 0
+
+    def change_points(self, min_gap=None, threshold=None):
+        """ Get the frames where the mean compressed size shifts, i.e. the mean of the window frames after a frame
+        differs from the mean of the window frames before it by more than threshold pooled standard deviations.
+        Only the strongest change point within min_gap frames (window by default) is kept."""
+        min_gap = self.window if min_gap is None else min_gap
+        threshold = self.threshold if threshold is None else threshold
+        n, w = len(self.sizes), self.window
+        if n < 2 * w:
+            return np.array([], dtype='int64')
+        sums = np.concatenate([[0], np.cumsum(self.sizes)])
+        squares = np.concatenate([[0], np.cumsum(self.sizes ** 2)])
+        idx = np.arange(w, n - w + 1)
+        before = (sums[idx] - sums[idx - w]) / w
+        after = (sums[idx + w] - sums[idx]) / w
+        var = ((squares[idx + w] - squares[idx - w]) / (2 * w)) - ((before + after) / 2) ** 2
+        scores = np.abs(after - before) / np.maximum(np.sqrt(np.maximum(var, 0)), 1.0)
+        points = []
+        for i in np.argsort(-scores):
+            if scores[i] <= threshold:
+                break
+            if all(abs(idx[i] - point) >= min_gap for point in points):
+                points.append(idx[i])
+        return np.array(sorted(points), dtype='int64')
+
+    def idle_stretches(self, min_length=1):
+        """ Get the (start, stop) frame ranges of idle frames that are at least min_length frames long."""
+        edges = np.flatnonzero(np.diff(np.concatenate([[True], self.active, [True]]).astype('int8')))
+        # edges alternate between the start of an idle run and its end:
+        starts, stops = edges[0::2], edges[1::2]
+        keep = stops - starts >= min_length
+        return list(zip(starts[keep].tolist(), stops[keep].tolist()))
+
+    def idle_stop(self, min_length=1):
+        """ Get an array with the end of the idle stretch (of at least min_length frames) every frame is in, or -1
+        for frames that aren't in one, to check frames quickly while cutting."""
+        stop = np.full(len(self.sizes), -1, dtype='int64')
+        for start, end in self.idle_stretches(min_length):
+            stop[start:end] = end
+        return stop
+
+    @property
+    def idle_fraction(self):
+        return 1 - self.active.mean() if len(self.active) else 0.0
@@ -1,6 +1,6 @@
 
 import tkinter as tk
-import PIL.Image, PIL.ImageTk
+from FrameRenderer import FrameRenderer
 
 
 class AdvanceMovieCutterGUI:
@@ -25,6 +25,14 @@ class AdvanceMovieCutterGUI:
         self.btn_apply_brightness = tk.Checkbutton(master=self.frm_attributes,text='Save brightened videos',
                                                    variable=self.apply_brightness, command=self.set_brightness)
         self.btn_show_changes = tk.Button(master=self.frm_attributes, text='Show Changes', command=self.show_changes)
+        # Region of interest, drawn on the preview by clicking its corners, saved next to the video:
+        self.btn_draw_roi = tk.Button(master=self.frm_attributes, text='Draw ROI', command=self.draw_roi)
+        self.btn_clear_roi = tk.Button(master=self.frm_attributes, text='Clear ROI', command=self.clear_roi)
+        self.roi_all = tk.BooleanVar()
+        self.btn_roi_all = tk.Checkbutton(master=self.frm_attributes, text='Same ROI for all videos',
+                                          variable=self.roi_all)
+        self.roi_points = []  # corners of the ROI being drawn
+        self.roi_item = None  # canvas item of the ROI outline
         self.frm_vid_control = tk.Frame(master=self.window)
         self.btn_preview = tk.Button(master=self.frm_vid_control, text="Preview", command=self.play_vid)
         self.btn_preview.bind('<Button-1>', self.handle_preview)
@@ -32,7 +40,9 @@ class AdvanceMovieCutterGUI:
         self.btn_next = tk.Button(master=self.frm_vid_control, text="\N{RIGHTWARDS ARROW}", command=self.next_vid)
         self.panel = tk.Canvas(master=self.window, width=self.curr_movie_cutter.SHAPE[0],
                                height=800)
+        self.renderer = FrameRenderer(self.panel)  # Draws the preview frames onto the panel
         self.display_frame()
+        self.draw_roi_outline()
         self.pause = True
         self.set_layout()
 
@@ -42,6 +52,7 @@ class AdvanceMovieCutterGUI:
     def on_close(self):
         self.curr_movie_cutter.set_start_frame()
         self.curr_movie_cutter.reset_bg_subtractor()
+        self.curr_movie_cutter.free_train_cache()  # cutting retrains from the video or the background cache
         self.window.destroy()
 
     def set_brightness(self,event=None):
@@ -76,12 +87,31 @@ class AdvanceMovieCutterGUI:
             self.curr_movie_cutter.start_frame = int(x)
             self.curr_movie_cutter.set_start_frame()
 
+        def set_edge_scale(x):
+            # The edge mask is downsampled by halving, so the scale is rounded down to a power of two (up to 4):
+            scale = 2 ** (min(max(int(x), 1), self.curr_movie_cutter.MAX_EDGE_SCALE).bit_length() - 1)
+            if scale > 1 and self.curr_movie_cutter.tiles is not None:
+                print('Edge Scale and Tiles can not be combined, set Tiles to 1 first')
+                return
+            self.curr_movie_cutter.edge_scale = scale
+
+        def set_tiles(x):
+            # an n x n grid of tiles, 1 computes the edge mask on the whole frame:
+            tiles = (int(x), int(x)) if int(x) > 1 else None
+            if tiles is not None and self.curr_movie_cutter.edge_scale > 1:
+                print('Edge Scale and Tiles can not be combined, set Edge Scale to 1 first')
+                return
+            self.curr_movie_cutter.tiles = tiles
+
         self.attribute_value_dict = {'brighten': (self.curr_movie_cutter.brighten, 'Brighten', set_bright),
                                      'blur': (self.curr_movie_cutter.blur[0], 'Blur', set_blur),
                                      'min_width': (self.curr_movie_cutter.min_width, 'Minimum Blob Width', set_width),
                                      'min_height': (self.curr_movie_cutter.min_height, 'Minimum Blob Height', set_height),
                                      'clip_length': (self.curr_movie_cutter.movie_length-1, 'Clip Length', set_length),
-                                     'start_frame': (self.curr_movie_cutter.start_frame, 'Start Frame', set_start)}
+                                     'start_frame': (self.curr_movie_cutter.start_frame, 'Start Frame', set_start),
+                                     'edge_scale': (self.curr_movie_cutter.edge_scale, 'Edge Scale', set_edge_scale),
+                                     'tiles': (self.curr_movie_cutter.tiles[0] if self.curr_movie_cutter.tiles else 1,
+                                               'Tiles', set_tiles)}
 
     def focus_next(self, event):
         self.update_attributes(event)
@@ -115,6 +145,9 @@ class AdvanceMovieCutterGUI:
             counter += 1
         self.btn_apply_brightness.grid(row=counter+1, column=0, sticky="ew", padx=5, pady=10)
         self.btn_show_changes.grid(row=counter+2, column=0, sticky="ew", padx=5, pady=10)
+        self.btn_draw_roi.grid(row=counter+3, column=0, sticky="ew", padx=5, pady=10)
+        self.btn_clear_roi.grid(row=counter+4, column=0, sticky="ew", padx=5, pady=10)
+        self.btn_roi_all.grid(row=counter+5, column=0, sticky="ew", padx=5, pady=10)
         self.frm_attributes.grid(row=0, column=0, sticky="ns")
 
         self.panel.grid(row=0, column=1, sticky="nsew")
@@ -124,6 +157,10 @@ class AdvanceMovieCutterGUI:
         self.frm_vid_control.grid(row=1, column=1)
 
     def set_cutter(self):
+        if self.curr_movie_cutter is not self.movie_cutters[self.curr_cutter_idx]:
+            # Only the previewed video keeps its training frames in memory, the background cache still avoids
+            # retraining the others from scratch:
+            self.curr_movie_cutter.free_train_cache()
         self.curr_movie_cutter = self.movie_cutters[self.curr_cutter_idx]
         if self.visited[self.curr_cutter_idx] == 0:
             print('training bg subtractor...')
@@ -132,6 +169,7 @@ class AdvanceMovieCutterGUI:
         self.curr_frame_gen = self.curr_movie_cutter.process_vid()
         self.set_attribute_vars()
         self.display_attributes()
+        self.draw_roi_outline()
 
     def prev_vid(self):
         self.curr_cutter_idx -= 1
@@ -152,9 +190,7 @@ class AdvanceMovieCutterGUI:
     def display_frame(self):
         """Read a single frame from the current video and display it onto the GUI."""
         frame = next(self.curr_frame_gen)  # Save that frame
-        # Convert frame to display it on GUI:
-        self.photo = PIL.ImageTk.PhotoImage(image=PIL.Image.fromarray(frame))
-        self.panel.create_image(0, 0, image=self.photo, anchor=tk.NW)  # Draw the image in the Panel widget
+        self.renderer.render(frame)  # Draw the image in the Panel widget
 
     def play_vid(self):
         try:
@@ -173,11 +209,63 @@ class AdvanceMovieCutterGUI:
     def show_changes(self):
         print(self.curr_movie_cutter)
         self.curr_movie_cutter.set_start_frame()
-        self.curr_movie_cutter.reset_bg_subtractor()
+        # Retrains from the cached training frames, and only if a setting of the background model has changed:
         self.curr_movie_cutter.train_bg_subtractor()
         self.curr_frame_gen = self.curr_movie_cutter.process_vid()
         self.display_frame()
 
-
-
-
+    def draw_roi(self):
+        """ Start drawing an ROI: left click the corners of the polygon on the preview, right click (or double
+        click) to close it."""
+        self.pause = True
+        self.roi_points = []
+        self.panel.bind('<Button-1>', self.add_roi_point)
+        self.panel.bind('<Button-3>', self.finish_roi)
+        self.panel.bind('<Double-Button-1>', self.finish_roi)
+        self.draw_roi_outline()
+
+    def add_roi_point(self, event):
+        self.roi_points.append((int(self.panel.canvasx(event.x)), int(self.panel.canvasy(event.y))))
+        self.draw_roi_outline()
+
+    def finish_roi(self, event=None):
+        self.panel.unbind('<Button-1>')
+        self.panel.unbind('<Button-3>')
+        self.panel.unbind('<Double-Button-1>')
+        points, self.roi_points = self.roi_points, []
+        if len(points) < 3:
+            self.draw_roi_outline()
+            return
+        self.set_roi(points)
+
+    def clear_roi(self):
+        self.set_roi(None)
+
+    def set_roi(self, polygon):
+        """ Apply an ROI to the current video, or to all of them, save it and show the detection with it."""
+        cutters = self.movie_cutters if self.roi_all.get() else [self.curr_movie_cutter]
+        for movie_cutter in cutters:
+            try:
+                movie_cutter.set_roi(polygon)
+            except ValueError as error:
+                print(error)
+                continue
+            movie_cutter.save_roi()
+        self.draw_roi_outline()
+        self.show_changes()
+
+    def draw_roi_outline(self):
+        """ Draw the ROI of the current video, or the corners clicked so far, over the preview."""
+        if self.roi_item is not None:
+            self.panel.delete(self.roi_item)
+            self.roi_item = None
+        points = self.roi_points if self.roi_points else self.curr_movie_cutter.roi
+        if not points:
+            return
+        coords = [c for point in points for c in point]
+        if len(points) < 3:
+            # Still drawing, mark the corners with a line (a single corner gets a dot):
+            coords = coords * 2 if len(points) == 1 else coords
+            self.roi_item = self.panel.create_line(*coords, fill='yellow', width=2)
+        else:
+            self.roi_item = self.panel.create_polygon(*coords, outline='yellow', fill='', width=2)
@@ -0,0 +1,132 @@
+import argparse
+import hashlib
+import json
+import os
+import cv2
+
+
+class BackgroundCache:
+    """ A disk cache of trained background models, so cutting a video again (e.g. with a different padding or clip
+    length) doesn't have to train the background subtractor from the video frames again.
+    MOG2 can't save its state, so the cache keeps the background image of the trained subtractor along with the
+    settings it was trained with. A new subtractor is warm started from the background image with a single update
+    at learning rate 1, see the warm_start method.
+    Entries are keyed by a hash of the video identity (path, size and modification time) and of the training
+    settings (brightness, blur, start frame and number of training frames), so changing any of them or replacing
+    the video file trains a new model. Every entry is a lossless PNG image and a small json file with the settings,
+    the least recently used entries are evicted once the cache is larger than max_mb."""
+    DEFAULT_DIR = os.path.join(os.path.expanduser('~'), '.fish_cutter', 'backgrounds')
+
+    def __init__(self, cache_dir=DEFAULT_DIR, max_mb=512):
+        """ Open a cache, the directory is created if needed. inputs:
+        cache_dir - directory of the cached backgrounds
+        max_mb - maximal total size of the cache"""
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_mb * 2**20
+
+    @staticmethod
+    def video_identity(video_path):
+        """ Identify a video by its full path, size and modification time."""
+        stat = os.stat(video_path)
+        return [os.path.abspath(video_path), stat.st_size, stat.st_mtime_ns]
+
+    def key(self, video_path, params):
+        """ Get the cache key of a video and its training settings."""
+        identity = json.dumps([self.video_identity(video_path), list(params)])
+        return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+    def _paths(self, key):
+        return os.path.join(self.cache_dir, key + '.png'), os.path.join(self.cache_dir, key + '.json')
+
+    def load(self, video_path, params):
+        """ Get the cached background image of a video trained with params, or None if there is none."""
+        try:
+            image_path, info_path = self._paths(self.key(video_path, params))
+        except OSError:
+            return None
+        if not os.path.isfile(info_path):
+            return None
+        background = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+        if background is None:
+            return None
+        os.utime(info_path)  # mark the entry as recently used
+        return background
+
+    def store(self, video_path, params, background):
+        """ Save the background image of a video trained with params, and evict old entries if the cache is full."""
+        key = self.key(video_path, params)
+        image_path, info_path = self._paths(key)
+        if not cv2.imwrite(image_path, background):
+            return False
+        info = {'video': self.video_identity(video_path)[0], 'params': list(params)}
+        # The json file marks a complete entry, write it last:
+        with open(info_path + '.tmp', 'w') as file:
+            json.dump(info, file)
+        os.replace(info_path + '.tmp', info_path)
+        self.evict(keep=key)
+        return True
+
+    def entries(self):
+        """ Get the cache entries as (last used time, size in bytes, key, video path) tuples, oldest first."""
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith('.json'):
+                continue
+            key = filename[:-len('.json')]
+            image_path, info_path = self._paths(key)
+            try:
+                with open(info_path) as file:
+                    video = json.load(file).get('video')
+                size = os.path.getsize(info_path) + os.path.getsize(image_path)
+                used = os.path.getmtime(info_path)
+            except (OSError, ValueError):
+                video, size, used = None, 0, 0
+            entries.append((used, size, key, video))
+        return sorted(entries)
+
+    def _remove(self, key):
+        for path in self._paths(key):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def evict(self, keep=None):
+        """ Remove the least recently used entries until the cache is no larger than max_bytes.
+        inputs:
+        keep - optional, key of an entry that shouldn't be removed"""
+        entries = self.entries()
+        total = sum(size for _, size, _, _ in entries)
+        for _, size, key, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if key != keep:
+                self._remove(key)
+                total -= size
+
+    def invalidate(self, video_path=None):
+        """ Remove the cached backgrounds of a video, with any training settings, or the whole cache if no video is
+        given. Returns the number of entries removed."""
+        video = os.path.abspath(video_path) if video_path is not None else None
+        removed = 0
+        for _, _, key, entry_video in self.entries():
+            if video is None or entry_video == video:
+                self._remove(key)
+                removed += 1
+        return removed
+
+    @staticmethod
+    def warm_start(bg_sub, background):
+        """ Initialize a new background subtractor from a background image. With learning rate 1 the model is
+        replaced by the image, the following frames refine it as usual."""
+        bg_sub.apply(background, None, 1)
+        return bg_sub
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Clear cached background models of the Movie Cutter')
+    parser.add_argument('videos', nargs='*', help='videos to clear, the whole cache by default')
+    parser.add_argument('--cache_dir', default=BackgroundCache.DEFAULT_DIR, help='the cache directory')
+    args = parser.parse_args()
+    cache = BackgroundCache(args.cache_dir)
+    removed = sum(cache.invalidate(video) for video in args.videos) if args.videos else cache.invalidate()
+    print(f'[INFO] removed {removed} cached backgrounds from {args.cache_dir}')
@@ -0,0 +1,75 @@
+import numpy as np
+
+
+class CentroidTracker:
+    """ Follow fish between frames by their centroids.
+    Every update associates the new detections with the existing tracks greedily, closest pairs first. Candidate
+    pairs are only looked up in the neighbouring cells of a spatial grid (cells of max_distance pixels), so an update
+    costs about the number of detections rather than tracks x detections. Matched track positions are smoothed with
+    an exponential moving average, tracks that go unmatched for more than max_missed updates are dropped and
+    unmatched detections start new tracks."""
+
+    def __init__(self, max_distance=100, smoothing=0.5, max_missed=10):
+        """ Initialize a tracker. inputs:
+        max_distance - maximal distance in pixels a fish can move between two updates
+        smoothing - weight of a new detection in the smoothed track position, 1 follows the detections exactly
+        max_missed - number of updates a track survives without a matching detection"""
+        self.max_distance = max_distance
+        self.smoothing = smoothing
+        self.max_missed = max_missed
+        self.tracks = {}  # track id -> [smoothed (x, y) position, number of updates missed]
+        self.next_id = 0
+
+    def _candidate_pairs(self, positions, detections):
+        """ Get (distance, track index, detection index) pairs closer than max_distance, sorted by distance."""
+        cell = self.max_distance
+        grid = {}  # grid cell -> indices of the detections in it
+        for d, (x, y) in enumerate(detections):
+            grid.setdefault((int(x // cell), int(y // cell)), []).append(d)
+        pairs = []
+        for t, (x, y) in enumerate(positions):
+            col, row = int(x // cell), int(y // cell)
+            candidates = [d for dx in (-1, 0, 1) for dy in (-1, 0, 1) for d in grid.get((col + dx, row + dy), ())]
+            if not candidates:
+                continue
+            distances = np.hypot(*(detections[candidates] - positions[t]).T)
+            pairs.extend((distance, t, d) for distance, d in zip(distances, candidates) if distance <= cell)
+        return sorted(pairs)
+
+    def update(self, detections, create=True):
+        """ Update the tracks with the (x, y) centroids detected in a frame. inputs:
+        detections - (N, 2) array like of centroids
+        create - start new tracks for unmatched detections
+        Returns the track id of every detection, -1 for unmatched detections when create is False."""
+        detections = np.asarray(detections, dtype='float64').reshape(-1, 2)
+        ids = np.full(len(detections), -1, dtype='int64')
+        track_ids = list(self.tracks)
+        matched = set()
+        if track_ids and len(detections):
+            positions = np.array([self.tracks[track_id][0] for track_id in track_ids])
+            for _, t, d in self._candidate_pairs(positions, detections):
+                if track_ids[t] in matched or ids[d] >= 0:
+                    continue
+                track = self.tracks[track_ids[t]]
+                track[0] = track[0] + self.smoothing * (detections[d] - track[0])
+                track[1] = 0
+                ids[d] = track_ids[t]
+                matched.add(track_ids[t])
+        for track_id in track_ids:
+            if track_id not in matched:
+                self.tracks[track_id][1] += 1
+                if self.tracks[track_id][1] > self.max_missed:
+                    del self.tracks[track_id]
+        if create:
+            for d in np.flatnonzero(ids < 0):
+                self.tracks[self.next_id] = [detections[d].copy(), 0]
+                ids[d] = self.next_id
+                self.next_id += 1
+        return ids
+
+    def position(self, track_id):
+        """ Get the smoothed (x, y) position of a track, or None if the track was dropped."""
+        track = self.tracks.get(track_id)
+        if track is None:
+            return None
+        return int(round(track[0][0])), int(round(track[0][1]))
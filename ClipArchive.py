@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import struct
+import threading
+import cv2
+import numpy as np
+
+
+class ClipArchive:
+    """ Read a packed clip archive, a single file holding all the clips cut from one video.
+    Like a SEQ file, the archive stores every frame as a JPEG image. The frames of each clip are stored one after
+    the other, followed by a json index with the offset and the frame sizes of every clip, and a fixed size footer
+    pointing to the index:
+        MAGIC | clip frames (JPEG) ... | index (json) | index offset (uint64) | index size (uint64) | FOOTER_MAGIC
+    Clips inside an archive are addressed by virtual paths, [archive path]/[clip name], e.g.
+    cuts/video/video.clips/cutoutframe_500_coords_100-200_fish0.avi, so the clip name is the basename of the path
+    just like for clips saved as separate files. See the open_capture function to open either kind of path.
+    Archives are opened once and cached, see the open method."""
+    EXTENSION = '.clips'
+    MAGIC = b'CLIPARC1'
+    FOOTER_MAGIC = b'CLIPIDX1'
+    FOOTER = struct.Struct('<QQ8s')
+    _archives = {}  # archive path -> opened ClipArchive
+    _archives_lock = threading.Lock()
+
+    def __init__(self, path):
+        """ Open an archive and read its index."""
+        self.path = path
+        with open(path, 'rb') as file:
+            if file.read(len(self.MAGIC)) != self.MAGIC:
+                raise ValueError(f'{path} is not a clip archive')
+            # An archive that wasn't closed can be shorter than the footer:
+            if file.seek(0, os.SEEK_END) < len(self.MAGIC) + self.FOOTER.size:
+                footer_magic = None
+            else:
+                file.seek(-self.FOOTER.size, os.SEEK_END)
+                index_offset, index_size, footer_magic = self.FOOTER.unpack(file.read(self.FOOTER.size))
+            if footer_magic != self.FOOTER_MAGIC:
+                raise ValueError(f'{path} has no index, the archive was not closed properly')
+            file.seek(index_offset)
+            index = json.loads(file.read(index_size).decode('utf-8'))
+        self.fps = index['fps']
+        self.frame_size = tuple(index['frame_size'])  # (width, height)
+        self.clips = index['clips']  # clip name -> {'offset': first frame offset, 'sizes': frame sizes}
+
+    @classmethod
+    def open(cls, path):
+        """ Get an opened archive, archives are only opened once per path."""
+        with cls._archives_lock:
+            archive = cls._archives.get(path)
+            if archive is None:
+                archive = cls._archives[path] = cls(path)
+            return archive
+
+    @classmethod
+    def split_path(cls, path):
+        """ Split a virtual clip path to the archive path and the clip name.
+        Returns (None, None) if the path doesn't point into an archive."""
+        archive_path, clip_name = os.path.split(path)
+        if archive_path.endswith(cls.EXTENSION) and os.path.isfile(archive_path):
+            return archive_path, clip_name
+        return None, None
+
+    def clip_names(self):
+        return list(self.clips)
+
+    def clip_paths(self):
+        """ Get the virtual paths of all the clips in the archive."""
+        return [os.path.join(self.path, clip_name) for clip_name in self.clips]
+
+    def read_clip(self, clip_name):
+        """ Read the compressed frames of a clip, returns a list of JPEG encoded frames."""
+        clip = self.clips[clip_name]
+        with open(self.path, 'rb') as file:
+            file.seek(clip['offset'])
+            data = file.read(sum(clip['sizes']))  # the frames of a clip are contiguous, read them in one go
+        offsets = np.concatenate([[0], np.cumsum(clip['sizes'])])
+        return [data[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+
+    def open_clip(self, clip_name):
+        """ Open a clip as a video capture like object, see the ArchiveClip class."""
+        return ArchiveClip(self.read_clip(clip_name), self.fps, self.frame_size)
+
+    def export(self, out_dir, clip_names=None):
+        """ Write clips back out as individual MJPG AVI files, named after the clips. Frames are decoded and encoded
+        again by the AVI writer. inputs:
+        out_dir - directory to write the AVI files to
+        clip_names - optional, clips to export, all clips by default
+        Returns the paths of the exported files."""
+        os.makedirs(out_dir, exist_ok=True)
+        fourcc = cv2.VideoWriter_fourcc(*'MJPG')
+        paths = []
+        for clip_name in clip_names if clip_names is not None else self.clips:
+            path = os.path.join(out_dir, clip_name)
+            writer = cv2.VideoWriter(path, fourcc, self.fps, self.frame_size, False)
+            for encoded in self.read_clip(clip_name):
+                writer.write(cv2.imdecode(np.frombuffer(encoded, dtype='uint8'), cv2.IMREAD_GRAYSCALE))
+            writer.release()
+            paths.append(path)
+        return paths
+
+
+class ArchiveClip:
+    """ A clip from a clip archive with the cv2.VideoCapture interface used by the Movie Player (read, grab, get,
+    set, isOpened and release). The compressed frames are held in memory, frames are decoded as they are read."""
+
+    def __init__(self, frames, fps, frame_size):
+        self.frames = frames  # JPEG encoded frames
+        self.fps = fps
+        self.frame_size = frame_size  # (width, height)
+        self.pos = 0  # index of the next frame to read
+
+    def grab(self):
+        """ Skip the next frame without decoding it."""
+        if self.pos >= len(self.frames):
+            return False
+        self.pos += 1
+        return True
+
+    def read(self):
+        if self.pos >= len(self.frames):
+            return False, None
+        frame = cv2.imdecode(np.frombuffer(self.frames[self.pos], dtype='uint8'), cv2.IMREAD_GRAYSCALE)
+        self.pos += 1
+        return frame is not None, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.pos
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self.frames)
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.frame_size[0]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.frame_size[1]
+        return 0
+
+    def set(self, prop, value):
+        if prop != cv2.CAP_PROP_POS_FRAMES:
+            return False
+        self.pos = min(max(int(value), 0), len(self.frames))
+        return True
+
+    def isOpened(self):
+        return len(self.frames) > 0
+
+    def release(self):
+        self.frames = []
+
+
+class ClipArchiveWriter:
+    """ Write a packed clip archive, see the ClipArchive class for the format.
+    Each clip is buffered as JPEG encoded frames by a ClipSegmentWriter and appended to the archive in one piece
+    when it is done, so the frames of a clip are contiguous in the file. The index is written when the archive is
+    closed, an archive that wasn't closed can't be read."""
+
+    def __init__(self, path, fps, frame_size, quality=95):
+        """ Create an archive. inputs:
+        path - path of the archive file, should end with ClipArchive.EXTENSION
+        fps - frame rate of the clips
+        frame_size - (width, height) of the clip frames
+        quality - JPEG quality of the frames"""
+        self.path = path
+        self.fps = fps
+        self.frame_size = tuple(frame_size)
+        self.quality = quality
+        self.clips = {}
+        self.file = open(path, 'wb')
+        self.file.write(ClipArchive.MAGIC)
+
+    def segment(self):
+        """ Get a writer for a new clip, with the same write/release interface as cv2.VideoWriter."""
+        return ClipSegmentWriter(self.quality)
+
+    def add_clip(self, clip_name, frames):
+        """ Append the JPEG encoded frames of a clip to the archive."""
+        self.clips[clip_name] = {'offset': self.file.tell(), 'sizes': [len(frame) for frame in frames]}
+        for frame in frames:
+            self.file.write(frame)
+
+    def close(self):
+        """ Write the index and close the file."""
+        if self.file.closed:
+            return
+        index = json.dumps({'fps': self.fps, 'frame_size': self.frame_size, 'clips': self.clips}).encode('utf-8')
+        index_offset = self.file.tell()
+        self.file.write(index)
+        self.file.write(ClipArchive.FOOTER.pack(index_offset, len(index), ClipArchive.FOOTER_MAGIC))
+        self.file.close()
+
+
+class ClipSegmentWriter:
+    """ Buffer the frames of one clip as JPEG images, a stand-in for cv2.VideoWriter when packing clips."""
+
+    def __init__(self, quality=95):
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        self.frames = []
+
+    def write(self, frame):
+        ret, encoded = cv2.imencode('.jpg', frame, self.params)
+        if ret:
+            self.frames.append(encoded.tobytes())
+
+    def release(self):
+        pass
+
+
+def open_capture(path):
+    """ Open a clip either from a video file or from inside a clip archive, returns a cv2.VideoCapture like object."""
+    archive_path, clip_name = ClipArchive.split_path(path)
+    if archive_path is None:
+        return cv2.VideoCapture(path)
+    return ClipArchive.open(archive_path).open_clip(clip_name)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the clips of a packed clip archive as AVI files')
+    parser.add_argument('archive', help='path of the .clips archive')
+    parser.add_argument('out_dir', help='directory to write the AVI files to')
+    parser.add_argument('--clips', nargs='*', default=None, help='names of the clips to export, all by default')
+    args = parser.parse_args()
+    exported = ClipArchive.open(args.archive).export(args.out_dir, args.clips)
+    print(f'[INFO] exported {len(exported)} clips to {args.out_dir}')
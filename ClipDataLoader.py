@@ -0,0 +1,251 @@
+import collections
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+import pandas as pd
+from ClipArchive import ClipArchive, open_capture
+from ClipManifest import ClipManifest
+
+
+class ClipDataset:
+    """ The labeled clips of a Labeler folder, for training models.
+    Clips are listed like the Movie Player lists them (including clips packed in clip archives) and joined to the
+    folder's log by clip name, so every item has the labels given in the Labeler (the reviewer_label column) or in
+    the Uncurated Labeler (one 0/1 column per label). Clips that are not in the log are left out.
+    Each clip is decoded to a fixed size (clip_length x size x size) grayscale uint8 array: longer clips are cut,
+    shorter clips are zero padded."""
+
+    def __init__(self, folder, log_filename='log.csv', label_column='reviewer_label', labels=None,
+                 clip_length=200, size=None, frame_step=1, ignore='Swimming_vids'):
+        """ Initialize a dataset. inputs:
+        folder - the clip folder, as loaded in the Labeler
+        log_filename - name of the log file, e.g. 'log.csv' or 'labeled_preds.csv' for the Uncurated Labeler
+        label_column - the label column, or a list of 0/1 label columns (multichoice labels)
+        labels - optional, only keep clips with one of these labels. For multichoice labels, keep clips that have at
+                 least one of these label columns set
+        clip_length - number of frames per item
+        size - optional, resize the frames to size x size, the clips are kept at their size by default
+        frame_step - keep every frame_step-th frame
+        ignore - name of sub-folders to skip, as in the Movie Player"""
+        self.folder = folder
+        self.label_column = label_column
+        self.clip_length = clip_length
+        self.size = size
+        self.frame_step = frame_step
+        # Listed without frame counts, so the manifest is only refreshed in memory - saving it would leave the
+        # Labeler with clips it never counts:
+        manifest = ClipManifest(folder, extension=('.avi', ClipArchive.EXTENSION), ignore=ignore,
+                                log_filename=log_filename, count_frames=False).refresh()
+        paths = []
+        for path in manifest.clip_paths():
+            if path.endswith(ClipArchive.EXTENSION):
+                paths.extend(ClipArchive.open(path).clip_paths())
+            else:
+                paths.append(path)
+        if not manifest.log_paths():
+            raise ValueError(f'No {log_filename} found in {folder}')
+        log = pd.concat([pd.read_csv(path) for path in manifest.log_paths()], ignore_index=True)
+        log = log.rename(columns={'movie_name': 'clip_name'}).drop_duplicates('clip_name')
+        clips = pd.DataFrame({'path': paths, 'clip_name': [os.path.basename(path) for path in paths]})
+        self.metadata = clips.merge(log, on='clip_name', how='inner')
+        if labels is not None:
+            if isinstance(label_column, str):
+                keep = self.metadata[label_column].isin(labels)
+            else:
+                keep = (self.metadata[[column for column in label_column if column in labels]] == 1).any(axis=1)
+            self.metadata = self.metadata[keep]
+        self.metadata = self.metadata.reset_index(drop=True)
+        self.paths = self.metadata['path'].tolist()
+        self.frame_shape = self._frame_shape()
+
+    def _frame_shape(self):
+        if self.size is not None:
+            return self.size, self.size
+        if not self.paths:
+            return 0, 0
+        cap = open_capture(self.paths[0])
+        shape = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        cap.release()
+        return shape
+
+    @property
+    def item_shape(self):
+        return (self.clip_length,) + self.frame_shape
+
+    def __len__(self):
+        return len(self.paths)
+
+    def labels(self, indices=None):
+        """ Get the labels of the items, a 1D array for a single label column or a (N, labels) array for 0/1 label
+        columns."""
+        values = self.metadata[self.label_column].values
+        return values if indices is None else values[indices]
+
+    def __getitem__(self, idx):
+        """ Decode an item, returns the clip array and its label."""
+        clip = np.zeros(self.item_shape, dtype='uint8')
+        decode_clip(self.paths[idx], clip, self.size, self.frame_step)
+        return clip, self.labels([idx])[0]
+
+
+def decode_clip(path, out, size=None, frame_step=1):
+    """ Decode a clip into out, a (T, H, W) uint8 array, frames are converted to grayscale and resized to
+    size x size if size is given. Returns the number of frames decoded, the rest of out is left as is."""
+    cap = open_capture(path)
+    count = 0
+    frame_idx = 0
+    while count < len(out):
+        if frame_idx % frame_step:
+            if not cap.grab():
+                break
+        else:
+            grabbed, frame = cap.read()
+            if not grabbed:
+                break
+            if frame.ndim == 3:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            if size is not None:
+                cv2.resize(frame, (size, size), dst=out[count], interpolation=cv2.INTER_AREA)
+            else:
+                height, width = min(frame.shape[0], out.shape[1]), min(frame.shape[1], out.shape[2])
+                out[count, :height, :width] = frame[:height, :width]
+            count += 1
+        frame_idx += 1
+    cap.release()
+    return count
+
+
+def _attach(name):
+    """ Attach to a shared memory block created by the loader process."""
+    try:
+        # The loader owns the block, the worker shouldn't track it (Python 3.13+):
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _decode_batch(paths, shm_name, batch_shape, size, frame_step):
+    """ Worker process task, decode a batch of clips into a shared memory batch slot.
+    Returns the number of frames decoded for every clip."""
+    shm = _attach(shm_name)
+    try:
+        batch = np.ndarray(batch_shape, dtype='uint8', buffer=shm.buf)
+        batch[len(paths):] = 0
+        lengths = []
+        for i, path in enumerate(paths):
+            lengths.append(decode_clip(path, batch[i], size, frame_step))
+            batch[i, lengths[-1]:] = 0  # zero pad short clips
+        del batch  # release the buffer before closing the block
+        return lengths
+    finally:
+        shm.close()
+
+
+class ClipDataLoader:
+    """ Iterate over a ClipDataset in shuffled batches of NumPy arrays.
+    Batches are decoded by a pool of worker processes, each worker decodes a whole batch straight into a shared
+    memory batch slot, so the decoded frames are never pickled between processes. Up to prefetch_batches batches
+    are decoded ahead of the batch being consumed.
+    Every iteration over the loader is one epoch, with a new shuffle. The achieved clips per second are tracked.
+    Use the loader as a context manager, or call close, to free the worker processes and the shared memory."""
+
+    def __init__(self, dataset, batch_size=16, shuffle=True, num_workers=4, prefetch_batches=4, drop_last=False,
+                 copy=True, seed=None):
+        """ Initialize a loader. inputs:
+        dataset - a ClipDataset
+        batch_size - number of clips per batch
+        shuffle - shuffle the clips every epoch
+        num_workers - number of decoding processes
+        prefetch_batches - number of batches decoded ahead, at least num_workers to keep all workers busy
+        drop_last - drop the last batch of an epoch if it is smaller than batch_size
+        copy - if False, batches are views of the shared memory slots that are only valid until the next batch
+        seed - optional, seed of the shuffle"""
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.copy = copy
+        self.prefetch_batches = max(prefetch_batches, 1)
+        self.rng = np.random.default_rng(seed)
+        self.batch_shape = (batch_size,) + dataset.item_shape
+        # One slot per batch in flight plus the one being consumed:
+        num_slots = self.prefetch_batches + 1
+        self.slots = [shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(self.batch_shape))))
+                      for _ in range(num_slots)]
+        self.executor = ProcessPoolExecutor(max_workers=num_workers)
+        self.clips_loaded = 0
+        self.load_time = 0.0
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.dataset) // self.batch_size
+        return -(-len(self.dataset) // self.batch_size)
+
+    def _batches(self):
+        order = self.rng.permutation(len(self.dataset)) if self.shuffle else np.arange(len(self.dataset))
+        for start in range(0, len(order), self.batch_size):
+            indices = order[start:start + self.batch_size]
+            if self.drop_last and len(indices) < self.batch_size:
+                return
+            yield indices
+
+    def _submit(self, indices, slot):
+        paths = [self.dataset.paths[i] for i in indices]
+        return self.executor.submit(_decode_batch, paths, self.slots[slot].name, self.batch_shape,
+                                    self.dataset.size, self.dataset.frame_step)
+
+    def __iter__(self):
+        """ Yield (clips, labels, lengths) batches: clips is a (B, T, H, W) uint8 array, labels are the dataset
+        labels of the clips and lengths the number of frames decoded for every clip."""
+        batches = self._batches()
+        in_flight = collections.deque()  # (indices, slot, future)
+        free_slots = collections.deque(range(len(self.slots)))
+        start = time.perf_counter()
+        try:
+            while True:
+                # Keep prefetch_batches batches decoding, the slot of the batch being consumed is not free:
+                while len(in_flight) < self.prefetch_batches and free_slots:
+                    indices = next(batches, None)
+                    if indices is None:
+                        break
+                    slot = free_slots.popleft()
+                    in_flight.append((indices, slot, self._submit(indices, slot)))
+                if not in_flight:
+                    return
+                indices, slot, future = in_flight.popleft()
+                lengths = np.array(future.result())
+                clips = np.ndarray(self.batch_shape, dtype='uint8', buffer=self.slots[slot].buf)[:len(indices)]
+                if self.copy:
+                    clips = clips.copy()
+                self.clips_loaded += len(indices)
+                self.load_time = time.perf_counter() - start
+                yield clips, self.dataset.labels(indices), lengths
+                del clips
+                free_slots.append(slot)
+        finally:
+            for _, _, future in in_flight:
+                future.cancel()
+            for _, _, future in in_flight:
+                if not future.cancelled():
+                    future.exception()  # wait for workers still writing into the slots
+
+    @property
+    def clips_per_second(self):
+        return self.clips_loaded / self.load_time if self.load_time > 0 else 0.0
+
+    def close(self):
+        """ Stop the worker processes and free the shared memory."""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        for slot in self.slots:
+            slot.close()
+            slot.unlink()
+        self.slots = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
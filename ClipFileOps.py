@@ -0,0 +1,58 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ClipFileOps:
+    """ Bulk file operations on clip files, used by the Labeler to delete and move reviewed clips.
+    The operations run on a thread pool (file system calls release the GIL), and failures are collected per file
+    instead of stopping the whole batch. Operations are given as a dictionary keyed by the log row of each clip,
+    and failures are returned keyed the same way so the caller can update the matching log rows."""
+    MAX_WORKERS = 8
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max_workers
+
+    def run(self, operation, arguments):
+        """ Apply an operation to every value in the arguments dictionary. inputs:
+        operation - a function called with the unpacked argument tuple of each key
+        arguments - key -> tuple of arguments
+        Returns a dictionary key -> error message for the operations that failed."""
+        if not arguments:
+            return {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {key: executor.submit(operation, *args) for key, args in arguments.items()}
+        failures = {}
+        for key, future in futures.items():
+            error = future.exception()
+            if error is not None:
+                failures[key] = f'{type(error).__name__}: {error}'
+        return failures
+
+    def remove(self, paths):
+        """ Delete files, paths is a key -> file path dictionary. Returns the failures, see the run method."""
+        return self.run(os.remove, {key: (path,) for key, path in paths.items()})
+
+    def move(self, moves):
+        """ Move files, moves is a key -> (source path, destination path) dictionary.
+        Returns the failures, see the run method."""
+        return self.run(os.rename, moves)
+
+    @staticmethod
+    def write_csvs(dataframes):
+        """ Save several DataFrames to csv files together, dataframes is a file path -> DataFrame dictionary.
+        All files are first written to temporary files in their target directories, and only once every file was
+        written successfully they replace the original files, so a failed write leaves all the files unchanged."""
+        temp_paths = {}
+        try:
+            for filepath, dataframe in dataframes.items():
+                handle, temp_path = tempfile.mkstemp(suffix='.csv.tmp', dir=os.path.dirname(filepath) or '.')
+                os.close(handle)
+                temp_paths[filepath] = temp_path
+                dataframe.to_csv(temp_path, index=False)
+        except BaseException:
+            for temp_path in temp_paths.values():
+                os.remove(temp_path)
+            raise
+        for filepath, temp_path in temp_paths.items():
+            os.replace(temp_path, filepath)
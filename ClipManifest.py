@@ -0,0 +1,146 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+
+
+class ClipManifest:
+    """ A cached listing of the clips in a directory tree, saved as a json file in the top directory, so reopening
+    a huge clip folder doesn't have to walk the whole tree again.
+    For every directory the manifest keeps its modification time, the clips in it (name, size, modification time
+    and frame count), the log files in it and its sub-directories. When the manifest is refreshed, directories
+    whose modification time hasn't changed are taken from the manifest without listing them, so an unchanged
+    folder only costs one stat call per directory. Changed directories are listed again with os.scandir, and only
+    clips that weren't in the manifest before are stat-ed and opened to count their frames. Clip files are
+    assumed not to change once written - the Movie Cutter writes each clip once.
+    Directories named as the ignore folder are skipped along with everything below them.
+    The manifest is only a cache, if it is missing or unreadable the tree is scanned from scratch."""
+    FILENAME = '.clip_manifest.json'
+    VERSION = 2
+    MAX_WORKERS = 8  # threads used to count the frames of new clips
+
+    def __init__(self, root, extension='.avi', ignore=None, log_filename=None, count_frames=True):
+        """ Initialize a manifest. inputs:
+        root - the top directory of the clips
+        extension - file extension of the clips, or a tuple of extensions
+        ignore - optional, name of directories to skip
+        log_filename - optional, name of the log files to list
+        count_frames - if True, new clips are opened to read their frame count"""
+        self.root = root
+        self.path = os.path.join(root, self.FILENAME)
+        self.extension = [extension] if isinstance(extension, str) else list(extension)
+        self.ignore = ignore
+        self.log_filename = log_filename
+        self.count_frames = count_frames
+        self.directories = {}  # relative directory path -> directory entry, in os.walk (top-down) order
+        self.changed = False
+        self.dirs_scanned = 0
+        self.dirs_reused = 0
+        self.load()
+
+    def load(self):
+        """ Read the manifest file, a manifest with different settings is discarded."""
+        try:
+            with open(self.path) as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return
+        settings = (self.VERSION, self.extension, self.ignore, self.log_filename)
+        if (manifest.get('version'), manifest.get('extension'), manifest.get('ignore'),
+                manifest.get('log_filename')) == settings:
+            self.directories = manifest.get('directories', {})
+
+    def save(self):
+        """ Write the manifest file if anything changed. The file is rewritten in place so saving it doesn't change
+        the modification time of the top directory. Returns False if the file couldn't be written."""
+        if not self.changed:
+            return True
+        manifest = {'version': self.VERSION, 'extension': self.extension, 'ignore': self.ignore,
+                    'log_filename': self.log_filename, 'directories': self.directories}
+        try:
+            with open(self.path, 'w') as file:
+                json.dump(manifest, file)
+        except OSError as error:
+            print(f'Could not save the clip manifest: {error}')
+            return False
+        self.changed = False
+        return True
+
+    def refresh(self):
+        """ Bring the manifest up to date with the directory tree."""
+        old_directories = self.directories
+        self.directories = {}
+        new_clips = []
+        self._refresh_dir('', old_directories, new_clips)
+        if set(old_directories) != set(self.directories):
+            self.changed = True
+        if new_clips and self.count_frames:
+            # Opening clips is slow on network drives, read their headers in parallel:
+            with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
+                counts = executor.map(self._frame_count, [os.path.join(self.root, rel_dir, clip[0])
+                                                          for rel_dir, clip in new_clips])
+                for (rel_dir, clip), count in zip(new_clips, counts):
+                    clip[3] = count
+        return self
+
+    def _refresh_dir(self, rel_dir, old_directories, new_clips):
+        """ Refresh the entry of one directory and then of its sub-directories, depth first like os.walk."""
+        path = os.path.join(self.root, rel_dir)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return
+        old_entry = old_directories.get(rel_dir)
+        if old_entry is not None and old_entry['mtime'] == mtime:
+            entry = old_entry
+            self.dirs_reused += 1
+        else:
+            entry = self._scan_dir(path, mtime, old_entry, rel_dir, new_clips)
+            self.dirs_scanned += 1
+            self.changed = True
+        self.directories[rel_dir] = entry
+        for name in entry['subdirs']:
+            self._refresh_dir(os.path.join(rel_dir, name), old_directories, new_clips)
+
+    def _scan_dir(self, path, mtime, old_entry, rel_dir, new_clips):
+        """ List a directory, clips that were already in the manifest keep their entries."""
+        old_clips = {clip[0]: clip for clip in old_entry['clips']} if old_entry else {}
+        entry = {'mtime': mtime, 'clips': [], 'logs': [], 'subdirs': []}
+        with os.scandir(path) as entries:
+            for dir_entry in entries:
+                name = dir_entry.name
+                if dir_entry.is_dir():
+                    if name != self.ignore:
+                        entry['subdirs'].append(name)
+                elif name.endswith(tuple(self.extension)):
+                    clip = old_clips.get(name)
+                    if clip is None:
+                        stat = dir_entry.stat()
+                        clip = [name, stat.st_size, stat.st_mtime_ns, None]
+                        new_clips.append((rel_dir, clip))
+                    entry['clips'].append(clip)
+                elif name == self.log_filename:
+                    entry['logs'].append(name)
+        return entry
+
+    @staticmethod
+    def _frame_count(path):
+        cap = cv2.VideoCapture(path)
+        count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else None
+        cap.release()
+        return count
+
+    def clip_paths(self):
+        """ Get the full paths of all the clips, in os.walk order."""
+        return [os.path.join(self.root, rel_dir, clip[0])
+                for rel_dir, entry in self.directories.items() for clip in entry['clips']]
+
+    def log_paths(self):
+        """ Get the full paths of all the log files, in os.walk order."""
+        return [os.path.join(self.root, rel_dir, name)
+                for rel_dir, entry in self.directories.items() for name in entry['logs']]
+
+    def clip_info(self):
+        """ Get a full path -> (size, modification time in ns, frame count) dictionary of all the clips."""
+        return {os.path.join(self.root, rel_dir, clip[0]): tuple(clip[1:])
+                for rel_dir, entry in self.directories.items() for clip in entry['clips']}
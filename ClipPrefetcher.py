@@ -0,0 +1,103 @@
+import time
+import cv2
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from DecodedClip import DecodedClip
+
+
+class ClipPrefetcher:
+    """ Decode the clips around the current clip in the background, so moving to the next or previous clip in
+    the Movie Player doesn't wait on the disk and the decoder.
+    Clips are decoded into DecodedClip objects by a small thread pool (OpenCV releases the GIL while decoding).
+    Decoded clips are kept in a least recently used cache that is trimmed to a memory budget, clips that are not
+    around the current clip are evicted first. The hit rate and the time spent waiting for clips are tracked."""
+
+    def __init__(self, neighbours=2, memory_budget_mb=1024, window_frames=None, max_workers=2):
+        """ Initialize a prefetcher. inputs:
+        neighbours - number of clips to prefetch on each side of the current clip
+        memory_budget_mb - maximal memory used by decoded clips, in megabytes
+        window_frames - optional, clips longer than this only keep a window of window_frames frames in memory
+        max_workers - number of decoding threads"""
+        self.neighbours = neighbours
+        self.memory_budget = memory_budget_mb * 2 ** 20
+        self.window_frames = window_frames
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.cache = OrderedDict()  # clip path -> future of a DecodedClip, least recently used first
+        self.requests = 0
+        self.hits = 0
+        self.wait_time = 0.0  # total time spent waiting for clips, in seconds
+
+    def _submit(self, path):
+        return self.executor.submit(DecodedClip, path, self.window_frames)
+
+    def get(self, path):
+        """ Get a decoded clip, rewound to its first frame. Waits for the clip if it is still being decoded,
+        or decodes it right away if it wasn't prefetched. Raises the decoding error of a clip that can't be decoded,
+        such clips are not cached so they are decoded again the next time they are requested."""
+        self.requests += 1
+        future = self.cache.pop(path, None)
+        if future is None or future.cancelled() or (future.done() and future.exception() is not None):
+            future = self._submit(path)
+        elif future.done():
+            self.hits += 1
+        start = time.perf_counter()
+        try:
+            clip = future.result()
+        finally:
+            self.wait_time += time.perf_counter() - start
+        self.cache[path] = future  # mark as most recently used
+        clip.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        return clip
+
+    def prefetch_neighbours(self, file_paths, idx):
+        """ Start decoding the clips around index idx in file_paths, nearest clips first."""
+        wanted = [file_paths[idx]]
+        for offset in range(1, self.neighbours + 1):
+            for neighbour in (idx + offset, idx - offset):
+                if 0 <= neighbour < len(file_paths):
+                    wanted.append(file_paths[neighbour])
+        for path in wanted:
+            if path not in self.cache or self.cache[path].cancelled():
+                self.cache[path] = self._submit(path)
+        self.evict(keep=set(wanted))
+
+    def evict(self, keep=()):
+        """ Drop clips that are not in keep, least recently used first, until the cache fits the memory budget.
+        Clips that are not in keep and haven't started decoding are cancelled."""
+        for path, future in list(self.cache.items()):
+            if path not in keep and not future.done() and future.cancel():
+                del self.cache[path]
+        total = self.cached_bytes()
+        for path, future in list(self.cache.items()):
+            if total <= self.memory_budget:
+                break
+            if path not in keep and future.done():
+                total -= self._nbytes(future)
+                del self.cache[path]
+
+    @staticmethod
+    def _nbytes(future):
+        if future.cancelled() or future.exception() is not None:
+            return 0
+        return future.result().nbytes
+
+    def cached_bytes(self):
+        """ Memory used by the clips that finished decoding."""
+        return sum(self._nbytes(future) for future in self.cache.values() if future.done())
+
+    def stats(self):
+        """ Get the cache hit rate and the average time spent waiting for a clip."""
+        return {'requests': self.requests, 'hit_rate': self.hits / self.requests if self.requests else 0.0,
+                'mean_wait_ms': 1000 * self.wait_time / self.requests if self.requests else 0.0,
+                'cached_mb': self.cached_bytes() / 2 ** 20}
+
+    def report(self):
+        """ Get a short text summary of the cache stats."""
+        stats = self.stats()
+        return f'cache {stats["hit_rate"]:.0%} hits, {stats["mean_wait_ms"]:.0f} ms wait, ' \
+               f'{stats["cached_mb"]:.0f} MB'
+
+    def shutdown(self):
+        """ Stop decoding, clips that haven't started decoding are cancelled."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.cache.clear()
@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+import cv2
+import numpy as np
+import pandas as pd
+from ClipArchive import ClipArchive, open_capture
+
+
+class ClipTensorWriter:
+    """ Write cut clips into a memory-mappable (N, T, H, W) uint8 array for training, so training loaders can read
+    batches of clips by index without decoding videos. See ClipTensorDataset for reading them back.
+    The export is made of these files in the output directory, for an export named 'clips':
+        clips.uint8 - the raw array, clip n frame t starts at byte (n * T + t) * H * W
+        clips_[size].uint8 - optional downscaled copies, (N, T, size, size) each
+        clips.json - shape of the arrays, the downscaled sizes and the frame rate
+        clips_meta.csv - one row per clip: its index in the arrays, its name, number of frames and its log columns
+                         (parent video, frame, coordinates, labels...)
+    Every clip gets a slot of T frames, clips shorter than T are zero padded, their length is in the metadata.
+    Frames are written straight to their place in the file, so clips can be written in parallel while a video is
+    being cut. Slots of discarded clips are reused by the next clip, so the metadata clip_index column and not the
+    row number is the index into the arrays."""
+
+    def __init__(self, out_dir, clip_length, frame_size, sizes=(), name='clips', fps=30):
+        """ Create an export. inputs:
+        out_dir - directory to write the export files to
+        clip_length - T, the maximal number of frames of a clip
+        frame_size - (height, width) of the clip frames
+        sizes - optional, sizes of square downscaled copies to write along with the full size clips
+        name - prefix of the export files
+        fps - frame rate of the clips, saved in the export description"""
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.name = name
+        self.clip_length = clip_length
+        self.frame_size = tuple(frame_size)
+        self.sizes = list(sizes)
+        self.fps = fps
+        self.files = {None: open(os.path.join(out_dir, f'{name}.uint8'), 'wb+')}  # size -> array file
+        for size in self.sizes:
+            self.files[size] = open(os.path.join(out_dir, f'{name}_{size}.uint8'), 'wb+')
+        self.num_slots = 0
+        self.free_slots = []
+        self.open_clips = {}  # slot -> [clip name, number of frames written]
+        self.clips = []  # (slot, clip name, number of frames) of the finished clips
+
+    def _frame_shape(self, size):
+        return self.frame_size if size is None else (size, size)
+
+    def new_clip(self, clip_name):
+        """ Start a new clip, returns its slot."""
+        slot = self.free_slots.pop() if self.free_slots else self.num_slots
+        self.num_slots = max(self.num_slots, slot + 1)
+        self.open_clips[slot] = [clip_name, 0]
+        return slot
+
+    def write_frame(self, slot, frame):
+        """ Write the next frame of a clip, frames beyond the clip length are ignored."""
+        clip = self.open_clips[slot]
+        if clip[1] >= self.clip_length:
+            return
+        for size, file in self.files.items():
+            data = frame if size is None else cv2.resize(frame, (size, size), interpolation=cv2.INTER_AREA)
+            self._write(file, size, slot, clip[1], np.ascontiguousarray(data))
+        clip[1] += 1
+
+    def _write(self, file, size, slot, t, data):
+        height, width = self._frame_shape(size)
+        file.seek((slot * self.clip_length + t) * height * width)
+        file.write(data.data)
+
+    def finish_clip(self, slot):
+        """ Finish a clip, the rest of its slot is zero padded."""
+        clip_name, num_frames = self.open_clips.pop(slot)
+        for size, file in self.files.items():
+            height, width = self._frame_shape(size)
+            if num_frames < self.clip_length:
+                file.seek((slot * self.clip_length + num_frames) * height * width)
+                file.write(bytes((self.clip_length - num_frames) * height * width))
+        self.clips.append((slot, clip_name, num_frames))
+
+    def discard_clip(self, slot):
+        """ Drop a clip, its slot will be reused."""
+        self.open_clips.pop(slot)
+        self.free_slots.append(slot)
+
+    def close(self, log=None):
+        """ Finish the clips that are still open, and write the export description and the metadata table.
+        inputs:
+        log - optional, a clip log DataFrame with a clip_name column, its columns are added to the metadata"""
+        for slot in list(self.open_clips):
+            self.finish_clip(slot)
+        for size, file in self.files.items():
+            # Make sure the file covers all the slots, unused slots read as zeros:
+            height, width = self._frame_shape(size)
+            file.truncate(self.num_slots * self.clip_length * height * width)
+            file.close()
+        description = {'shape': [self.num_slots, self.clip_length, *self.frame_size], 'dtype': 'uint8',
+                       'sizes': self.sizes, 'fps': self.fps}
+        with open(os.path.join(self.out_dir, f'{self.name}.json'), 'w') as file:
+            json.dump(description, file)
+        metadata = pd.DataFrame(sorted(self.clips), columns=['clip_index', 'clip_name', 'num_frames'])
+        if log is not None and 'clip_name' in log.columns:
+            log = log.drop_duplicates('clip_name').drop(columns=['num_frames', 'clip_index'], errors='ignore')
+            metadata = metadata.merge(log, on='clip_name', how='left')
+        metadata.to_csv(os.path.join(self.out_dir, f'{self.name}_meta.csv'), index=False)
+        return metadata
+
+
+class ClipTensorDataset:
+    """ Read a clip export written by ClipTensorWriter. The clips are memory mapped, reading a clip or a batch of
+    clips only reads their bytes from disk, with no decoding. Items are in metadata row order."""
+
+    def __init__(self, out_dir, name='clips', size=None):
+        """ Open an export. inputs:
+        out_dir - the export directory
+        name - prefix of the export files
+        size - optional, read one of the downscaled copies instead of the full size clips"""
+        with open(os.path.join(out_dir, f'{name}.json')) as file:
+            self.description = json.load(file)
+        num_clips, clip_length, height, width = self.description['shape']
+        if size is not None:
+            if size not in self.description['sizes']:
+                raise ValueError(f'No {size}x{size} copy in the export, available sizes: '
+                                 f'{self.description["sizes"]}')
+            height = width = size
+        filename = f'{name}.uint8' if size is None else f'{name}_{size}.uint8'
+        self.clips = np.memmap(os.path.join(out_dir, filename), dtype=self.description['dtype'], mode='r',
+                               shape=(num_clips, clip_length, height, width))
+        self.metadata = pd.read_csv(os.path.join(out_dir, f'{name}_meta.csv'))
+        self.clip_index = self.metadata['clip_index'].values
+        self.num_frames = self.metadata['num_frames'].values
+
+    def __len__(self):
+        return len(self.metadata)
+
+    def __getitem__(self, idx):
+        """ Get the frames of a clip (a read only view of the memory map, trimmed to the clip's length) and its
+        metadata row."""
+        return self.clips[self.clip_index[idx], :self.num_frames[idx]], self.metadata.iloc[idx]
+
+    def get_batch(self, indices):
+        """ Get a batch of clips as one (B, T, H, W) array (zero padded clips) and their metadata rows."""
+        indices = np.asarray(indices)
+        slots = self.clip_index[indices]
+        order = np.argsort(slots)  # read the clips in file order
+        batch = np.empty((len(indices),) + self.clips.shape[1:], dtype=self.clips.dtype)
+        batch[order] = self.clips[slots[order]]
+        return batch, self.metadata.iloc[indices]
+
+    def labels(self, column='reviewer_label'):
+        return self.metadata[column].values
+
+
+def list_clips(folder):
+    """ List the clips saved in a folder, as separate video files or in clip archives, by name."""
+    paths = []
+    for filename in sorted(os.listdir(folder)):
+        path = os.path.join(folder, filename)
+        if filename.endswith('.avi'):
+            paths.append(path)
+        elif filename.endswith(ClipArchive.EXTENSION):
+            paths.extend(ClipArchive.open(path).clip_paths())
+    return paths
+
+
+def convert_folder(folder, out_dir, sizes=(), name='clips', clip_length=None, log_filename='log.csv'):
+    """ Export the clips of an existing Movie Cutter folder. inputs:
+    folder - the folder of the clips and their log file
+    out_dir - directory to write the export to
+    sizes - optional, sizes of square downscaled copies
+    name - prefix of the export files
+    clip_length - optional, maximal number of frames per clip, the longest clip length by default
+    log_filename - name of the clip log in the folder, its columns are added to the metadata"""
+    paths = list_clips(folder)
+    if not paths:
+        raise ValueError(f'No clips found in {folder}')
+    # Read the clip lengths and the frame size from the headers:
+    cap = open_capture(paths[0])
+    frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    cap.release()
+    if clip_length is None:
+        clip_length = 0
+        for path in paths:
+            cap = open_capture(path)
+            clip_length = max(clip_length, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+            cap.release()
+    writer = ClipTensorWriter(out_dir, clip_length, frame_size, sizes=sizes, name=name, fps=fps)
+    for path in paths:
+        cap = open_capture(path)
+        slot = writer.new_clip(os.path.basename(path))
+        for _ in range(clip_length):
+            grabbed, frame = cap.read()
+            if not grabbed:
+                break
+            if frame.ndim == 3:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            writer.write_frame(slot, frame)
+        cap.release()
+        writer.finish_clip(slot)
+    log = None
+    log_path = os.path.join(folder, log_filename)
+    if os.path.isfile(log_path):
+        log = pd.read_csv(log_path).rename(columns={'movie_name': 'clip_name'})
+        if 'reviewer_label' not in log.columns:
+            # Logs that weren't opened in the Labeler yet use the old column name:
+            log = log.rename(columns={'label': 'reviewer_label'})
+    return writer.close(log)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the clips of a Movie Cutter folder to a memory-mapped '
+                                                 'uint8 array for training')
+    parser.add_argument('folder', help='folder of the clips and their log.csv file')
+    parser.add_argument('out_dir', help='directory to write the export to')
+    parser.add_argument('--sizes', type=int, nargs='*', default=[], help='sizes of downscaled copies, e.g. 112')
+    parser.add_argument('--name', default='clips', help='prefix of the export files')
+    parser.add_argument('--clip_length', type=int, default=None, help='maximal number of frames per clip')
+    args = parser.parse_args()
+    metadata = convert_folder(args.folder, args.out_dir, args.sizes, args.name, args.clip_length)
+    print(f'[INFO] exported {len(metadata)} clips to {args.out_dir}')
@@ -0,0 +1,67 @@
+import cv2
+import numpy as np
+
+
+def compute_bounds(centers, padding, frame_size):
+    """ Get the bounds of fixed size (padding*2 x padding*2) windows around many centers at once.
+    A window that would go out of the frame is pushed back inside it, so the center isn't in the middle of the
+    window but every window has the full size (unless the frame itself is smaller than the window). inputs:
+    centers - (N, 2) array like of (x, y) centers
+    padding - half the window size
+    frame_size - (width, height) of the frame
+    Returns four (N,) int arrays: x1, x2, y1, y2, the window is frame[y1:y2, x1:x2]."""
+    centers = np.asarray(centers, dtype='int64').reshape(-1, 2)
+    size = np.asarray(frame_size, dtype='int64')
+    low = np.maximum(centers - padding, 0)
+    high = low + 2 * padding
+    # Push windows that overshoot the far edge back, but not past the near edge:
+    overshoot = np.maximum(high - size, 0)
+    low = np.maximum(low - overshoot, 0)
+    high = np.minimum(high - overshoot, size)
+    return low[:, 0], high[:, 0], low[:, 1], high[:, 1]
+
+
+class CropEngine:
+    """ Cut the segment crops of all the fish followed in a frame in one call, into a reused (N, size, size) buffer.
+    Crops are padded with zeros where the window is cut by the frame edges, and brightened (if requested) with a
+    single pass over all the crops of the frame."""
+
+    def __init__(self, padding, frame_size, brighten=0, apply_brightness=False):
+        """ Initialize a crop engine. inputs:
+        padding - half the crop size
+        frame_size - (width, height) of the frames
+        brighten - brightness added to the crops if apply_brightness is True
+        apply_brightness - brighten the crops"""
+        self.padding = padding
+        self.frame_size = tuple(frame_size)
+        self.brighten = brighten
+        self.apply_brightness = apply_brightness
+        self.crops = np.zeros((0, 2 * padding, 2 * padding), dtype='uint8')
+
+    def bounds(self, centers):
+        """ Get the crop windows of (x, y) centers, see compute_bounds."""
+        return compute_bounds(centers, self.padding, self.frame_size)
+
+    def crop(self, frame, x1, x2, y1, y2):
+        """ Cut the windows frame[y1:y2, x1:x2] into the crop buffer. Returns a (N, size, size) view of the buffer,
+        which is overwritten by the next call."""
+        num_crops = len(x1)
+        if len(self.crops) < num_crops:
+            # Grow the buffer, with room for more fish so it isn't reallocated every time one more is found:
+            self.crops = np.zeros((max(num_crops, 2 * len(self.crops)),) + self.crops.shape[1:], dtype='uint8')
+        crops = self.crops[:num_crops]
+        size = 2 * self.padding
+        padded = []  # crops smaller than the window, their padding has to stay black
+        for i in range(num_crops):
+            cutout = frame[y1[i]:y2[i], x1[i]:x2[i]]
+            crops[i, :cutout.shape[0], :cutout.shape[1]] = cutout
+            if cutout.shape != (size, size):
+                padded.append((i, cutout.shape))
+        if self.apply_brightness and num_crops:
+            # One pass over all the crops of the frame:
+            flat = crops.reshape(num_crops * size, size)
+            cv2.convertScaleAbs(flat, dst=flat, alpha=1, beta=self.brighten)
+        for i, (height, width) in padded:
+            crops[i, height:] = 0
+            crops[i, :height, width:] = 0
+        return crops
@@ -0,0 +1,153 @@
+import cv2
+import numpy as np
+from ClipArchive import open_capture
+
+
+class DecodedClip:
+    """ A video clip decoded into memory as one contiguous (frames x height x width) uint8 grayscale array.
+    It can be used in place of a cv2.VideoCapture object by the Movie Player - it supports read, get, set,
+    isOpened and release for the frame position, frame rate, frame count and frame size properties.
+    Once decoded, stepping, seeking, looping and playing the clip backwards only index the array, with no I/O.
+    Clips longer than window_frames are not decoded whole, instead the array is used as a ring buffer holding a
+    window of consecutive frames: reading forward decodes the next frame into the slot of the oldest one, and
+    seeking outside the window refills it from disk."""
+
+    def __init__(self, path, window_frames=None):
+        """ Decode a clip. inputs:
+        path - path of the video file, or virtual path of a clip in a clip archive
+        window_frames - optional, maximal number of frames held in memory for long clips"""
+        self.path = path
+        self.pos = 0  # index of the next frame to read
+        self._cap = open_capture(path)  # a video file or a clip inside a clip archive
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS)
+        self.num_frames = int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.windowed = window_frames is not None and self.num_frames > window_frames
+        num_slots = window_frames if self.windowed else self.num_frames
+        self.frames = None  # the decoded frames, or a ring buffer of num_slots frames if the clip is windowed
+        self.num_slots = num_slots
+        self.first = 0  # index of the first frame in memory
+        self.last = 0  # index after the last frame in memory
+        self._decode_range(0, num_slots)
+        if not self.windowed:
+            if self.last < self.num_frames:
+                # The frame count in the file header was off, trust the frames we could read:
+                self.num_frames = self.last
+            self._cap.release()
+            self._cap = None
+
+    def _decode_range(self, start, stop):
+        """ Decode frames start to stop-1 into their slots, replacing the frames in memory."""
+        if int(self._cap.get(cv2.CAP_PROP_POS_FRAMES)) != start:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        self.first = self.last = start
+        while self.last < stop:
+            if not self._decode_next():
+                break
+
+    def _decode_next(self):
+        """ Decode the frame after the last frame in memory into its slot, dropping the first frame if the
+        window is full."""
+        grabbed, frame = self._cap.read()
+        if not grabbed:
+            return False
+        if self.frames is None:
+            # Allocate the whole buffer once we know the frame size:
+            self.frames = np.empty((max(self.num_slots, 1),) + frame.shape[:2], dtype='uint8')
+        slot = self.frames[self.last % self.num_slots]
+        if frame.ndim == 3:
+            cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=slot)
+        else:
+            slot[:] = frame
+        self.last += 1
+        self.first = max(self.first, self.last - self.num_slots)
+        return True
+
+    def frame(self, idx):
+        """ Get frame idx, or None if it can't be read. Frames of a fully decoded clip are returned as views of the
+        clip array, frames of a windowed clip are copied since their slot is reused as the window moves."""
+        if not 0 <= idx < self.num_frames:
+            return None
+        if not self.first <= idx < self.last:
+            if not self.windowed:
+                return None
+            if idx == self.last:
+                # Reading forward, slide the window by one frame:
+                if not self._decode_next():
+                    return None
+            elif idx < self.first:
+                # Moving backwards, refill the window so it ends at this frame:
+                start = max(0, idx + 1 - self.num_slots)
+                self._decode_range(start, idx + 1)
+            else:
+                # Jumping forward, refill the window from this frame on:
+                self._decode_range(idx, min(idx + self.num_slots, self.num_frames))
+            if not self.first <= idx < self.last:
+                return None
+        frame = self.frames[idx % self.num_slots]
+        return frame.copy() if self.windowed else frame
+
+    @property
+    def nbytes(self):
+        """ Memory used by the decoded frames."""
+        return 0 if self.frames is None else self.frames.nbytes
+
+    def read(self):
+        """ Read the next frame, same as cv2.VideoCapture.read"""
+        frame = self.frame(self.pos)
+        if frame is None:
+            return False, None
+        self.pos += 1
+        return True, frame
+
+    def get(self, prop):
+        """ Get a video property, same as cv2.VideoCapture.get"""
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.pos
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.num_frames
+        if self.frames is not None and prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.frames.shape[2]
+        if self.frames is not None and prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.frames.shape[1]
+        return 0
+
+    def set(self, prop, value):
+        """ Set the frame position, same as cv2.VideoCapture.set"""
+        if prop != cv2.CAP_PROP_POS_FRAMES:
+            return False
+        self.pos = min(max(int(value), 0), self.num_frames)
+        return True
+
+    def isOpened(self):
+        return self.num_frames > 0
+
+    def release(self):
+        """ Rewind the clip. The decoded frames (and the file handle of a windowed clip) are kept so the clip can
+        be displayed again without decoding it, they are freed once the clip is evicted from the prefetcher."""
+        self.pos = 0
+
+
+class UnreadableClip:
+    """ Stands in for a clip that couldn't be decoded (e.g. a corrupt file), with the same interface as DecodedClip
+    but no frames, so the Movie Player can move on from it."""
+
+    def __init__(self, path, error):
+        self.path = path
+        self.error = error  # the decoding error, as text
+
+    def read(self):
+        return False, None
+
+    def get(self, prop):
+        return 0
+
+    def set(self, prop, value):
+        return False
+
+    def isOpened(self):
+        return False
+
+    def release(self):
+        pass
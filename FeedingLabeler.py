@@ -2,14 +2,14 @@ import tkinter as tk
 from tkinter.filedialog import askopenfilenames, askdirectory
 import os
 import cv2
-import PIL.Image, PIL.ImageTk
 import pandas as pd
 from tkinter import messagebox
 import numpy as np
 from SEQReader import SEQReader
 import tkinter.ttk as ttk
-import multiprocessing
-import pathos
+from PlaybackEngine import PlaybackEngine
+from FrameRenderer import FrameRenderer
+from CropEngine import compute_bounds
 
 class FeedingLabeler:
     ORIGINAL_WIDTH = 1920
@@ -17,8 +17,8 @@ class FeedingLabeler:
     MOVIE_PREFIX = 'cutout'  # movie file name prefix
     KEYS_TO_LABELS = {'2': 'Feeding I&O', '3': 'Spitting', '5': 'Feeding Success',
                       '7': 'Delete Video', '8': 'Other', '9': 'Feeding Fail', '-': 'Swimming'}
-    e = multiprocessing.Event()
-    p = None
+    SPEED_STEP = 2  # playback speed is multiplied or divided by this factor with the speed hot-keys
+
     def __init__(self,fps=30,padding=325):
         """ Initialize a new instance of the FeedingLabeler application."""
          # This is a tkinter based GUI
@@ -36,6 +36,8 @@ class FeedingLabeler:
         self.padding = padding
         self.last_frame_written = 0
         self.vid_loaded = False
+        self.engine = None  # Playback engine, created once a video is loaded
+        self.curr_frame_idx = -1  # Index of the frame currently displayed
         self.label = tk.StringVar()  # this variable will hold the label for the current video
         self.define_btns()
         self.log = pd.DataFrame(columns=['source_vid','start_frame','coords','num_frames','label','comments'])
@@ -49,6 +51,7 @@ class FeedingLabeler:
 
     def define_btns(self):
         self.video_panel = tk.Canvas(master=self.window, width=700, height=500)
+        self.renderer = FrameRenderer(self.video_panel)  # Draws the frames onto the video panel
         self.video_panel.bind('<Configure>', self._resize_image)
         self.video_panel.bind('<Button-1>', self.displayclick)
         self.video_panel.bind('<Button-2>', self.removeclick)
@@ -58,6 +61,7 @@ class FeedingLabeler:
         self.btn_clear_selection = tk.Button(master=self.frm_admin_btns, text='undo click', command=self.clear_click_selection)
         self.define_label_frm()
         self.lbl_frame_centroid = tk.Label(master=self.frm_admin_btns, text='', fg='red')
+        self.lbl_playback = tk.Label(master=self.frm_admin_btns, text='')  # Playback speed and frame rate
         self.define_vid_frm()
         self.window.bind('<Key>', self.handle_keystroke)
 
@@ -72,12 +76,11 @@ class FeedingLabeler:
         # Play button:
         self.btn_play = tk.Button(master=self.frm_vid_btns,bg='blue',relief= 'raised',
                                   text='Play/Pause',width=10,height=3,
-                                  command=self.play_vid)
+                                  command=self.handle_play)
         self.ent_frame_idx = tk.Entry(master=self.frm_vid_btns,name='ent_id',text=str(0), width=3)
         self.ent_frame_idx.bind("<Return>", self.navigate_to_frame)  # When user presses "Enter", current video will change
         self.btn_rewind = tk.Button(master=self.frm_vid_btns,bg='pink',relief='raised', text= 'Rewind',
                                     width=3, height=3, command=self.rewind)
-        self.btn_play.bind('<Button-1>', self.handle_play)  # Set the play/pause marker
 
     def define_label_frm(self):
         self.comment=''
@@ -102,6 +105,7 @@ class FeedingLabeler:
         self.set_label_frm()
         self.frm_label.pack(expand=1)
         self.lbl_frame_centroid.pack(expand=1,side=tk.BOTTOM,pady=100)
+        self.lbl_playback.pack(expand=0,side=tk.BOTTOM)
         self.frm_admin_btns.pack(expand=0,side=tk.LEFT)#.grid(row=0,column=0, sticky='nsew')
         self.set_vid_frm()
         self.video_panel.pack(expand=1, fill=tk.BOTH,side=tk.TOP)#.grid(row=0, column=1, sticky='nsew')
@@ -154,20 +158,20 @@ class FeedingLabeler:
         if isinstance(event.widget, tk.Entry):
             return
         # Define pairs of keystrokes and actions in a dictionary:
-        key_dict = { "0": self.play_vid, "4": self.prev_frame, "6": self.next_frame}
+        key_dict = { "0": self.handle_play, "4": self.prev_frame, "6": self.next_frame,
+                     "[": self.slower, "]": self.faster}
         if event.char in key_dict.keys():
-            key_dict[event.char](event)
+            key_dict[event.char]()
 
     def _resize_image(self,event):
         if self.vid_loaded:
             self.width = event.width
             self.height = event.height
-            self.frame = self.photo_copy.copy()
-            self.frame = self.frame.resize((self.width, self.height))
-            self.photo = PIL.ImageTk.PhotoImage(image=self.frame)
-            self.video_panel.create_image(0, 0, image=self.photo, anchor=tk.NW)
+            self.renderer.render(self.frame_array, (self.width, self.height))
+            self.draw_centroid()  # Move the centroid marker to the new frame size
 
     def load_vid(self):
+        self.pause_playback()
         if self.vid_loaded:
             self.log.to_csv(self.log_path,index=False)
         self.vidpath = list(askopenfilenames(filetypes=[("Video Files", ["*.mp4", "*.avi", "*.seq"])]))
@@ -196,20 +200,27 @@ class FeedingLabeler:
         else:
             if os.path.exists(self.log_path):
                 self.log = pd.read_csv(self.log_path)
+        # Play back at the recording's frame rate, fall back to the output frame rate if it is missing:
+        self.engine = PlaybackEngine(self.window, self.vid, self.show_frame,
+                                     fps=self.vid.properties['FrameRate'] or self.fps,
+                                     end_callback=self.on_playback_end, stats_callback=self.display_playback_stats)
         self.display_frame()
 
     def on_close(self):
+        self.pause_playback()
         if self.vid_loaded:
             self.log.to_csv(self.log_path,index=False)
         self.window.quit()
 
     def rewind(self):
-        if self.centroids_by_frm[self.vid.frame_pointer,:].sum()>0:
+        self.pause_playback()
+        if self.centroids_by_frm[self.curr_frame_idx,:].sum()>0:
             self.removeclick()
         self.vid.frame_pointer=-1
         self.display_frame(copy_centroid=False)
 
     def navigate_to_frame(self,idx):
+        self.pause_playback()
         user_selection = int(self.ent_frame_idx.get())  # Get the user selected value
         if user_selection > len(self.vid):
             # If the user selected a video index out of range, replace the value with the last video index:
@@ -218,27 +229,32 @@ class FeedingLabeler:
         self.display_frame(copy_centroid=False)
 
     def draw_centroid(self):
+        self.clear_centroid()
         if self.centroid != (0,0) and self.centroid != (-1,-1) :
             x,y = self.centroid
             x = int(x * self.width)
             y = int(y * self.height)
             self.video_panel.create_oval(x,y,
                                      5+x,5+y,
-                                     outline="#f11", width=2)
+                                     outline="#f11", width=2, tags='centroid')
+
+    def clear_centroid(self):
+        """Remove the centroid marker from the video panel."""
+        self.video_panel.delete('centroid')
 
     def displayclick(self,event):
         self.lbl_frame_centroid.configure(text=f'{event.x:.3f}, {event.y:.3f}')
         self.lbl_frame_centroid.update()
-        self.video_panel.create_image(0, 0, image=self.photo, anchor=tk.NW)  # Draw the image in the Panel widget
         self.centroid = (event.x/self.width, event.y/self.height)
         # x is cols y is rows, it is the other way around when cut from a matrix, so we'll store it backwards:
-        self.centroids_by_frm[self.vid.frame_pointer,:] = self.centroid[1], self.centroid[0]
+        self.centroids_by_frm[self.curr_frame_idx,:] = self.centroid[1], self.centroid[0]
         self.draw_centroid()
 
     def removeclick(self, even=False):
+        self.pause_playback()
         self.centroid = (-1,-1)
-        self.video_panel.create_image(0, 0, image=self.photo, anchor=tk.NW)  # Draw the image in the Panel widget
-        self.centroids_by_frm[self.vid.frame_pointer, :] = self.centroid
+        self.clear_centroid()
+        self.centroids_by_frm[self.curr_frame_idx, :] = self.centroid
         result = messagebox.askquestion('segment save', 'do you want to save segment?')
         if result=='yes':
             self.save_segment()
@@ -251,30 +267,32 @@ class FeedingLabeler:
 
     def clear_click_selection(self):
         self.centroid = (0,0)
-        self.centroids_by_frm[self.vid.frame_pointer,:] = self.centroid
-        self.video_panel.create_image(0, 0, image=self.photo, anchor=tk.NW)
+        self.centroids_by_frm[self.curr_frame_idx,:] = self.centroid
+        self.clear_centroid()
         self.lbl_frame_centroid.configure(text=' ')
         self.lbl_frame_centroid.update()
 
     def display_frame(self, event=None,copy_centroid=True):
         """Read a single frame from the current video and display it onto the GUI."""
         ret, frame = self.vid.read()  # Read a single frame
+        self.show_frame(self.vid.frame_pointer, frame, copy_centroid)
+
+    def show_frame(self, frame_idx, frame, copy_centroid=True):
+        """Display a frame onto the GUI, along with the centroid selected for it.
+        This is also the display callback of the playback engine."""
+        self.curr_frame_idx = frame_idx
         self.ent_frame_idx.delete(0, tk.END)
-        self.ent_frame_idx.insert(0, self.vid.frame_pointer+1)
-        self.frame = PIL.Image.fromarray(frame)  # Save that frame
-        self.frame_array = frame
-        self.frame = self.frame.resize((self.width,self.height))
-        self.photo = PIL.ImageTk.PhotoImage(image=self.frame)  # Convert frame to display it on GUI
-        self.photo_copy = PIL.Image.fromarray(frame)
-        self.video_panel.create_image(0, 0, image=self.photo, anchor=tk.NW)  # Draw the image in the Panel widget
+        self.ent_frame_idx.insert(0, frame_idx+1)
+        self.frame_array = frame  # Save that frame
+        self.renderer.render(frame, (self.width, self.height))  # Draw the image in the Panel widget
         if copy_centroid:
-            if self.centroids_by_frm[self.vid.frame_pointer,:].sum() != 0:
-                self.centroid = tuple(self.centroids_by_frm[self.vid.frame_pointer,::-1])
+            if self.centroids_by_frm[frame_idx,:].sum() != 0:
+                self.centroid = tuple(self.centroids_by_frm[frame_idx,::-1])
             else:
-                self.centroids_by_frm[self.vid.frame_pointer,:] = self.centroid[1],self.centroid[0]
+                self.centroids_by_frm[frame_idx,:] = self.centroid[1],self.centroid[0]
             self.draw_centroid()
         else:
-            self.centroid = tuple(self.centroids_by_frm[self.vid.frame_pointer, ::-1])
+            self.centroid = tuple(self.centroids_by_frm[frame_idx, ::-1])
             self.draw_centroid()
 
     def translate_centroid(self,centroid):
@@ -284,25 +302,14 @@ class FeedingLabeler:
         return row,col
 
     def get_bounds(self,row,col):
-        upper_row = row-self.padding
-        bottom_row = row+self.padding
-        left_col = col-self.padding
-        right_col = col+self.padding
-        if upper_row<0:
-            bottom_row += abs(upper_row)
-            upper_row = 0
-        if bottom_row>self.ORIGINAL_HEIGHT:
-            upper_row -= (bottom_row-self.ORIGINAL_HEIGHT)
-            bottom_row = self.ORIGINAL_HEIGHT
-        if left_col<0:
-            right_col += abs(left_col)
-            left_col = 0
-        if right_col>self.ORIGINAL_WIDTH:
-            left_col -= (right_col-self.ORIGINAL_WIDTH)
-            right_col = self.ORIGINAL_WIDTH
-        return upper_row, bottom_row, left_col, right_col
+        # Same segment bounds as the Movie Cutter's, see compute_bounds (which takes x, y centers):
+        left_col, right_col, upper_row, bottom_row = compute_bounds([(col, row)], self.padding,
+                                                                    (self.ORIGINAL_WIDTH, self.ORIGINAL_HEIGHT))
+        return int(upper_row[0]), int(bottom_row[0]), int(left_col[0]), int(right_col[0])
 
     def save_segment(self,event=False):
+        # The playback engine decodes on its own thread, stop it before reading frames from the same reader:
+        self.pause_playback()
         frame_num = self.last_frame_written
         while frame_num < len(self.vid):
             if self.centroids_by_frm[frame_num,:].sum()>0:
@@ -349,51 +356,58 @@ class FeedingLabeler:
         self.label.set(None)
 
     def prev_frame(self):
+        self.pause_playback()
         self.vid.frame_pointer -= 2
         if self.vid.frame_pointer < -1:
             self.vid.frame_pointer = -1
         self.display_frame(copy_centroid=False)
 
     def next_frame(self):
+        self.pause_playback()
         self.display_frame()
 
     def handle_play(self, event=None):
-        """ Handle play button click, if it is clicked once turn it into a pause button."""
+        """ Handle play button click or the 0 key, if it is clicked once turn it into a pause button."""
+        if not self.vid_loaded:
+            return
         self.pause = not self.pause  # Now when the "Play" button will be clicked again it will pause the video
         if not self.pause:
-            self.start_playing_proc()
+            self.play_vid()
         else:
-            self.stop_playing_proc()
+            self.engine.stop()
+            self.display_playback_stats()
+
+    def play_vid(self):
+        """ Play the video file currently loaded to the GUI, at the recording's frame rate.
+        Frames are decoded on a background thread by the playback engine and displayed on the main loop,
+        see the PlaybackEngine class for details."""
+        self.engine.start()
+
+    def pause_playback(self):
+        """ Pause the video if it is playing, used before navigating the video frame by frame."""
+        if self.engine and self.engine.running:
+            self.handle_play()
 
-    def play_vid(self,event=None,play_speed=1):
-        """ This method plays the video file currently loaded to the GUI.
-        The video is played by recursively calling this method using the window.after() tkinter method.
-        The method will stop when the video is paused or reaches its end.
-        This method is invoked either by pressing the play button, or by pressing the 0 key.
+    def on_playback_end(self):
+        """ When the video reaches its end, rewind it and display the first frame."""
+        self.vid.frame_pointer = -1  # Rewind the video to the first frame
+        self.display_frame()  # display the first frame
+        self.pause = True  # Change the status of the play/pause button from "Pause" to "Play"
+        self.display_playback_stats()
 
-        """
-        try:
-            # Now, as long as pause isn't pressed, and the video doesn't end, sequentially display frames:
-            while self.vid.isOpened():
-                if self.e.is_set:
-                    self.e.clear()
-                    break
-                # pause hasn't been pressed
-                self.display_frame()  # display a single frame
-                # The main driving force behind the method, recursively calling the method again after 15 milliseconds:
-        except AttributeError:
-            # If the video reached its end tkinter will raise an AttributeError, we'll catch it and reset the video:
-            self.vid.frame_pointer = -1  # Rewind the video capture object to frame
-            self.display_frame()  # display the first frame
-            self.pause = not self.pause  # Change the status of the play/pause button from "Pause" to "Play"
+    def faster(self):
+        if self.engine:
+            self.engine.set_speed(self.engine.speed * self.SPEED_STEP)
+            self.display_playback_stats()
 
-    def start_playing_proc(self):
-        self.p = multiprocessing.Process(target=self.play_vid, args=())
-        self.p.start()
+    def slower(self):
+        if self.engine:
+            self.engine.set_speed(self.engine.speed / self.SPEED_STEP)
+            self.display_playback_stats()
 
-    def stop_playing_proc(self):
-        self.e.set()
-        self.p.join()
+    def display_playback_stats(self, stats=None):
+        """ Show the playback speed, the achieved versus the target frame rate and the rendering time."""
+        self.lbl_playback.configure(text=f'{self.engine.report()}\n{self.renderer.report()}')
 
 
 
@@ -404,6 +418,8 @@ class VidReader():
         self.cap = cv2.VideoCapture(vidpath)
         self.frame_pointer = -1
         self.num_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        # Mirror the SEQReader properties used by the GUI:
+        self.properties = {'FrameRate': self.cap.get(cv2.CAP_PROP_FPS)}
 
     def read(self):
         if self.frame_pointer < self.num_frames-1:
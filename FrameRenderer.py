@@ -0,0 +1,77 @@
+import time
+import tkinter as tk
+import cv2
+import numpy as np
+import PIL.Image, PIL.ImageTk
+
+
+class FrameRenderer:
+    """ Draw video frames onto a tkinter canvas without leaking memory.
+    Each renderer keeps a single canvas image item and a single PhotoImage buffer for its panel, new frames are
+    pasted into that buffer in place instead of creating a new PhotoImage and stacking a new canvas item per frame.
+    Frames are resized with OpenCV (INTER_AREA) into a reusable NumPy buffer before they are handed to Tk.
+    The number of frames rendered and the average rendering time are tracked for profiling."""
+
+    def __init__(self, canvas, x=0, y=0, anchor=tk.NW):
+        """ Initialize a renderer for a canvas. inputs:
+        canvas - the tkinter canvas to draw on
+        x, y, anchor - position of the image on the canvas, as in canvas.create_image"""
+        self.canvas = canvas
+        self.position = (x, y)
+        self.anchor = anchor
+        self.image_item = None  # canvas item id of the displayed image
+        self.photo = None  # PhotoImage buffer that is updated in place
+        self.mode = None  # PIL mode of the PhotoImage buffer
+        self._resized = None  # reusable buffer for the resized frame
+        self._converted = None  # reusable buffer for BGR to RGB conversion
+        self.frames_rendered = 0
+        self.render_time = 0.0  # total time spent rendering, in seconds
+
+    def render(self, frame, size=None):
+        """ Display a frame on the canvas. inputs:
+        frame - a grayscale (H x W) or BGR (H x W x 3) uint8 image
+        size - optional (width, height) to resize the frame to before displaying it"""
+        start = time.perf_counter()
+        if frame.ndim == 3:
+            # OpenCV frames are BGR, Tk expects RGB:
+            self._converted = self._get_buffer(self._converted, frame.shape)
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self._converted)
+        if size is not None and (size[0], size[1]) != (frame.shape[1], frame.shape[0]):
+            self._resized = self._get_buffer(self._resized, (size[1], size[0]) + frame.shape[2:])
+            frame = cv2.resize(frame, (size[0], size[1]), dst=self._resized, interpolation=cv2.INTER_AREA)
+        mode = 'L' if frame.ndim == 2 else 'RGB'
+        height, width = frame.shape[:2]
+        if self.photo is None or self.photo.width() != width or self.photo.height() != height or \
+                self.mode != mode:
+            # Only create a new Tk image when the displayed size or mode changes:
+            self.photo = PIL.ImageTk.PhotoImage(mode, (width, height))
+            self.mode = mode
+            if self.image_item is None:
+                self.image_item = self.canvas.create_image(*self.position, image=self.photo, anchor=self.anchor)
+            else:
+                self.canvas.itemconfigure(self.image_item, image=self.photo)
+        self.photo.paste(PIL.Image.fromarray(frame))  # update the pixels in place
+        self.frames_rendered += 1
+        self.render_time += time.perf_counter() - start
+
+    @staticmethod
+    def _get_buffer(buffer, shape):
+        """ Reuse a buffer if it has the right shape, otherwise allocate a new one."""
+        if buffer is None or buffer.shape != tuple(shape):
+            buffer = np.empty(shape, dtype='uint8')
+        return buffer
+
+    @property
+    def ms_per_frame(self):
+        """ Average rendering time per frame in milliseconds."""
+        if self.frames_rendered == 0:
+            return 0.0
+        return 1000 * self.render_time / self.frames_rendered
+
+    def report(self):
+        """ Get a short text summary of the rendering stats."""
+        return f'{self.frames_rendered} frames rendered, {self.ms_per_frame:.2f} ms/frame'
+
+    def reset_stats(self):
+        self.frames_rendered = 0
+        self.render_time = 0.0
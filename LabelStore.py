@@ -0,0 +1,117 @@
+import contextlib
+import getpass
+import os
+import socket
+import sqlite3
+import time
+import pandas as pd
+
+
+class LabelStore:
+    """ A local SQLite label store kept next to a clip log csv file, e.g. log.csv -> log.sqlite.
+    Every label or comment change is committed right away as a single row upsert keyed on (clip_name, column),
+    so changes survive a crash and annotators working on the same clip folder don't overwrite each other.
+    The clip folder is often shared over the network, so annotators may be on different machines. SQLite's WAL mode
+    and its own file locks can't be relied on there, so the database uses the rollback journal and every access
+    holds a lock file next to it (e.g. log.sqlite.lock), created with an exclusive create that network file
+    systems (NFSv3+, SMB) do atomically. Annotators take turns for the duration of a single row transaction, a
+    lock left behind by a crashed annotator is removed once it is STALE_LOCK_SECONDS old.
+    Values are stored as they are set (text, integers or NULL) and applied back onto the log DataFrame through a
+    LogIndex, so exporting the log to csv gives the same file as saving the DataFrame itself."""
+    BUSY_TIMEOUT_MS = 5000  # how long to wait for another annotator's transaction before giving up
+    STALE_LOCK_SECONDS = 30  # age of a lock file after which its annotator is assumed to have crashed
+
+    def __init__(self, path, annotator=None):
+        """ Open (or create) a label store. inputs:
+        path - path of the SQLite database file
+        annotator - optional, name recorded with every change, defaults to the user name"""
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.annotator = annotator or getpass.getuser()
+        with self._locked():
+            self.connection = sqlite3.connect(path, timeout=self.BUSY_TIMEOUT_MS / 1000)
+            # Also turns stores created in WAL mode back to the rollback journal:
+            self.connection.execute('PRAGMA journal_mode=DELETE')
+            self.connection.execute(f'PRAGMA busy_timeout={self.BUSY_TIMEOUT_MS}')
+            with self.connection:
+                # The value column has no declared type so values keep the type they were written with:
+                self.connection.execute('CREATE TABLE IF NOT EXISTS labels ('
+                                        'clip_name TEXT NOT NULL, column_name TEXT NOT NULL, value, '
+                                        'annotator TEXT, updated REAL, PRIMARY KEY (clip_name, column_name))')
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """ Hold the lock file of the store, waiting up to BUSY_TIMEOUT_MS for other annotators to release it."""
+        deadline = time.monotonic() + self.BUSY_TIMEOUT_MS / 1000
+        while True:
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                pass
+            try:
+                if time.time() - os.path.getmtime(self.lock_path) > self.STALE_LOCK_SECONDS:
+                    os.remove(self.lock_path)
+                    continue
+            except FileNotFoundError:
+                continue  # released in the meantime
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'The label store is locked by another annotator, see {self.lock_path}')
+            time.sleep(0.05)
+        try:
+            # Record who holds the lock, to tell who left it behind:
+            os.write(fd, f'{self.annotator}@{socket.gethostname()}'.encode('utf-8'))
+            yield
+        finally:
+            os.close(fd)
+            os.remove(self.lock_path)
+
+    @classmethod
+    def for_log(cls, log_filepath, annotator=None):
+        """ Open the label store of a log csv file."""
+        return cls(os.path.splitext(log_filepath)[0] + '.sqlite', annotator)
+
+    @staticmethod
+    def _to_sql(value):
+        """ Convert a DataFrame value to a value SQLite can store."""
+        if value is None or (not isinstance(value, str) and pd.isnull(value)):
+            return None
+        if hasattr(value, 'item'):
+            # numpy scalar:
+            return value.item()
+        return value
+
+    def set(self, clip_name, column, value):
+        """ Store the value of a column for a clip, committed immediately."""
+        with self._locked(), self.connection:
+            self.connection.execute('INSERT INTO labels VALUES (?, ?, ?, ?, ?) '
+                                    'ON CONFLICT (clip_name, column_name) DO UPDATE SET value=excluded.value, '
+                                    'annotator=excluded.annotator, updated=excluded.updated',
+                                    (clip_name, column, self._to_sql(value), self.annotator, time.time()))
+
+    def get_clip(self, clip_name):
+        """ Get the stored values of a clip as a column -> value dictionary."""
+        with self._locked():
+            rows = self.connection.execute('SELECT column_name, value FROM labels WHERE clip_name=?', (clip_name,))
+            return dict(rows.fetchall())
+
+    def apply(self, log_index, clip_name=None):
+        """ Write the stored values onto the log DataFrame of a LogIndex, for one clip or for all of them.
+        Values of clips or columns that are not in the log are skipped."""
+        with self._locked():
+            if clip_name is None:
+                rows = self.connection.execute('SELECT clip_name, column_name, value FROM labels').fetchall()
+            else:
+                rows = self.connection.execute('SELECT clip_name, column_name, value FROM labels WHERE clip_name=?',
+                                               (clip_name,)).fetchall()
+        for clip, column, value in rows:
+            if clip in log_index and column in log_index.log.columns:
+                log_index.set(clip, column, value)
+
+    def export_csv(self, log_index, filepath):
+        """ Save the log with all the stored values applied to a csv file, in the same format as the log file."""
+        self.apply(log_index)
+        log_index.log.to_csv(filepath, index=False)
+
+    def close(self):
+        self.connection.close()
@@ -1,12 +1,22 @@
 import tkinter as tk
 from tkinter.filedialog import askdirectory
 import os
+import re
 import cv2
-import PIL.Image, PIL.ImageTk
 import pandas as pd
 from tkinter import messagebox
 import numpy as np
 from pathlib import Path
+from PlaybackEngine import PlaybackEngine
+from FrameRenderer import FrameRenderer
+from LogIndex import LogIndex
+from ClipPrefetcher import ClipPrefetcher
+from DecodedClip import UnreadableClip
+from LabelStore import LabelStore
+from ClipFileOps import ClipFileOps
+from ClipManifest import ClipManifest
+from ClipArchive import ClipArchive
+from MosaicView import MosaicView
 
 
 class Labeler:
@@ -26,6 +36,10 @@ class Labeler:
     LABEL_LIST = ['Delete Video','Swimming','Feeding Success','Feeding Fail','Feeding I&O','Spitting','Other']
 
     LABEL_MULTICHOICE = False
+    # Commit every label change to a local SQLite store next to the log file, see the LabelStore class:
+    USE_LABEL_STORE = False
+    MOSAIC_SHAPE = (4, 4)  # rows and columns of the Mosaic View grid
+    MAX_FAILURES_SHOWN = 10  # number of failed file names to list when deleting or moving videos fails
     def __init__(self):
         """ Initialize a new instance of the FeedingLabeler application."""
         # This is a tkinter based GUI
@@ -40,6 +54,7 @@ class Labeler:
         # This will be our video player once we load some movies, see the get_dir method:
         self.player = []
         self.log_saved = True  # Track changes to the label log
+        self.file_ops = ClipFileOps()  # Deletes and moves reviewed videos
         self.window.wm_title("Fish Labeler")
         # define what happens when the GUI window is closed by user:
         self.window.wm_protocol("WM_DELETE_WINDOW", self.on_close)
@@ -57,6 +72,8 @@ class Labeler:
             self.label = tk.StringVar()  # this variable will hold the label for the current video
             self.label.set(None)  # No default value
         self.btn_load = tk.Button(master=self.frm_label, text='Load Movies', command=self.get_dir) # load movies
+        # Triage many videos at once in a grid, see the MosaicView class:
+        self.btn_mosaic = tk.Button(master=self.frm_label, text='Mosaic View', command=self.open_mosaic)
         # Label options depicted as radio buttons, because of the multitude of labels,
         # we will create a list containing all the radio buttons, defining them iteratively:
         self.btn_labels = []
@@ -87,6 +104,7 @@ class Labeler:
         self.window.columnconfigure(1, weight=1, minsize=700)
         # Place the widgets within the label frame:
         self.btn_load.grid(row=0, column=0, sticky="ew", padx=5, pady=10)
+        self.btn_mosaic.grid(row=0, column=1, sticky="ew", padx=5, pady=10)
         # Iterate over the label radio buttons to place them:
         for i in range(len(self.btn_labels)):
             self.btn_labels[i].grid(row=i//2+2, column=i % 2, sticky='w', padx=5, pady=10)
@@ -105,6 +123,7 @@ class Labeler:
         # If a video file is currently open, release it:
         if self.player:
             if self.player.curr_vid:
+                self.player.stop_playback()
                 self.player.curr_vid.release()
                 if not self.log_saved:
                     # If the log has been change without saving, open a window prompt:
@@ -127,64 +146,95 @@ class Labeler:
                                                         'Some videos are missing labels, are you sure you want to leave?')
                         if not result: # If the user is sure, close the window:
                             return  # Don't close the window
+        if self.player:
+            self.player.prefetcher.shutdown()  # Stop decoding clips in the background
+            self.player.close_label_store()
         self.window.quit()
 
     def delete_videos(self):
-        """ Upon closing, delete videos tagged as "Other" to free up space in the computer.
+        """ Upon closing, delete videos tagged as "Delete Video" to free up space in the computer.
         Ask user before deleting!"""
-        # If the user wants to delete, iterate over all movies and remove the file and log entry:
-        for index, row in self.player.log.iterrows():
-            if row['reviewer_label'] == 'Delete Video':
-                try:
-                    # Try to delete the video
-                    os.remove(os.path.join(self.player.directory, row['clip_name']))  # Remove file
-                    self.player.log.drop(index, inplace=True)  # Remove log entry
-                except:
-                    # If the file is not found, write a comment in the log
-                    self.player.log.iloc[index, 4] = "Could not delete file"
-                    print(self.player.log.iloc[index, :])
-                    self.player.log.to_csv(self.player.log_filepath, index=False)
+        log = self.player.log
+        # Select the videos to delete and remove the files in bulk:
+        rows, archived = self.split_archived(log.index[log['reviewer_label'] == 'Delete Video'])
+        failures = self.file_ops.remove({row: os.path.join(self.player.directory, log.at[row, 'clip_name'])
+                                         for row in rows})
+        # Remove the log entries of the deleted files, and write a comment in the log for the ones that failed:
+        self.comment_failures(failures, 'Could not delete file')
+        log.drop(rows.difference(list(failures)), inplace=True)
+        self.player.index_log()  # Rows were removed from the log
+        self.player.save_log()
+        self.report_failures(failures, 'delete')
+        self.report_archived(archived, 'deleted')
 
     def move_swimming_vids(self):
         """ Move the swimming videos into a separate folder, split the log file entries to a new log."""
         # Create a new directory to move the videos to:
-
         swim_directory = os.path.join(self.player.directory,'Swimming_vids')
         swim_log_filepath = os.path.join(swim_directory, 'swim_log.csv')
-        # Create the new log dataframe:
-        swim_log = pd.DataFrame(columns=['clip_name', 'parent_video',
-                                         'frame', 'coordinates', 'comments', 'reviewer_label'])
-        try:
-            # Create new directory for the swim files:
-            os.mkdir(swim_directory)
-
-            counter = 0  # count the entries to the log
-        except FileExistsError:
+        if os.path.isdir(swim_directory) and os.path.isfile(swim_log_filepath):
             # if the folder exists already, load the existing log:
             print('Folder exists')
             swim_log = pd.read_csv(swim_log_filepath)
-            # set the counter number to the last row index:
-            counter = swim_log.shape[0]
-        # Iterate over all the videos:
-        for index, row in self.player.log.iterrows():
-            if row['reviewer_label'] == 'Swimming':
-                try:
-                    # If it is a swimming video, rename to the vile to move it to a new directory:
-                    os.rename(os.path.join(self.player.directory, row['clip_name']),
-                            os.path.join(swim_directory, row['clip_name']))
-                    swim_log.loc[counter, :] = row  # Add the row to the swim log
-                    self.player.log.drop(index, inplace=True)  # Remove log entry from the main log
-                except:
-                    self.player.log.iloc[index, 4] = "Could not move file"
-                    print(self.player.log.iloc[index, :])
-                counter += 1
-        swim_log.to_csv(swim_log_filepath, index=False)  # save the swim log
+        else:
+            os.makedirs(swim_directory, exist_ok=True)
+            # Create the new log dataframe:
+            swim_log = pd.DataFrame(columns=['clip_name', 'parent_video',
+                                             'frame', 'coordinates', 'comments', 'reviewer_label'])
+        log = self.player.log
+        # Select the swimming videos and move the files to the new directory in bulk:
+        rows, archived = self.split_archived(log.index[log['reviewer_label'] == 'Swimming'])
+        failures = self.file_ops.move({row: (os.path.join(self.player.directory, log.at[row, 'clip_name']),
+                                             os.path.join(swim_directory, log.at[row, 'clip_name']))
+                                       for row in rows})
+        moved = rows.difference(list(failures))
+        # Add the moved videos to the swim log, keeping the swim log columns, and remove them from the main log:
+        swim_log = pd.concat([swim_log, log.loc[moved].reindex(columns=swim_log.columns)], ignore_index=True)
+        self.comment_failures(failures, 'Could not move file')
+        log.drop(moved, inplace=True)
+        self.player.index_log()  # Rows were removed from the log
+        # Save both logs together so the moved videos are never in both or in neither:
+        self.player.save_log(other_logs={swim_log_filepath: swim_log})
+        self.report_failures(failures, 'move')
+        self.report_archived(archived, 'moved')
+
+    def split_archived(self, rows):
+        """ Split log rows to the clips saved as video files and the clips packed in clip archives. Clips can't be
+        removed from an archive one by one, so packed clips are left in place and keep their labels in the log."""
+        archived = self.player.log.loc[rows, 'clip_name'].isin(self.player.archived_clip_names()).values
+        return rows[~archived], rows[archived]
+
+    def report_archived(self, rows, action):
+        """ Let the user know which labeled clips were left in their clip archive."""
+        if len(rows) == 0:
+            return
+        clip_names = self.player.log.loc[rows, 'clip_name'].tolist()
+        print(f'{len(clip_names)} clips packed in clip archives were not {action}: {clip_names}')
+        messagebox.showinfo('Packed clips', f'{len(clip_names)} clips are packed in clip archives and were not '
+                                            f'{action}, they keep their labels in the log.')
+
+    def comment_failures(self, failures, comment):
+        """ Write a comment with the error message in the log rows of files that failed a file operation."""
+        for row, error in failures.items():
+            clip_name = self.player.log.at[row, 'clip_name']
+            print(f'{comment} {clip_name}: {error}')
+            self.player.set_log_value(clip_name, 'comments', f'{comment}: {error}')
+
+    def report_failures(self, failures, action):
+        """ Let the user know which files failed a file operation."""
+        if not failures:
+            return
+        clip_names = [self.player.log.at[row, 'clip_name'] for row in failures]
+        msg = '\n'.join(clip_names[:self.MAX_FAILURES_SHOWN])
+        if len(clip_names) > self.MAX_FAILURES_SHOWN:
+            msg += f'\n... and {len(clip_names) - self.MAX_FAILURES_SHOWN} more'
+        messagebox.showinfo('Error', f'Could not {action} {len(clip_names)} files, see their log comments:\n{msg}')
 
     def save_labels(self):
         """ Save video labels to log file"""
         try:
             # Save changes to the log DataFrame to the log.csv file:
-            self.player.log.to_csv(self.player.log_filepath, index=False)
+            self.player.save_log()
             # Open a prompt displaying the file path:
             messagebox.showinfo('Labels Saved', f'Log saved to: {self.player.log_filepath} ')
             self.log_saved = True  # Change the track saved changes marker to True
@@ -201,11 +251,14 @@ class Labeler:
                                                              "this will delete any unsaved labels. Are you sure?")
             if result != "yes":
                 return
+            self.player.stop_playback()
+            self.player.prefetcher.shutdown()
+            self.player.close_label_store()
         # Define the movie player that will handle video display and navigation,
         # we pass the label var and comment widget so that their values can be set when we load a new
         # video to the GUI:
         self.player = MoviePlayer(self.window, label_var=self.label, comment_widget=self.ent_comment,
-                                  multichoice=self.LABEL_MULTICHOICE)
+                                  multichoice=self.LABEL_MULTICHOICE, use_label_store=self.USE_LABEL_STORE)
         self.player.load_directory()  # See the Movie Player class for details
         self.bind_keystrokes()
 
@@ -215,9 +268,13 @@ class Labeler:
         for char,label in self.KEYS_TO_LABELS.items():
             self.window.bind(f'{char}', self.set_label)
 
-    def set_label(self,event=None):
+    def set_label(self,event=None, clip_name=None, label=None):
         """Commit changes made in to the video label from the GUI to the log dataframe.
-        Handles changes made by either button click (trackpad or mouse) or keystroke (specified keyboard key)."""
+        Handles changes made by either button click (trackpad or mouse) or keystroke (specified keyboard key).
+        Other views (e.g. the Mosaic View) can label any loaded video by passing its clip_name and the label."""
+        if clip_name is not None:
+            self.set_clip_label(clip_name, label)
+            return
         # If label change was initiated by keystroke:
         if event:
             # If the keystroke is coming from an entry widget, ignore it:
@@ -232,16 +289,41 @@ class Labeler:
         # Whether click or key, label variable value is retrieved and saved to the log dataframe:
         if self.LABEL_MULTICHOICE:
             for key, var in self.label.items():
-                self.player.log.loc[self.player.log.clip_name == self.player.curr_clip_name, self.player.column_names[key]] = var.get()
+                self.player.set_log_value(self.player.curr_clip_name, self.player.column_names[key], var.get())
+        else:
+            self.player.set_log_value(self.player.curr_clip_name, 'reviewer_label', self.label.get())
+        self.log_saved = False  # Track changes that are not saved to .csv file
+
+    def open_mosaic(self):
+        """ Open the Mosaic View on the loaded videos, the Movie Player is paused meanwhile."""
+        if not self.player or not self.player.file_paths:
+            messagebox.showinfo('Mosaic View', 'Load some movies first')
+            return
+        self.player.pause_playback()
+        MosaicView(self, rows=self.MOSAIC_SHAPE[0], cols=self.MOSAIC_SHAPE[1])
+
+    def set_clip_label(self, clip_name, label):
+        """ Label a video that is not necessarily the one displayed in the Movie Player. In multichoice mode the
+        label is added to the video's labels."""
+        if clip_name not in self.player.log_index:
+            # Videos found in the folder but not in the log get a row, as when they are played:
+            self.player.add_missing_entry(clip_name)
+        if self.LABEL_MULTICHOICE:
+            if label not in self.player.column_names:
+                print(f'Unknown label {label}')
+                return
+            self.player.set_log_value(clip_name, self.player.column_names[label], 1)
+            if clip_name == self.player.curr_clip_name:
+                self.label[label].set(1)
         else:
-            self.player.log.loc[self.player.log.clip_name == self.player.curr_clip_name, ['reviewer_label']] \
-                = self.label.get()
+            self.player.set_log_value(clip_name, 'reviewer_label', label)
+            if clip_name == self.player.curr_clip_name:
+                self.label.set(label)
         self.log_saved = False  # Track changes that are not saved to .csv file
 
     def insert_comment(self,event):
         """Commits changes made to the comments entry field from the GUI to the log dataframe."""
-        self.player.log.loc[self.player.log.clip_name == self.player.curr_clip_name, ['comments']]= \
-            self.ent_comment.get()
+        self.player.set_log_value(self.player.curr_clip_name, 'comments', self.ent_comment.get())
         self.log_saved = False
         self.window.focus_set()
 
@@ -253,11 +335,23 @@ class MoviePlayer:
     LOG_FILENAME = 'log.csv'
     FOLDERNAME_TO_IGNORE = 'Swimming_vids'
     COORDINATE_COLUMN_NAME = 'coordinates'
-
-    def __init__(self, window,label_var=[],comment_widget=[], multichoice=False):
+    # Clip file name formats, see the parse_clip_names method:
+    CLIP_NAME_PATTERN = re.compile(r'^[^_]*_(?P<frame>\d+)_[^_]*_(?P<x>\d+)-(?P<y>\d+)(?:_|$)')
+    OLD_CLIP_NAME_PATTERN = re.compile(r'^[^e]*e(?P<frame>\d+)f')
+    MANIFEST_COUNT_FRAMES = True  # record the frame count of new clips in the clip manifest, see ClipManifest
+    DEFAULT_FPS = 30  # used when the clip doesn't report its frame rate, the Movie Cutter saves clips at 30 fps
+    SPEED_STEP = 2  # playback speed is multiplied or divided by this factor with the speed hot-keys
+    # Background decoding of the clips around the current one, see the ClipPrefetcher class:
+    PREFETCH_NEIGHBOURS = 2  # number of clips to prefetch before and after the current clip
+    PREFETCH_MEMORY_MB = 1024  # memory budget for decoded clips
+    # Clips are decoded whole into memory, longer clips only keep a window of this many frames, see DecodedClip:
+    CLIP_WINDOW_FRAMES = 500
+
+    def __init__(self, window,label_var=[],comment_widget=[], multichoice=False, use_label_store=False):
         """ Initialize a Movie Player instance.
         Function receives a tkinter window to build the app in.
         An optional label variable is used to interact with the Feeding Label application.
+        If use_label_store is True, label changes are also committed to a SQLite store next to the log file.
         """
         self.window = window
         self.label_var = label_var
@@ -271,14 +365,25 @@ class MoviePlayer:
         self.num_vids = 0  # Total number of videos loaded
         self.panel = tk.Canvas(master=self.window, width=500, height=500)  # Used to display the video
         self.panel.bind("<Configure>", self.resize_frame)
+        self.renderer = FrameRenderer(self.panel)  # Draws the frames onto the panel
         self.directory = None  # Directory where the videos are saved
         self.curr_vid = None   # Current video capture object
+        self.prefetcher = ClipPrefetcher(neighbours=self.PREFETCH_NEIGHBOURS,
+                                         memory_budget_mb=self.PREFETCH_MEMORY_MB,
+                                         window_frames=self.CLIP_WINDOW_FRAMES)
         self.log_filepath = ''  # Log file location
         self.curr_clip_name = ''  # Current Movie file name
         self.file_paths = []  # List of video file paths
         self.snap_idx = 0  # Index to name snapshot files
         self.log = pd.DataFrame()   # Log file dataframe
+        self.log_index = None  # clip_name -> row index over the log, see the LogIndex class
+        self.use_label_store = use_label_store
+        self.label_store = None  # SQLite label store, see the LabelStore class
         self.pause = True  # Play/pause marker, to make the play button function as a pause as well
+        self.engine = None  # Playback engine of the current video
+        self.play_speed = 1  # Playback speed relative to the clip frame rate, kept when switching videos
+        self.play_reverse = False  # Play videos backwards, kept when switching videos
+        self.play_loop = False  # Loop videos instead of stopping at their end, kept when switching videos
         self.define_vid_btn_frm()  # Define the buttons
         self.set_layout()  # Set the GUI layout
         self.window.bind('<Key>',self.handle_keystroke)
@@ -303,6 +408,8 @@ class MoviePlayer:
         self.btn_snapshot = tk.Button(master=self.frm_vid_btns, text='Snapshot', command=self.get_snapshot)
         # Show the frame and the coordinates the video was cut from in the original video:
         self.lbl_frame_centroid = tk.Label(master=self.frm_vid_btns, text='')
+        # Show the playback speed and frame rate:
+        self.lbl_stats = tk.Label(master=self.frm_vid_btns, text='')
 
     def set_layout(self):
         """ Layout all the GUI widgets"""
@@ -313,6 +420,7 @@ class MoviePlayer:
         self.btn_next.grid(row=0, column=4, sticky="e", padx=10)
         self.btn_snapshot.grid(row=0, column=5, sticky="e", padx=10)
         self.lbl_frame_centroid.grid(row=0, column=6, sticky="e", padx=10)
+        self.lbl_stats.grid(row=0, column=7, sticky="e", padx=10)
         self.panel.grid(row=0, column=1, sticky='nsew')
         self.frm_vid_btns.grid(row=1, column=1)
 
@@ -324,23 +432,23 @@ class MoviePlayer:
             return
         # Define pairs of keystrokes and actions in a dictionary:
         key_dict = { "0": self.play_vid, '1': self.get_snapshot, "x": self.prev_vid,
-                     "v": self.next_vid, ',': self.rewind_one_frame, '.': self.display_frame}
+                     "v": self.next_vid, ',': self.rewind_one_frame, '.': self.next_frame,
+                     '[': self.slower, ']': self.faster, 'b': self.toggle_reverse, 'l': self.toggle_loop}
         if event.char in key_dict.keys():
             key_dict[event.char](event)
 
     def resize_frame(self,event=None):
         if self.frame.any():
             resize_shape = min(event.width, event.height)
-            img = PIL.Image.fromarray(self.frame).resize((resize_shape, resize_shape), PIL.Image.ANTIALIAS)
-            self.photo = PIL.ImageTk.PhotoImage(image=img)  # Convert frame to display it on GUI
-            self.panel.create_image(0, 0, image=self.photo, anchor=tk.NW)  # Draw the image in the Panel widget
-            #self.canvas.itemconfig(self.canvas_img, image=self.img)
+            self.renderer.render(self.frame, (resize_shape, resize_shape))  # Draw the image in the Panel widget
             self.resize = True
         else:
             print(self.frame)
 
     def rewind_one_frame(self, event):
-        """ Move one frame backwards in the current video"""
+        """ Move one frame backwards in the current video, the clip is decoded in memory so this doesn't seek
+        the video file."""
+        self.pause_playback()
         # Get the current frame position:
         curr_frame=self.curr_vid.get(cv2.CAP_PROP_POS_FRAMES)
         # Rewind the video capture object so the next we'll display will be previous one:
@@ -348,42 +456,57 @@ class MoviePlayer:
             self.curr_vid.set(cv2.CAP_PROP_POS_FRAMES, curr_frame-2)
             self.display_frame()
 
-    def get_entry(self,clip_name):
-        try:
-            processed_name = clip_name.split('_')
-            frame_num = int(processed_name[1])
-            coords = processed_name[3].split('-')
-            coords = (int(coords[0]), int(coords[1]))
-        except:
-            # filenames are in the old format:
-            try:
-                frame_num = int(clip_name.split('e')[1].split('f')[0])
-            except:
-                frame_num = np.NaN
-            coords = np.NaN
+    @classmethod
+    def parse_clip_names(cls, clip_names):
+        """ Build log entries for a list of clip file names in one vectorized pass, reading the frame and the
+        coordinates the clip was cut from out of the file name.
+        Clips cut by the Movie Cutter are named cutoutframe_[frame]_coords_[x]-[y]_fish[fish_idx].avi, older clips
+        were named cutoutframe[frame]fish[fish_idx].avi and only have the frame number.
+        Returns a DataFrame with one row per clip."""
+        names = pd.Series(list(clip_names), dtype=object)
+        parsed = names.str.extract(cls.CLIP_NAME_PATTERN)
+        old_frames = names.str.extract(cls.OLD_CLIP_NAME_PATTERN)['frame']
+        matched = parsed['frame'].notna()
+        # Names that don't match the current format fall back to the old format, which has no coordinates:
+        frames = parsed['frame'].where(matched, old_frames)
+        coords = [(int(x), int(y)) if match else np.NaN
+                  for match, x, y in zip(matched.values, parsed['x'].values, parsed['y'].values)]
         # As we don't have any of the data about the parent video, we'll leave it blank for the user to fill later:
-        entry= {'clip_name': clip_name, 'parent_video': np.NaN,
-                              'frame': frame_num, 'coordinates': coords,
-                              'comments': '', 'reviewer_label': None}
-        return entry
+        return pd.DataFrame({'clip_name': names, 'parent_video': np.NaN,
+                             'frame': pd.to_numeric(frames).astype('Int64'), 'coordinates': coords,
+                             'comments': '', 'reviewer_label': None})
+
+    def get_entry(self,clip_name):
+        """ Get the log entry of a single clip as a dictionary, see the parse_clip_names method."""
+        return self.parse_clip_names([clip_name]).iloc[0].to_dict()
+
+    def add_missing_entry(self, clip_name):
+        """ Add a row for a clip that isn't in the log, built from its file name."""
+        entry = self.get_entry(clip_name)
+        entry['comments'] = 'Video not found in log'
+        self.log_index.add(entry)
+
+    def clip_directory(self, path):
+        """ Get the directory of a clip, the directory of its clip archive for clips packed in one."""
+        archive_path, _ = ClipArchive.split_path(path)
+        return os.path.dirname(archive_path if archive_path is not None else path)
+
+    def archived_clip_names(self):
+        """ Get the names of the loaded clips that are packed in clip archives."""
+        return {os.path.basename(path) for path in self.file_paths if ClipArchive.split_path(path)[0] is not None}
 
     def handle_missing_log(self):
         """ Create a new log file if no log file exists in the folder"""
-        # Create the dataframe for the log:
-        self.log = pd.DataFrame(columns=['clip_name', 'parent_video', 'frame', 'coordinates', 'comments'])
+        # Create the dataframe for the log from the names of the video files that were loaded:
+        self.log = self.parse_clip_names([os.path.basename(vid) for vid in self.file_paths])
         if self.multichoice:
+            self.log = self.log.drop(columns='reviewer_label')
             for key in self.label_var.keys():
-                if self.column_names[key] not in self.log.columns:
-                    self.log[self.column_names[key]] = 0
+                self.log[self.column_names[key]] = 0
         else:
             self.log['reviewer_label'] = np.NaN
-        for i,vid in enumerate(self.file_paths):
-            # Iterate over the video files that were loaded and enter them as new rows in the dataframe:
-            clip_name = os.path.basename(vid) # Get video name
-            entry = self.get_entry(clip_name)
-            self.log.loc[i, :] = entry
         # Create a filepath for the log:
-        self.log_filepath = os.path.join(os.path.dirname(vid),'log.csv')
+        self.log_filepath = os.path.join(self.clip_directory(self.file_paths[-1]),'log.csv')
         self.log.to_csv(self.log_filepath, index=False)  # Save the csv
 
 
@@ -408,24 +531,37 @@ class MoviePlayer:
         """ Load all videos from user-selected directory to the GUI.
         Loads videos cut by the MovieCutterGUI and the corresponding log file."""
         self.directory = askdirectory() # get directory
-        for root, directories, files in os.walk(self.directory,topdown=True):
-            # Iterate ove all files in the directory:
-            if os.path.basename(root) != self.FOLDERNAME_TO_IGNORE:
-                for filename in files:
-                    # if a file is video add it's path to the video path list:
-                    if filename.endswith('.avi'):
-                        # Join the two strings in order to form the full filepath.
-                        filepath = str(Path(os.path.join(root, filename)))  # Assemble the full path
-                        self.file_paths.append(filepath)  # Add it to the list
-                    elif filename == self.LOG_FILENAME:
-                        # if it's the log.csv file load it to a pandas data frame:
-                        print(filename)
-                        self.load_log(root,filename)
+        # List the videos and log files in the directory tree, skipping the ignored folders. The listing is cached
+        # in a manifest file so reopening a large folder only rescans the directories that changed:
+        manifest = ClipManifest(self.directory, extension=('.avi', ClipArchive.EXTENSION),
+                                ignore=self.FOLDERNAME_TO_IGNORE, log_filename=self.LOG_FILENAME,
+                                count_frames=self.MANIFEST_COUNT_FRAMES)
+        manifest.refresh()
+        manifest.save()
+        print(f'Scanned {manifest.dirs_scanned} directories, {manifest.dirs_reused} unchanged')
+        for filepath in manifest.clip_paths():
+            filepath = str(Path(filepath))  # Assemble the full path
+            if filepath.endswith(ClipArchive.EXTENSION):
+                # Clips packed in a clip archive are browsed through their virtual paths, see ClipArchive:
+                try:
+                    self.file_paths.extend(ClipArchive.open(filepath).clip_paths())
+                except ValueError as error:
+                    # e.g. an archive that is still being written by the Movie Cutter:
+                    print(error)
             else:
-                break
+                self.file_paths.append(filepath)
+        for log_path in manifest.log_paths():
+            # if it's the log.csv file load it to a pandas data frame:
+            print(os.path.basename(log_path))
+            self.load_log(os.path.dirname(log_path), os.path.basename(log_path))
         if self.log.empty:
             # Create a new log file if one doesn't exist:
             self.handle_missing_log()
+        self.index_log()
+        if self.use_label_store:
+            # Restore changes committed to the label store, by this or by other annotators:
+            self.label_store = LabelStore.for_log(self.log_filepath)
+            self.label_store.apply(self.log_index)
         self.num_vids = len(self.file_paths)-1  # Get the total number of videos loaded
         self.lbl_numvids.configure(text='/ '+str(self.num_vids))  # display that number in the designated label
         self.lbl_numvids.update()  # update the gui label
@@ -440,6 +576,29 @@ class MoviePlayer:
             if ans == 'y':
                 raise
 
+    def index_log(self):
+        """ Index the log by clip name, this has to be called again whenever rows are removed from the log."""
+        self.log_index = LogIndex(self.log)
+
+    def set_log_value(self, clip_name, column, value):
+        """ Set the value of a log column for a clip, and commit it to the label store if there is one."""
+        self.log_index.set(clip_name, column, value)
+        if self.label_store:
+            self.label_store.set(clip_name, column, value)
+
+    def save_log(self, other_logs=None):
+        """ Save the log DataFrame to the log csv file, including changes other annotators committed to the
+        label store. Optional other_logs (a file path -> DataFrame dictionary) are saved along with it, the files
+        are replaced only once all of them were written, see ClipFileOps.write_csvs."""
+        if self.label_store:
+            self.label_store.apply(self.log_index)
+        ClipFileOps.write_csvs({self.log_filepath: self.log, **(other_logs or {})})
+
+    def close_label_store(self):
+        if self.label_store:
+            self.label_store.close()
+            self.label_store = None
+
     def handle_play(self, event=None):
         """ Handle play button click, if it is clicked once turn it into a pause button."""
         self.pause = not self.pause  # Now when the "Play" button will be clicked again it will pause the video
@@ -453,6 +612,7 @@ class MoviePlayer:
             if user_selection > self.num_vids:
                 # If the user selected a video index out of range, replace the value with the last video index:
                 user_selection = self.num_vids
+            self.stop_playback()
             self.curr_vid.release()  # release the video capture object
             self.set_vid(user_selection)   # load the new video in the GUI
         except ValueError:
@@ -480,38 +640,40 @@ class MoviePlayer:
         # display a prompt informing the user where the file was saved:
         messagebox.showinfo('Save Snapshot', f'Snapshot saved at {filepath}')
 
+    def next_frame(self, event=None):
+        """ Move one frame forward in the current video"""
+        self.pause_playback()
+        self.display_frame()
+
     def display_frame(self, event=None):
         """Read a single frame from the current video and display it onto the GUI."""
         ret, frame = self.curr_vid.read()  # Read a single frame
+        if not ret:
+            # Reached the end of the video:
+            return
+        self.show_frame(frame)
+
+    def show_frame(self, frame, frame_idx=None):
+        """Display a frame onto the GUI. This is also the display callback of the playback engine."""
         self.frame = frame  # Save that frame
-        img = PIL.Image.fromarray(frame)
+        size = None
         if self.resize:
             resize_shape = min(self.panel.winfo_width(), self.panel.winfo_height())
-            img = img.resize((resize_shape,resize_shape), PIL.Image.ANTIALIAS)
-        self.photo = PIL.ImageTk.PhotoImage(image=img)  # Convert frame to display it on GUI
-        self.panel.create_image(0, 0, image=self.photo, anchor=tk.NW)  # Draw the image in the Panel widget
+            size = (resize_shape, resize_shape)
+        self.renderer.render(frame, size)  # Draw the image in the Panel widget
 
     def get_log_entries(self):
         """ Gets the label and comments fields from the log for the video that is loaded to the GUI"""
+        if self.curr_clip_name not in self.log_index:
+            print('not', self.curr_clip_name)
+            self.add_missing_entry(self.curr_clip_name)
         if self.label_var:
             # Set the label variable to the label of the video in the log dataframe:
-            try:
-                if self.multichoice:
-                    for key, var in self.label_var.items():
-                        var.set(
-                            self.log.loc[self.log.clip_name == self.curr_clip_name, self.column_names[key]].values[0])
-                else:
-                    self.label_var.set(self.log.loc[self.log.clip_name == self.curr_clip_name].reviewer_label.values[0])
-            except:
-                print('not', self.curr_clip_name)
-                entry = self.get_entry(self.curr_clip_name)
-                entry['comments'] = 'Video not found in log'
-                self.log = self.log.append(entry,ignore_index=True)
-                if self.multichoice:
-                    for key, var in self.label_var.items():
-                        var.set(self.log.loc[self.log.clip_name == self.curr_clip_name, self.column_names[key]].values[0])
-                else:
-                    self.label_var.set(self.log.loc[self.log.clip_name == self.curr_clip_name].reviewer_label.values[0])
+            if self.multichoice:
+                for key, var in self.label_var.items():
+                    var.set(self.log_index.get(self.curr_clip_name, self.column_names[key]))
+            else:
+                self.label_var.set(self.log_index.get(self.curr_clip_name, 'reviewer_label'))
             # setting this label_var will also display the label in the labeler GUI
         if self.comment_widget:
             # Write the comment data from the log to the comment entry field
@@ -521,7 +683,7 @@ class MoviePlayer:
                 self.log.to_csv(self.log_filepath, index=False)
 
             # get the text from dataframe:
-            txt = self.log.loc[self.log.clip_name == self.curr_clip_name].comments.values[0]
+            txt = self.log_index.get(self.curr_clip_name, 'comments')
             if pd.isnull(txt):
                 # change the dataframe's null value to present an empty string in the GUI:
                 txt = ''
@@ -540,43 +702,119 @@ class MoviePlayer:
         self.ent_vid_idx.insert(0, self.curr_vid_idx)  # write the current index
         # Change current movie name:
         self.curr_clip_name = os.path.basename(self.file_paths[self.curr_vid_idx])
+        if self.label_store:
+            # Pick up changes other annotators made to this clip:
+            self.label_store.apply(self.log_index, self.curr_clip_name)
         # If integrated with the FeedingLabeler GUI, get the label and comments from the log:
         self.get_log_entries()
         # Display the frame and coordinates (in the original video) from which this video was cut:
-        txt = self.log.loc[self.log.clip_name == self.curr_clip_name,
-                              ['frame', self.COORDINATE_COLUMN_NAME]].to_string(index=False)  # retrieve the relevant data
+        txt = self.log_index.get_row(self.curr_clip_name,
+                                     ['frame', self.COORDINATE_COLUMN_NAME]).to_string(index=False)  # retrieve the relevant data
         self.lbl_frame_centroid.configure(text=txt)  # display the text in the widget
-        # And finally, open the video file:
-        self.curr_vid = cv2.VideoCapture(self.file_paths[self.curr_vid_idx])
+        # And finally, get the decoded video from the prefetcher and start decoding the videos around it:
+        self.panel.delete('load_error')  # the message of a clip that couldn't be loaded
+        try:
+            self.curr_vid = self.prefetcher.get(self.file_paths[self.curr_vid_idx])
+        except Exception as error:
+            self.curr_vid = UnreadableClip(self.file_paths[self.curr_vid_idx], f'{type(error).__name__}: {error}')
+        self.prefetcher.prefetch_neighbours(self.file_paths, self.curr_vid_idx)
+        if isinstance(self.curr_vid, UnreadableClip):
+            self.show_load_error()
+            return
+        self.engine = PlaybackEngine(self.window, self.curr_vid, lambda idx, frame: self.show_frame(frame, idx),
+                                     fps=self.curr_vid.get(cv2.CAP_PROP_FPS) or self.DEFAULT_FPS,
+                                     speed=self.play_speed, reverse=self.play_reverse, loop=self.play_loop,
+                                     end_callback=self.on_playback_end,
+                                     stats_callback=self.display_playback_stats)
         self.display_frame()  # display the first frame in the video
         self.window.title(self.curr_clip_name)  # change the GUI title to the current video name
         # Start playing the video automatically when a new video is set
-        self.handle_play()
-        self.play_vid()   # event is set to True so that the play button would be handled as if clicked
-
-    def play_vid(self,event=None,play_speed=5):
-        """ This method plays the video file currently loaded to the GUI.
-        The video is played by recursively calling this method using the window.after() tkinter method.
-        The method will stop when the video is paused or reaches its end.
+        self.pause = False
+        self.engine.start()
+
+    def show_load_error(self):
+        """ Show a message instead of the frames of a clip that couldn't be decoded, the labels and the navigation
+        still work. The clip is decoded again the next time it is visited."""
+        print(f'Could not load {self.curr_vid.path}: {self.curr_vid.error}')
+        self.engine = None
+        self.pause = True
+        if self.frame.ndim == 2:
+            self.show_frame(np.zeros_like(self.frame))  # clear the frame of the previous clip
+        self.panel.create_text(250, 250, text='Could not load video', fill='white', tags='load_error')
+        self.window.title(self.curr_clip_name)
+
+    def play_vid(self,event=None):
+        """ This method plays the video file currently loaded to the GUI, at the clip's frame rate.
+        Frames are decoded on a background thread by the playback engine and displayed on the main loop,
+        see the PlaybackEngine class for details.
         This method is invoked either by pressing the play button, or by pressing the 0 key.
-
         """
         if event:
             # if the method was invoked via key stroke, then call the method that handles the play/pause functionality:
             self.handle_play()
-
-        try:
-            # Now, as long as pause isn't pressed, and the video doesn't end, sequentially display frames:
-            if not self.pause:
-                # pause hasn't been pressed
-                self.display_frame()  # display a single frame
-                # The main driving force behind the method, recursively calling the method again after 15 milliseconds:
-                self.window.after(play_speed, self.play_vid)
-        except AttributeError:
-            # If the video reached its end tkinter will raise an AttributeError, we'll catch it and reset the video:
-            self.curr_vid.set(cv2.CAP_PROP_POS_FRAMES, 0)  # Rewind the video capture object to frame
-            self.display_frame()  # display the first frame
-            self.pause = not self.pause  # Change the status of the play/pause button from "Pause" to "Play"
+        if not self.engine:
+            return
+        if not self.pause:
+            self.engine.start()
+        else:
+            self.engine.stop()
+            self.display_playback_stats()
+
+    def stop_playback(self):
+        """ Stop the playback engine of the current video, e.g. before releasing the video."""
+        if self.engine:
+            self.engine.stop()
+
+    def pause_playback(self):
+        """ Pause the video if it is playing, used before navigating the video frame by frame."""
+        if not self.pause:
+            self.pause = True
+            self.play_vid()
+
+    def on_playback_end(self):
+        """ When the video reaches its end (or its start when playing backwards), rewind it and display the
+        first frame."""
+        self.curr_vid.set(cv2.CAP_PROP_POS_FRAMES, 0)  # Rewind the video capture object to frame
+        self.display_frame()  # display the first frame
+        self.pause = True  # Change the status of the play/pause button from "Pause" to "Play"
+        self.display_playback_stats()
+
+    def faster(self, event=None):
+        self.set_speed(self.play_speed * self.SPEED_STEP)
+
+    def slower(self, event=None):
+        self.set_speed(self.play_speed / self.SPEED_STEP)
+
+    def toggle_reverse(self, event=None):
+        """ Switch between playing forwards and backwards, starting playback if the video is paused."""
+        self.play_reverse = not self.play_reverse
+        if not self.engine:
+            return
+        self.engine.set_reverse(self.play_reverse)
+        if self.pause:
+            self.pause = False
+            self.play_vid()
+        self.display_playback_stats()
+
+    def toggle_loop(self, event=None):
+        """ Switch looping the video on and off."""
+        self.play_loop = not self.play_loop
+        if self.engine:
+            self.engine.loop = self.play_loop
+            self.display_playback_stats()
+
+    def set_speed(self, speed):
+        """ Set the playback speed relative to the clip frame rate."""
+        self.play_speed = PlaybackEngine.clamp_speed(speed)
+        if self.engine:
+            self.engine.set_speed(self.play_speed)
+            self.display_playback_stats()
+
+    def display_playback_stats(self, stats=None):
+        """ Show the playback speed, the achieved versus the target frame rate, the rendering time and the
+        clip cache stats."""
+        self.lbl_stats.configure(text=f'{self.engine.report()}  {self.renderer.ms_per_frame:.1f} ms/frame  '
+                                      f'{self.prefetcher.report()}')
 
     def next_vid(self,event=None):
         """Load the next video in the video list.
@@ -586,6 +824,7 @@ class MoviePlayer:
             if isinstance(event.widget, tk.Entry):
                 return
         if self.curr_vid:
+            self.stop_playback()
             self.curr_vid.release()   # Release the current video capture object
         new_idx = self.curr_vid_idx + 1  # Set the new video index
         if new_idx > self.num_vids:
@@ -601,6 +840,7 @@ class MoviePlayer:
             # When typing into an entry, don't activate hot-keys
             if isinstance(event.widget, tk.Entry):
                 return
+        self.stop_playback()
         self.curr_vid.release()  # Release the current video capture object
         new_idx = self.curr_vid_idx - 1
         if new_idx < 0:
@@ -0,0 +1,46 @@
+import pandas as pd
+
+
+class LogIndex:
+    """ A clip_name -> row index over a clip log DataFrame, for constant time reads and writes of a single clip's
+    fields. The log DataFrame itself is left as is (same columns, same row order), so it can still be saved to
+    the same csv file. If a clip name appears more than once in the log, the first row is used.
+    The index has to be rebuilt whenever rows are added to or removed from the log, except for rows added with
+    the add method."""
+    # Columns that hold free text, these are kept as object columns so writing a string into a column that was
+    # loaded as all-NaN floats doesn't have to upcast the whole column:
+    TEXT_COLUMNS = ['reviewer_label', 'comments', 'label']
+
+    def __init__(self, log):
+        """ Index a log DataFrame by its clip_name column."""
+        self.log = log
+        for column in self.TEXT_COLUMNS:
+            if column in self.log.columns and self.log[column].dtype != object:
+                self.log[column] = self.log[column].astype(object)
+        # Reverse the rows so the first occurrence of a clip name wins:
+        self.rows = dict(zip(self.log['clip_name'].values[::-1], self.log.index.values[::-1]))
+
+    def __contains__(self, clip_name):
+        return clip_name in self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get(self, clip_name, column):
+        """ Get the value of a column for a clip. Raises KeyError if the clip is not in the log."""
+        return self.log.at[self.rows[clip_name], column]
+
+    def get_row(self, clip_name, columns):
+        """ Get the values of several columns for a clip as a single row DataFrame."""
+        return self.log.loc[[self.rows[clip_name]], columns]
+
+    def set(self, clip_name, column, value):
+        """ Set the value of a column for a clip. Raises KeyError if the clip is not in the log."""
+        self.log.at[self.rows[clip_name], column] = value
+
+    def add(self, entry):
+        """ Append a new row to the log from a dictionary of column values and index it."""
+        row = self.log.index.max() + 1 if len(self.log) > 0 else 0
+        self.log.loc[row] = pd.Series(entry)
+        self.rows.setdefault(entry['clip_name'], row)
+        return row
@@ -0,0 +1,219 @@
+import math
+import os
+import tkinter as tk
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from FrameRenderer import FrameRenderer
+from ClipArchive import open_capture
+
+
+class MosaicView:
+    """ A triage view of the Labeler that plays a grid of downscaled clips at once, so obvious cases can be labeled
+    without opening every clip in the Movie Player.
+    The clips of the current page are decoded and downscaled by a background thread pool, the clips of the next
+    page are decoded once the current page is done. Decoded clips are limited to a memory budget, clips longer than
+    the per-clip share of the budget are subsampled in time.
+    All tiles are composed into one image that is drawn once per frame through a FrameRenderer.
+    Keys: the arrow keys or a mouse click select a tile, the Labeler's label keys label the selected tile,
+    Page Up / Page Down move between pages and Escape closes the view. Labels are written through
+    Labeler.set_label, the same log path as labeling in the Movie Player."""
+    BACKGROUND = 40  # gray level of tiles that are still decoding
+    SELECTION_COLOR = 'yellow'
+    LABEL_COLOR = 'cyan'
+
+    def __init__(self, labeler, rows=4, cols=4, tile_size=160, fps=30, memory_budget_mb=256, max_workers=4):
+        """ Open a mosaic view on the videos loaded in a Labeler. inputs:
+        labeler - the Labeler (or a subclass) whose Movie Player holds the loaded videos
+        rows, cols - grid size
+        tile_size - width and height of each tile in pixels
+        fps - playback frame rate of the tiles
+        memory_budget_mb - maximal memory used by decoded tiles, for the current and the next page
+        max_workers - number of decoding threads"""
+        self.labeler = labeler
+        self.player = labeler.player
+        self.rows = rows
+        self.cols = cols
+        self.tile_size = tile_size
+        self.fps = fps
+        self.page_size = rows * cols
+        # Each clip gets an equal share of the budget, for the current and the next page:
+        self.max_frames = max(1, int(memory_budget_mb * 2 ** 20 / (2 * self.page_size * tile_size ** 2)))
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.cache = OrderedDict()  # clip path -> future of the downscaled frames array
+        self.page = self.player.curr_vid_idx // self.page_size
+        self.selected = self.player.curr_vid_idx % self.page_size
+        self.frame_counter = 0
+        self.mosaic = np.full((rows * tile_size, cols * tile_size), self.BACKGROUND, dtype='uint8')
+        self._after_id = None
+
+        self.window = tk.Toplevel(labeler.window)
+        self.window.wm_title('Mosaic View')
+        self.canvas = tk.Canvas(master=self.window, width=cols * tile_size, height=rows * tile_size,
+                                highlightthickness=0)
+        self.canvas.grid(row=0, column=0)
+        self.lbl_page = tk.Label(master=self.window, text='')
+        self.lbl_page.grid(row=1, column=0, sticky='ew')
+        self.renderer = FrameRenderer(self.canvas)
+        self.window.bind('<Key>', self.handle_keystroke)
+        self.canvas.bind('<Button-1>', self.handle_click)
+        self.window.wm_protocol('WM_DELETE_WINDOW', self.on_close)
+        self.window.focus_set()
+        self.show_page()
+        self._tick()
+
+    @property
+    def num_pages(self):
+        return math.ceil(len(self.player.file_paths) / self.page_size)
+
+    def page_paths(self, page):
+        """ Get the video paths of a page."""
+        return self.player.file_paths[page * self.page_size:(page + 1) * self.page_size]
+
+    def decode(self, path):
+        """ Decode a clip into an array of grayscale tiles, subsampled in time if it has more than max_frames
+        frames. Runs on the decoding threads."""
+        cap = open_capture(path)
+        num_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        step = max(1, math.ceil(num_frames / self.max_frames))
+        tiles = np.empty((min(max(num_frames, 1), self.max_frames), self.tile_size, self.tile_size), dtype='uint8')
+        count = 0
+        frame_idx = 0
+        while count < len(tiles):
+            if frame_idx % step:
+                # Skipped frames are only grabbed, not decoded:
+                if not cap.grab():
+                    break
+            else:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if frame.ndim == 3:
+                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                cv2.resize(frame, (self.tile_size, self.tile_size), dst=tiles[count], interpolation=cv2.INTER_AREA)
+                count += 1
+            frame_idx += 1
+        cap.release()
+        return tiles[:count]
+
+    def request(self, paths):
+        """ Start decoding clips that aren't decoded or decoding yet."""
+        for path in paths:
+            if path not in self.cache:
+                self.cache[path] = self.executor.submit(self.decode, path)
+
+    def evict(self, keep):
+        """ Drop the decoded clips that are not in keep, clips that haven't started decoding are cancelled."""
+        for path in list(self.cache):
+            if path not in keep:
+                self.cache.pop(path).cancel()
+
+    def show_page(self):
+        """ Start decoding the current page, and draw the tile labels and the selection."""
+        paths = self.page_paths(self.page)
+        self.selected = min(self.selected, len(paths) - 1)
+        self.evict(set(paths) | set(self.page_paths(self.page + 1)))
+        self.request(paths)
+        self.mosaic[:] = self.BACKGROUND
+        self.frame_counter = 0
+        self.lbl_page.configure(text=f'Page {self.page + 1} / {self.num_pages}')
+        self.draw_labels()
+        self.draw_selection()
+
+    def tile_origin(self, tile):
+        """ Get the top left corner of a tile, in pixels."""
+        return (tile % self.cols) * self.tile_size, (tile // self.cols) * self.tile_size
+
+    def tile_label(self, clip_name):
+        """ Get the label text of a clip from the log."""
+        log = self.player.log
+        if self.labeler.LABEL_MULTICHOICE:
+            labels = [label for label, column in self.player.column_names.items()
+                      if column in log.columns and self.player.log_index.get(clip_name, column) == 1]
+            return ', '.join(labels)
+        label = self.player.log_index.get(clip_name, 'reviewer_label')
+        return label if isinstance(label, str) else ''
+
+    def draw_labels(self):
+        self.canvas.delete('label')
+        for tile, path in enumerate(self.page_paths(self.page)):
+            clip_name = os.path.basename(path)
+            text = self.tile_label(clip_name) if clip_name in self.player.log_index else ''
+            x, y = self.tile_origin(tile)
+            self.canvas.create_text(x + 4, y + 4, text=text, anchor=tk.NW, fill=self.LABEL_COLOR,
+                                    width=self.tile_size - 8, tags='label')
+
+    def draw_selection(self):
+        self.canvas.delete('selection')
+        x, y = self.tile_origin(self.selected)
+        self.canvas.create_rectangle(x + 1, y + 1, x + self.tile_size - 1, y + self.tile_size - 1,
+                                     outline=self.SELECTION_COLOR, width=2, tags='selection')
+
+    def _tick(self):
+        """ Compose the next frame of every decoded tile into the mosaic and draw it."""
+        paths = self.page_paths(self.page)
+        pending = False
+        for tile, path in enumerate(paths):
+            future = self.cache.get(path)
+            if future is None or not future.done():
+                pending = True
+                continue
+            if future.cancelled() or future.exception() is not None:
+                continue
+            tiles = future.result()
+            if len(tiles):
+                x, y = self.tile_origin(tile)
+                # Tiles loop independently of each other's length:
+                self.mosaic[y:y + self.tile_size, x:x + self.tile_size] = tiles[self.frame_counter % len(tiles)]
+        if not pending:
+            # The current page is ready, decode the next one in the background:
+            self.request(self.page_paths(self.page + 1))
+        self.renderer.render(self.mosaic)
+        self.canvas.tag_raise('label')
+        self.canvas.tag_raise('selection')
+        self.frame_counter += 1
+        self._after_id = self.window.after(max(1, int(1000 / self.fps)), self._tick)
+
+    def select(self, tile):
+        if 0 <= tile < len(self.page_paths(self.page)):
+            self.selected = tile
+            self.draw_selection()
+
+    def change_page(self, step):
+        page = self.page + step
+        if 0 <= page < self.num_pages:
+            self.page = page
+            self.show_page()
+
+    def label_selected(self, label):
+        """ Label the selected tile through the Labeler."""
+        path = self.page_paths(self.page)[self.selected]
+        self.labeler.set_label(clip_name=os.path.basename(path), label=label)
+        self.draw_labels()
+        # Move on to the next tile, which is usually the next one to triage:
+        self.select(self.selected + 1)
+
+    def handle_keystroke(self, event):
+        moves = {'Left': -1, 'Right': 1, 'Up': -self.cols, 'Down': self.cols}
+        if event.keysym in moves:
+            self.select(self.selected + moves[event.keysym])
+        elif event.keysym == 'Next':
+            self.change_page(1)
+        elif event.keysym == 'Prior':
+            self.change_page(-1)
+        elif event.keysym == 'Escape':
+            self.on_close()
+        elif event.char in self.labeler.KEYS_TO_LABELS:
+            self.label_selected(self.labeler.KEYS_TO_LABELS[event.char])
+
+    def handle_click(self, event):
+        self.select((event.y // self.tile_size) * self.cols + event.x // self.tile_size)
+
+    def on_close(self):
+        if self._after_id is not None:
+            self.window.after_cancel(self._after_id)
+            self._after_id = None
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.cache.clear()
+        self.window.destroy()
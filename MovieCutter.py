@@ -1,18 +1,37 @@
 from imutils.video import FPS
+import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
 import pandas as pd
 from datetime import datetime
 from SEQReader import SEQReader
+from ClipArchive import ClipArchive, ClipArchiveWriter
+from ClipTensorExport import ClipTensorWriter
+from ActivityIndex import ActivityIndex
+from CropEngine import CropEngine, compute_bounds
+from CentroidTracker import CentroidTracker
 import warnings
 
 
 
 class MovieProcessor:
     """Process videos to detect fish larvae using classic image processing with OpenCV."""
+    TRAIN_CACHE_MB = 1024  # memory budget for the decoded background subtractor training frames, per video
+    ROI_SUFFIX = '.roi.json'  # the region of interest of a video is saved next to it, as [video path].roi.json
+    CLOSE_KERNEL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (10, 10))  # kernel for closing gaps in the edges
+    # Margin around a tile of the tiled edge mask, the reach of the edge branch: 35 pixels of the 71x71 blur, 2 of
+    # Canny (Sobel and non-maximum suppression) and 10 of the closing (dilation and erosion with the 10x10 kernel):
+    TILE_OVERLAP = 48
+    # Largest edge_scale the downsampled edge branch still finds the fish of the full resolution one with, at 8 a
+    # larva is only about 3 pixels wide in the downsampled frame:
+    MAX_EDGE_SCALE = 4
     def __init__(self,vid_path, save_dir, brighten=50, blur=(0,0), min_width=70, min_height=70,
-                 apply_brightness=False, num_train_frame=500, fps=30, start_frame=0, frame_limit=1000):
+                 apply_brightness=False, num_train_frame=500, fps=30, start_frame=0, frame_limit=1000,
+                 bg_cache=None, roi=None, edge_scale=1, tiles=None):
         """Initiate a processor object. inputs:
         vid_path - location of the video to process
         save_dir - location to save the processed video
@@ -26,8 +45,19 @@ class MovieProcessor:
         num_train_frame - number of frames used to train the background subtractor
         fps - define the rate of frames per second for the processed video output
         start_frame  - set the frame from which to start the processing of the video
-        frame_limit - set how many frames will be used for the processing preview in process_vid method"""
+        frame_limit - set how many frames will be used for the processing preview in process_vid method
+        bg_cache - optional, a BackgroundCache to reuse the background models trained for the video in earlier runs
+        roi - optional, region of interest to detect fish in, a polygon as a list of (x, y) frame coordinates or
+              the path of a saved ROI file (e.g. one shared by all the videos of a rig). By default the ROI saved
+              for the video is used if there is one, otherwise the whole frame
+        edge_scale - approximate the edge mask of the detection on a frame downsampled by this factor (see
+                     edge_mask_downsampled), 1, 2 or 4. 1 (the default) computes it at full resolution. Can't be
+                     combined with tiles
+        tiles - optional, (rows, columns) grid of overlapping tiles to compute the full resolution edge mask on, in
+                parallel on a thread pool (see edge_mask_tiled). The mask is the same as computed on the whole
+                frame, None (the default) computes it on the whole frame. Only with edge_scale 1"""
         warnings.filterwarnings('ignore')
+        self.check_edge_settings(edge_scale, tiles)
         self.vid_path = vid_path
         self.folder_path = save_dir
         self.min_width = min_width  # minimal blob width
@@ -68,7 +98,7 @@ class MovieProcessor:
         # The bbox_dict will house the coordinates and dimensions of the bounding boxes around the detected objects,
         # as well as the centroids of these bounding boxes:
         self.bbox_dict = {}
-        self.contour_dict = {}
+        self.blob_contours = {}  # bounding box -> contour of the detected blobs
         self.rotated_dict = {}
         self.bbox_rotated_dict = {}
         self.frame = None # video frame, initialize at nobe
@@ -77,6 +107,36 @@ class MovieProcessor:
         self.start_frame = start_frame  # set the frame of the video where processing will start
         self.frame_limit = frame_limit
         self.apply_brightness = apply_brightness # Apply the brightness adjustment to the saved video
+        # The grayscale training frames are kept in memory, so retraining after a change of settings doesn't decode
+        # them again:
+        self.train_cache = []
+        self.train_cache_start = None  # frame index of the first cached training frame
+        # Settings the background subtractor was trained with, None if it isn't trained:
+        self.trained_params = None
+        self.bg_cache = bg_cache
+        # Region of interest, detection runs on its bounding rectangle and ignores everything outside the polygon:
+        self.roi = None  # polygon, list of (x, y) points
+        self.roi_rect = (0, 0, self.SHAPE[0], self.SHAPE[1])  # (x1, y1, x2, y2) of the cropped detection area
+        self.roi_mask = None  # the polygon inside the rectangle, 255 inside and 0 outside
+        self.edge_scale = edge_scale
+        # Per frame images are written into these buffers (name -> array), see _buffer:
+        self._buffers = {}
+        self.tiles = tiles
+        self._tile_pool = None  # thread pool of the tiled edge mask, created on first use
+        self._tile_grid = None  # (frame shape, tiles, [(core, padded tile) slices of every tile])
+        if roi is None and os.path.isfile(vid_path + self.ROI_SUFFIX):
+            roi = vid_path + self.ROI_SUFFIX
+        self.set_roi(self.load_roi(roi) if isinstance(roi, str) else roi)
+
+    @staticmethod
+    def check_edge_settings(edge_scale, tiles):
+        """ Raise a ValueError if the edge mask settings are invalid: edge_scale has to be a power of two up to
+        MAX_EDGE_SCALE, and tiles only apply to the full resolution edge mask."""
+        if edge_scale < 1 or edge_scale & (edge_scale - 1) or edge_scale > MovieProcessor.MAX_EDGE_SCALE:
+            raise ValueError(f'edge_scale has to be a power of two up to {MovieProcessor.MAX_EDGE_SCALE}, '
+                             f'got {edge_scale}')
+        if tiles is not None and edge_scale > 1:
+            raise ValueError('tiles only apply to the full resolution edge mask, use them with edge_scale 1')
 
     @staticmethod
     def get_centroid(x, y, w, h):
@@ -91,6 +151,81 @@ class MovieProcessor:
         else:
             self.cap.frame_pointer = self.start_frame-1
 
+    def tell(self):
+        """ Get the index of the next frame to be read."""
+        if self.avi:
+            return int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+        return self.cap.frame_pointer + 1
+
+    def seek(self, idx):
+        """ Set the index of the next frame to be read."""
+        if self.avi:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+        else:
+            self.cap.frame_pointer = idx - 1
+
+    def set_roi(self, polygon):
+        """ Restrict the detection to a polygon, a list of at least 3 (x, y) points, or to the whole frame if
+        polygon is None. The background subtractor has to be trained again after the ROI changes.
+        Raises a ValueError if the polygon doesn't cover any pixel of the frame."""
+        if polygon is None or len(polygon) < 3:
+            self.roi, self.roi_mask = None, None
+            self.roi_rect = (0, 0, self.SHAPE[0], self.SHAPE[1])
+            return
+        points = np.array([(int(x), int(y)) for x, y in polygon], dtype='int32')
+        x, y, w, h = cv2.boundingRect(points)
+        x1, y1 = max(x, 0), max(y, 0)
+        x2, y2 = min(x + w, self.SHAPE[0]), min(y + h, self.SHAPE[1])
+        if x2 <= x1 or y2 <= y1:
+            raise ValueError(f'The ROI {polygon} is outside the {self.SHAPE[0]}x{self.SHAPE[1]} frame')
+        self.roi = [(int(x), int(y)) for x, y in polygon]
+        self.roi_rect = (x1, y1, x2, y2)
+        self.roi_mask = np.zeros((y2 - y1, x2 - x1), dtype='uint8')
+        cv2.fillPoly(self.roi_mask, [points - (x1, y1)], 255)
+
+    @staticmethod
+    def load_roi(path):
+        """ Read a polygon saved by save_roi."""
+        with open(path) as file:
+            return json.load(file)['polygon']
+
+    def save_roi(self, path=None):
+        """ Save the ROI polygon, to the video's ROI file by default. Without an ROI the file is removed."""
+        path = self.vid_path + self.ROI_SUFFIX if path is None else path
+        if self.roi is None:
+            if os.path.isfile(path):
+                os.remove(path)
+            return
+        with open(path, 'w') as file:
+            json.dump({'polygon': self.roi, 'frame_size': self.SHAPE}, file)
+
+    def crop(self, frame):
+        """ Get the part of a frame inside the ROI bounding rectangle, a view of the frame."""
+        x1, y1, x2, y2 = self.roi_rect
+        return frame[y1:y2, x1:x2]
+
+    def _buffer(self, name, shape, dtype='uint8'):
+        """ Get a reusable image buffer (uint8 by default), a new one is only allocated when the shape changes (e.g. a
+        new ROI)."""
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != tuple(shape):
+            buffer = self._buffers[name] = np.empty(shape, dtype=dtype)
+        return buffer
+
+    def to_gray(self, frame):
+        """ Convert a frame read from an AVI file to grayscale, into a reused buffer."""
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._buffer('frame', frame.shape[:2]))
+
+    def preprocess(self, frame):
+        """ Blur and brighten the ROI of a grayscale frame for the background subtractor, into a reused buffer.
+        The frame itself is left untouched."""
+        crop = self.crop(frame)
+        gray = self._buffer('gray', crop.shape)
+        # apply gaussian blur, default kernel size is set to 0 so that no blurring occurs
+        src = cv2.GaussianBlur(crop, self.blur, 0, dst=gray) if self.blur[0] != 0 else crop
+        # Apply brightness adjustment to image, if brighten=0 image will remain unchanged:
+        return cv2.convertScaleAbs(src, dst=gray, alpha=1, beta=self.brighten)
+
     def get_contours(self):
         """ Get the blobs/contours/fish detected in the image.
         Each blob gets an entry in the bbox_dict - the key is the bounding box coordinates and dimensions,
@@ -99,7 +234,9 @@ class MovieProcessor:
 
         # find all contours/blobs in the frame:
         self.bbox_dict = {}
-        contours, hierarchy = cv2.findContours(self.combined, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_TC89_L1)
+        # The mask covers the ROI rectangle, offset the contours back to full frame coordinates:
+        contours, hierarchy = cv2.findContours(self.combined, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_TC89_L1,
+                                               offset=self.roi_rect[:2])
         for (i, contour) in enumerate(contours):
             # for each detected object/blob/contour
             # Get the bounding box:
@@ -120,27 +257,27 @@ class MovieProcessor:
             self.bbox_dict[(x, y, w, h)] = centroid
             self.rotated_dict[centroid] = rotated_box
             self.bbox_rotated_dict[centroid] = bounding_rotated_box
-            self.contour_dict[(x,y,w,h)] = contour
+            self.blob_contours[(x,y,w,h)] = contour
 
     def draw_boxes(self):
         """ Draw bounding boxes around objects in image
         """
         BOUNDING_BOX_COLOUR = (255, 10, 0)  # BGR instead of RGB
         CENTROID_COLOUR = (255, 192, 0)  # BGR instead of RGB
-        gray = self.frame.copy() #cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)   # convert the image to grayscale
+        # cut the blobs out of the frame and calculate the Laplacian as a measure of image blurriness, before
+        # anything is drawn on the frame:
+        laplacians = [cv2.Laplacian(self.frame[y:y + h, x:x + w], cv2.CV_64F).var() for x, y, w, h in self.bbox_dict]
         # begin depicting the processing by using the base frame, brighten it if the apply brightness is set to True
         # else use the original video frame:
         if self.apply_brightness:
-            self.processed_frame = cv2.convertScaleAbs(self.frame, alpha=1, beta=self.brighten)
+            self.processed_frame = cv2.convertScaleAbs(self.frame, dst=self._buffer('processed', self.frame.shape),
+                                                       alpha=1, beta=self.brighten)
         else:
             self.processed_frame = self.frame
 
-        for bbox, centroid in self.bbox_dict.items():
+        for (bbox, centroid), lap in zip(self.bbox_dict.items(), laplacians):
             # for each blob detected
             x, y, w, h = bbox
-            # cut only the blob out of the grayscale and calculate the Laplacian as a measure of image blurriness:
-            subframe = gray[y:y + h,x:x + w]
-            lap = cv2.Laplacian(subframe, cv2.CV_64F).var()
             # Draw the bounding box and centroid on the processed frame:
             cv2.rectangle(self.processed_frame, (x, y), (x + w - 1, y + h - 1),
                           BOUNDING_BOX_COLOUR, 4)
@@ -165,53 +302,171 @@ class MovieProcessor:
             if grabbed:
                 if self.avi:
                     gray = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)  # Turn to grayscale
-        # First set the new frame for tmp processing:
-        gray = self.frame.copy()
-        # Apply gaussian blur to image using the kernel size defined by user:
-        if self.blur[0] != 0:
-            gray = cv2.GaussianBlur(gray, self.blur, 0)
-        # Apply brightness adjustment to image, if brighten=0 image will remain unchanged:
-        gray = cv2.convertScaleAbs(gray, alpha=1, beta=self.brighten)
+        # Blur and brighten the ROI of the frame, all the intermediate images are reused buffers:
+        gray = self.preprocess(self.frame)
         # Calculate the foreground mask using the trained background subtractor:
-        self.fg_mask = self.bg_sub.apply(gray, None, 0.001)
+        self.fg_mask = self.bg_sub.apply(gray, self._buffer('fg_mask', gray.shape), 0.001)
         # Now for the edge detection:
+        if self.edge_scale > 1:
+            closing = self.edge_mask_downsampled(gray)
+        elif self.tiles is not None:
+            closing = self.edge_mask_tiled(gray)
+        else:
+            closing = self.edge_mask(gray)
+        # get the areas that are detected by both the bg-sub and the edge detection routine:
+        self.combined = cv2.bitwise_and(self.fg_mask, closing, dst=self._buffer('combined', gray.shape))
+        if self.roi_mask is not None:
+            # Drop detections outside the ROI polygon (tank walls, rims and reflections):
+            cv2.bitwise_and(self.combined, self.roi_mask, dst=self.combined)
+
+    def edge_mask(self, gray, tile=''):
+        """ The edge branch of get_filter, finds the outlines of the fish but not of the small particles floating in
+        the water. The intermediate images go to the buffers of the tile (the whole frame by default)."""
         # Blur out the small particle floating in the water:
-        denoise_background = cv2.GaussianBlur(gray, (71, 71), 0)
+        denoise_background = cv2.GaussianBlur(gray, (71, 71), 0, dst=self._buffer('denoise' + tile, gray.shape))
         # get edges from the blurred image to filter out small floating particles:
-        img = cv2.Canny(denoise_background, 10, 10)
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (10, 10))  # Define the kernel for closing gaps
-        closing = cv2.morphologyEx(img, cv2.MORPH_CLOSE, kernel)  # fill in gaps in the edges
-        opening = cv2.morphologyEx(closing, cv2.MORPH_OPEN, kernel)
-        # Dilate to merge adjacent blobs
-        dilation = cv2.dilate(opening, kernel, iterations=2)
-        # get the areas that are detected by both the bg-sub and the edge detection routine:
-        self.combined = cv2.bitwise_and(self.fg_mask, closing)
+        img = cv2.Canny(denoise_background, 10, 10, edges=self._buffer('edges' + tile, gray.shape))
+        # fill in gaps in the edges:
+        return cv2.morphologyEx(img, cv2.MORPH_CLOSE, self.CLOSE_KERNEL, dst=self._buffer('closing' + tile, gray.shape))
+
+    def tile_grid(self, shape):
+        """ Split a frame into the tiles grid, returns the (core, padded tile) slices of every tile. The cores cover
+        the frame without overlapping, every tile is its core plus TILE_OVERLAP pixels on each side (inside the
+        frame)."""
+        if self._tile_grid is None or self._tile_grid[:2] != (shape, tuple(self.tiles)):
+            rows = np.linspace(0, shape[0], self.tiles[0] + 1).astype(int)
+            cols = np.linspace(0, shape[1], self.tiles[1] + 1).astype(int)
+            grid = []
+            for y1, y2 in zip(rows[:-1], rows[1:]):
+                for x1, x2 in zip(cols[:-1], cols[1:]):
+                    top, left = max(y1 - self.TILE_OVERLAP, 0), max(x1 - self.TILE_OVERLAP, 0)
+                    bottom, right = min(y2 + self.TILE_OVERLAP, shape[0]), min(x2 + self.TILE_OVERLAP, shape[1])
+                    # The core in frame coordinates and in the coordinates of the padded tile:
+                    grid.append(((slice(y1, y2), slice(x1, x2)), (slice(top, bottom), slice(left, right)),
+                                 (slice(y1 - top, y2 - top), slice(x1 - left, x2 - left))))
+            self._tile_grid = (shape, tuple(self.tiles), grid)
+        return self._tile_grid[2]
+
+    def edge_mask_tiled(self, gray):
+        """ The edge branch of get_filter computed on overlapping tiles in parallel, on a thread pool (OpenCV
+        releases the GIL). Every tile is padded by TILE_OVERLAP pixels, the reach of the blur, Canny and closing, so
+        the core of each tile is computed from the same pixels as on the whole frame and the stitched mask is the
+        same."""
+        if self._tile_pool is None:
+            self._tile_pool = ThreadPoolExecutor(max_workers=self.tiles[0] * self.tiles[1])
+        closing = self._buffer('closing', gray.shape)
+
+        def edge_tile(i, core, padded, tile_core):
+            closing[core] = self.edge_mask(gray[padded], tile=f'_tile{i}')[tile_core]
+
+        futures = [self._tile_pool.submit(edge_tile, i, *slices)
+                   for i, slices in enumerate(self.tile_grid(gray.shape))]
+        for future in futures:
+            future.result()  # wait for all the tiles, raises the errors of the tiles
+        return closing
+
+    def close_tile_pool(self):
+        """ Stop the threads of the tiled edge mask, a new pool is started if the edge mask is needed again."""
+        if self._tile_pool is not None:
+            self._tile_pool.shutdown()
+            self._tile_pool = None
+
+    def edge_mask_downsampled(self, gray):
+        """ An approximation of the edge branch of get_filter computed on a pyramid downsampled frame.
+        On the 8-bit blurred frame, the 10/10 Canny of edge_mask fires on every grey level step, so after the closing
+        the full resolution mask is a solid band wherever the blurred gradient is above the Canny threshold. Downsampled
+        the ramps are steeper than a grey level per pixel and Canny only finds a thin outline, which the foreground
+        mask cuts into blobs too small to detect. So instead, the band itself is computed: the blur is run edge_scale
+        times smaller in each dimension, its Sobel gradients are scaled back to full resolution pixels and compared to
+        the same threshold, and the band is upsampled back to the frame size.
+        Checked with benchmarks/edge_scale_parity.py, see MAX_EDGE_SCALE."""
+        levels = int(self.edge_scale).bit_length() - 1  # edge_scale is a power of two
+        small = gray
+        for level in range(levels):
+            shape = ((small.shape[0] + 1) // 2, (small.shape[1] + 1) // 2)
+            small = cv2.pyrDown(small, dst=self._buffer(f'pyramid{level}', shape))
+        scale = 2 ** levels
+        blur_size = max(71 // scale, 1) | 1  # odd kernel size
+        denoise_background = cv2.GaussianBlur(small, (blur_size, blur_size), 0,
+                                              dst=self._buffer('small_denoise', small.shape))
+        # The L1 gradient magnitude Canny thresholds, per full resolution pixel:
+        grad_x = cv2.Sobel(denoise_background, cv2.CV_16S, 1, 0, dst=self._buffer('small_grad_x', small.shape, 'int16'),
+                           scale=1 / scale)
+        grad_y = cv2.Sobel(denoise_background, cv2.CV_16S, 0, 1, dst=self._buffer('small_grad_y', small.shape, 'int16'),
+                           scale=1 / scale)
+        magnitude = cv2.convertScaleAbs(grad_x, dst=self._buffer('small_magnitude', small.shape))
+        cv2.add(magnitude, cv2.convertScaleAbs(grad_y, dst=self._buffer('small_grad', small.shape)), dst=magnitude)
+        band = cv2.threshold(magnitude, 10, 255, cv2.THRESH_BINARY, dst=self._buffer('small_band', small.shape))[1]
+        return cv2.resize(band, (gray.shape[1], gray.shape[0]), dst=self._buffer('closing', gray.shape),
+                          interpolation=cv2.INTER_NEAREST)
 
     def train_bg_subtractor(self):
-        """ Pre-train the background subtractor.
-        input:
-        cap - video capture object, the video
-        bg_sub - background subtractor object
-        num - number of frames to train on
-        brighten - bool, whether to adjust brightness in the image
-        blur - bool, whether to apply gaussian blur to remove background noise from the image
+        """ Pre-train the background subtractor on the num_train_frames frames from the current video position,
+        the video is left positioned after them.
+        The grayscale training frames are cached (up to TRAIN_CACHE_MB), so training again only runs the background
+        subtractor on the frames in memory. Only the blur, the brightness, the start position, the number of
+        training frames and the ROI affect the background model - if none of them changed since the last training
+        the subtractor is kept as it is. Call reset_bg_subtractor first to force training a new one.
+        With a background cache, a model trained with the same settings in an earlier run is reused instead of
+        training, and newly trained models are added to the cache.
         output:
         bg_sub - trained background subtractor
         """
+        start = self.tell()
+        params = (self.brighten, tuple(self.blur), start, self.num_train_frames,
+                  tuple(self.roi) if self.roi is not None else None)
+        if params == self.trained_params:
+            # Nothing the background model depends on has changed, skip the training frames:
+            self.seek(start + self.num_train_frames)
+            return
+        if start != self.train_cache_start:
+            # Training from a different part of the video, the cached frames are no use:
+            self.train_cache = []
+            self.train_cache_start = start
+        self.reset_bg_subtractor()
+        if self.bg_cache is not None:
+            background = self.bg_cache.load(self.vid_path, params)
+            if background is not None:
+                # Start from the background trained in an earlier run, no need to read the training frames:
+                self.bg_cache.warm_start(self.bg_sub, background)
+                self.seek(start + self.num_train_frames)
+                self.trained_params = params
+                return
+        max_cached = self.TRAIN_CACHE_MB * 2**20 // max(self.SHAPE[0] * self.SHAPE[1], 1)
+        reading = False  # whether the frames are read from the video or taken from the cache
         for i in range(self.num_train_frames):
             # iterate over the selected number of frames
-            # ret,frame=cap.read() # get one frame
-            _, self.frame = self.cap.read()
-            if self.avi:
-                gray = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)  # convert to grayscale
+            if i < len(self.train_cache):
+                gray = self.train_cache[i]
             else:
-                gray = self.frame.copy()
-            # apply gaussian blur, default kernel size is set to 0 so that no blurring occurs
-            if self.blur[0] != 0:
-                gray = cv2.GaussianBlur(gray, self.blur, 0)
-            # apply brightening if applicable
-            gray = cv2.convertScaleAbs(gray, alpha=1, beta=self.brighten)
-            self.fg_mask = self.bg_sub.apply(gray, None, 0.001)  # apply bg_sub to the frame (modified or not)
+                if not reading:
+                    # Continue from the first frame that isn't cached:
+                    self.seek(start + i)
+                    reading = True
+                grabbed, gray = self.cap.read()
+                if not grabbed:
+                    break
+                if self.avi:
+                    gray = cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY)  # convert to grayscale
+                if len(self.train_cache) < max_cached:
+                    self.train_cache.append(gray)
+            self.frame = gray
+            # blur and brighten the ROI (into a buffer, the cached frame is left untouched):
+            gray = self.preprocess(gray)
+            # apply bg_sub to the frame (modified or not):
+            self.fg_mask = self.bg_sub.apply(gray, self._buffer('fg_mask', gray.shape), 0.001)
+        else:
+            if not reading:
+                # All the frames came from the cache, move the video past them:
+                self.seek(start + self.num_train_frames)
+            self.trained_params = params
+            if self.bg_cache is not None:
+                self.bg_cache.store(self.vid_path, params, self.bg_sub.getBackgroundImage())
+
+    def free_train_cache(self):
+        """ Drop the cached training frames."""
+        self.train_cache = []
+        self.train_cache_start = None
 
     def process_vid(self):
         """ Detect objects in a single video and create a new video with the bounding boxes around objects.
@@ -230,7 +485,7 @@ class MovieProcessor:
                 # If the video is finished, stop the loop
                 break
             if self.avi:
-                self.frame = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)
+                self.frame = self.to_gray(self.frame)
             counter += 1
             self.get_filter()  # get foreground mask
             self.get_contours()  # find objects inside the mask, get a list of their bounding boxes
@@ -254,6 +509,7 @@ class MovieProcessor:
     def reset_bg_subtractor(self):
         """ Reset the background subtractor"""
         self.bg_sub = cv2.createBackgroundSubtractorMOG2(history=self.num_train_frames, detectShadows=True)
+        self.trained_params = None
 
 
 class MovieCutter(MovieProcessor):
@@ -270,10 +526,26 @@ class MovieCutter(MovieProcessor):
     BG_SUB_TRAIN_MSG = 'training background subtractor...'
     CUTTING_MSG = 'begin cutting:'
     END_MSG = 'Done!'
+    CANCEL_MSG = 'Cancelled'
+    PROGRESS_EVERY = 10  # frames between progress updates
     MOVIE_PREFIX = 'cutout'  # movie file name prefix
+    MIN_IDLE_SEGMENTS = 2  # only idle stretches at least this many segment lengths long are skipped
+    # Motion gate settings, see the motion_detected method:
+    MOTION_SCALE = 8  # the frames are compared at 1/MOTION_SCALE of their size
+    MOTION_THRESHOLD = 15  # gray level change of a low resolution pixel that counts as motion
+    MOTION_MIN_PIXELS = 4  # number of changed low resolution pixels needed to run the detection
+    MAX_CHECK_SCALE = 4  # on static stretches the check interval grows up to this many times check_every
+    # Fish tracking settings, see the track_fish parameter:
+    TRACK_EVERY = 5  # frames between track updates while segments are written
+    TRACK_SCALE = 4  # the track updates detect fish at 1/TRACK_SCALE of the frame size
+    TRACK_THRESHOLD = 25  # gray level difference from the background that counts as fish in the track updates
+    TRACK_MAX_DISTANCE = 100  # maximal distance a fish moves between two track updates
+    TRACK_SMOOTHING = 0.5  # weight of a new position in the smoothed track position
 
     def __init__(self, vid_path, save_dir, padding=325, fps=30, start_frame=0,  movie_format='.avi',
-                 movie_length=200, save_movies=True,  progressbar=[], trainlabel=[]):
+                 movie_length=200, save_movies=True,  progressbar=[], trainlabel=[], pack_movies=False,
+                 tensor_export=False, tensor_sizes=(), bg_cache=None, activity_gate=False, motion_gate=False,
+                 roi=None, edge_scale=1, tiles=None, track_fish=False, events=None, cancel_event=None):
         """ Initiate a MovieCutter instance to chop fish larvae movies into segments.
         inputs:
         vid_path - path of the video file to cut
@@ -283,9 +555,31 @@ class MovieCutter(MovieProcessor):
         movie_length - sets the number of frames in each cut segment
         progressbar - a tk progressbar widget, optional integration, to show updates on the MovieCutterGUI
         trainlabel - a tk label widget, optional integration, to show updates on the MovieCutterGUI
-        movie - an index of current video if several videos were selected in the GUI."""
+        movie - an index of current video if several videos were selected in the GUI.
+        pack_movies - save all the segments in a single clip archive instead of separate video files,
+                      see the ClipArchive class
+        tensor_export - also write the segments into a memory-mapped array for training, see ClipTensorWriter
+        tensor_sizes - sizes of downscaled copies to add to the tensor export, e.g. (112,)
+        bg_cache - optional, a BackgroundCache to reuse background models between runs
+        activity_gate - skip long idle stretches of SEQ videos without decoding them, see the ActivityIndex class
+        motion_gate - only run the fish detection on check frames that changed since the last check, and check less
+                      often while nothing moves, see the motion_detected method
+        roi - optional, region of interest polygon or ROI file path, see MovieProcessor
+        edge_scale - downsampling factor of the edge branch of the detection, 1, 2 or 4, see MovieProcessor
+        tiles - optional, grid of tiles to compute the edge branch of the detection on in parallel, only with
+                edge_scale 1, see MovieProcessor
+        track_fish - follow each fish with a CentroidTracker, the crop of a segment moves with its fish and a fish
+                     that already has a segment doesn't get a new one. Track positions are updated every
+                     TRACK_EVERY frames from a cheap low resolution background difference, and the track id of every
+                     segment is added to the log
+        events - optional, a queue.Queue the cutter posts its GUI updates to instead of updating the progressbar and
+                 trainlabel widgets, so it can cut in a worker thread. Events are (kind, data dict) tuples:
+                 ('stage', {'message'}) and ('progress', {'value', 'maximum', 'fps', 'eta'}), eta in seconds
+        cancel_event - optional, a threading.Event, cutting stops cleanly (the segments written so far and the log
+                       are saved) when it is set. Can be shared by several cutters, see also the cancel method"""
         # Invoke the parent (movie processor) initialization:
-        super().__init__(vid_path, save_dir, start_frame=start_frame, fps=fps)
+        super().__init__(vid_path, save_dir, start_frame=start_frame, fps=fps, bg_cache=bg_cache, roi=roi,
+                         edge_scale=edge_scale, tiles=tiles)
         self.padding = padding   # Save the padding, the video frame size would be padding*2 X padding*2
         self.fps = fps
         # Get parent video name:
@@ -295,6 +589,28 @@ class MovieCutter(MovieProcessor):
         # and create a new folder in the save directory, named after the video file:
         self.folder_name = os.path.join(save_dir, folder)
         self.save_movies = save_movies
+        self.pack_movies = pack_movies
+        self.archive = None  # ClipArchiveWriter of the segments when packing movies
+        self.tensor_export = tensor_export
+        self.tensor_sizes = tensor_sizes
+        self.tensor_writer = None  # ClipTensorWriter of the segments when exporting tensors
+        self.tensor_slots = {}  # contour -> slot of its segment in the tensor export
+        self.segment_names = {}  # contour -> file name of its segment, as in the log
+        self.crop_engine = None  # cuts the segment frames, created when cutting starts
+        self.track_fish = track_fish
+        self.tracker = CentroidTracker(self.TRACK_MAX_DISTANCE, self.TRACK_SMOOTHING)
+        self.track_segments = {}  # track id -> contour key of the segment following it
+        self.track_background = None  # low resolution background for the track updates
+        self.activity_gate = activity_gate
+        self.idle_stop = None  # end of the idle stretch of every frame, see ActivityIndex.idle_stop
+        self.gate_log = []  # the idle stretches skipped by the activity gate
+        self.motion_gate = motion_gate
+        self.motion_prev = None  # low resolution copy of the last check frame
+        self.motion_hits = 0  # check frames with motion, the detection was run
+        self.motion_skips = 0  # static check frames, the detection was skipped
+        self.check_every = None  # frames between fish checks, set when cutting starts
+        self.check_interval = None  # current frames between checks, longer than check_every on static stretches
+        self.next_check = 0  # frame counter of the next fish check
         self.movie_format = movie_format
         self.counter = self.num_train_frames # Will track the original video frame number
         self.movie_counter = 0  # Track the number of video segments
@@ -311,71 +627,106 @@ class MovieCutter(MovieProcessor):
         # And now the widgets and GUI integrations:
         self.progressbar = progressbar  # tkinter progress bar widget
         self.trainlabel = trainlabel  # tkinter label widget
+        self.events = events  # queue of GUI updates, used instead of the widgets when given
+        self.cancel_event = cancel_event if cancel_event is not None else threading.Event()
+        self.cancelled = False  # whether the last cut was cancelled before the end of the video
+        self.cut_start = None  # time and frame counter cutting started at, for the processing rate
         self.videos_released = False   # monitors whether video resources were closed properly
         # will apply the change in brightness to the saved video segments
 
     def __repr__(self):
          return f'Brighten {self.brighten}; Blur {self.blur}; Minimum Width {self.min_width};' \
              f' Minimum Height {self.min_height}; Clip Length {self.movie_length-1}; Start Frame {self.start_frame};' \
-             f' Apply Brightness {self.apply_brightness}, Save Movies {self.save_movies}'
+             f' Apply Brightness {self.apply_brightness}, Save Movies {self.save_movies},' \
+             f' Pack Movies {self.pack_movies}, Tensor Export {self.tensor_export} {tuple(self.tensor_sizes)},' \
+             f' Activity Gate {self.activity_gate}, Motion Gate {self.motion_gate},' \
+             f' Edge Scale {self.edge_scale}, Tiles {self.tiles}, Track Fish {self.track_fish}, ROI {self.roi}'
 
     def get_bounds(self, centroid):
         """ Get the bounds of a new video segment. This is makes sure all video
         files have the same frame size.
         Practically, it means that the centroid + padding and the centroid - padding
         in every direction is within the original frame dimensions.
-        If the padding goes out of bounds - push the other side back so the full wanted frame size will be preserved."""
-        x2 = 0
-        y2 = 0
-        x1 = centroid[0] - self.padding  # Leftmost x point
-        if x1 < 0:
-            # If negative, shift x2 by the difference of x1 from zero:
-            # note that the fish will not be in the center of the frame but we will not have issues with black margins
-            # in the videos.
-            # Once that is done zero out x1:
-            x2 = abs(x1)
-            x1 = 0
-        x2 += centroid[0] + self.padding  # Add the padding size the rightmost x point
-        if x2 > self.SHAPE[0]:
-            # If overshoots original frame size, replace by the frame width and move the x1 back by the difference
-            # of x2 from the edge of the frame:
-            x1 -= (x2-int(self.SHAPE[0]))
-            x2 = int(self.SHAPE[0])
-        y1 = centroid[1] - self.padding  # Leftmost y point
-        if y1 < 0:
-            # If negative, add the absolute value, i.e the difference from 0, to y2 and replace y1 to 0:
-            y2 = abs(y1)
-            y1 = 0
-        y2 += int(centroid[1] + self.padding)  # Rightmost y point
-        if y2 > self.SHAPE[1]:
-            # If overshoots original frame size, replace by the frame height and move y1 back by the difference of y2
-            # from the edge of the frame:
-            y1 -= (y2 - int(self.SHAPE[1]))
-            y2 = int(self.SHAPE[1])
-        return x1, x2, y1, y2  # Return the bounds for the video segments
+        If the padding goes out of bounds - push the other side back so the full wanted frame size will be preserved.
+        See compute_bounds to get the bounds of many centroids at once."""
+        x1, x2, y1, y2 = compute_bounds([centroid], self.padding, self.SHAPE)
+        return int(x1[0]), int(x2[0]), int(y1[0]), int(y2[0])  # Return the bounds for the video segments
 
     def initiate_movies(self):
         """ Find the fish in a frame and initiate video segments for each detection."""
+        if self.motion_gate:
+            if not self.motion_detected():
+                # Nothing moved since the last check, skip the detection and check less often:
+                self.motion_skips += 1
+                self.check_interval = min(self.check_interval * 2, self.check_every * self.MAX_CHECK_SCALE)
+                return
+            self.motion_hits += 1
+            self.check_interval = self.check_every
         # First find the fish:
         self.get_filter()  # get foreground mask for the frame
         self.get_contours()  # find objects/fish inside the mask, get a dictionary of their detections
         self.fish_idx = 0  # Restart fish counting
+        centroids = list(self.bbox_dict.values())
+        track_ids = [None] * len(centroids)
+        if self.track_fish:
+            track_ids = self.tracker.update(centroids).tolist()
+            self.update_track_background()
+        # Get the bounds of the new videos of all the detections at once:
+        x1, x2, y1, y2 = compute_bounds(centroids, self.padding, self.SHAPE)
         # Go over the detections dict from the frame, contains the contour(bounding box) and centroid (object center):
-        for contour, centroid in self.bbox_dict.items():
-            if contour in self.contour_dict.keys():
-                entry = self.contour_dict[contour]
-                #if self.save_movies and len(self.movie_dict)>0:
-                #    self.close_segment(entry[3], contour)
-            # If this contour doesn't have a movie already, get the bounds of the new video:
-            x1, x2, y1, y2 = self.get_bounds(centroid)
+        for i, (contour, centroid) in enumerate(self.bbox_dict.items()):
+            if track_ids[i] in self.track_segments:
+                continue  # this fish already has a segment that follows it
             # Create a new entry for this fish - dimensions, frame counter,
-            # empty list for Laplacian values (calculate blurriness):
-            self.contour_dict[contour] = [(x1, x2), (y1, y2), 0, []]
-            self.create_movie_dict(contour,centroid)  # Create the video segments capture files and update the log
+            # empty list for Laplacian values (calculate blurriness), track id:
+            self.contour_dict[contour] = [(int(x1[i]), int(x2[i])), (int(y1[i]), int(y2[i])), 0, [], track_ids[i]]
+            if track_ids[i] is not None:
+                self.track_segments[track_ids[i]] = contour
+            # Create the video segments capture files and update the log:
+            self.create_movie_dict(contour, centroid, track_ids[i])
             self.fish_idx += 1  # Count one more fish
             self.movie_counter += 1  # Count one more movie
 
-    def create_movie_dict(self,contour,centroid):
+    def update_track_background(self):
+        """ Keep a low resolution copy of the background model for the track updates."""
+        background = self.bg_sub.getBackgroundImage()
+        height, width = background.shape[:2]
+        self.track_background = cv2.resize(background, (max(width // self.TRACK_SCALE, 1),
+                                                        max(height // self.TRACK_SCALE, 1)),
+                                           interpolation=cv2.INTER_AREA)
+
+    def track_detections(self):
+        """ Cheap fish detection for the track updates: threshold the difference from the background at low
+        resolution. Returns the (x, y) full frame centroids of the blobs large enough to be fish."""
+        x1, y1, x2, y2 = self.roi_rect
+        height, width = self.track_background.shape[:2]
+        small = cv2.resize(self.crop(self.frame), (width, height), dst=self._buffer('track_small', (height, width)),
+                           interpolation=cv2.INTER_AREA)
+        # The background model was trained on brightened frames:
+        cv2.convertScaleAbs(small, dst=small, alpha=1, beta=self.brighten)
+        diff = cv2.absdiff(small, self.track_background, dst=self._buffer('track_diff', (height, width)))
+        _, mask = cv2.threshold(diff, self.TRACK_THRESHOLD, 255, cv2.THRESH_BINARY, dst=diff)
+        _, _, stats, centroids = cv2.connectedComponentsWithStats(mask)
+        # Skip the background component, keep blobs at least half the minimal fish size:
+        large = (stats[1:, cv2.CC_STAT_WIDTH] * self.TRACK_SCALE >= self.min_width / 2) & \
+                (stats[1:, cv2.CC_STAT_HEIGHT] * self.TRACK_SCALE >= self.min_height / 2)
+        return centroids[1:][large] * self.TRACK_SCALE + (x1, y1)
+
+    def motion_detected(self):
+        """ Compare the frame with the last check frame at low resolution, a cheap test for whether running the full
+        detection (see get_filter) on it can find anything new. Only the ROI is compared. The first check frame
+        (or the first one after an ROI change) always counts as motion."""
+        x1, y1, x2, y2 = self.roi_rect
+        # At least one pixel, for ROIs smaller than MOTION_SCALE (e.g. a short accidental drag):
+        size = (max((x2 - x1) // self.MOTION_SCALE, 1), max((y2 - y1) // self.MOTION_SCALE, 1))
+        small = cv2.resize(self.crop(self.frame), size, interpolation=cv2.INTER_AREA)
+        prev, self.motion_prev = self.motion_prev, small
+        if prev is None or prev.shape != small.shape:
+            return True
+        changed = cv2.absdiff(small, prev) > self.MOTION_THRESHOLD
+        return np.count_nonzero(changed) >= self.MOTION_MIN_PIXELS
+
+    def create_movie_dict(self,contour,centroid,track_id=None):
         """ Create a new video for a fish. Create the name and full path for the movie and update
         the movie dictionary with a new video capture object. Update the log dataframe with the movie details."""
         # Create a file name for the video segment:
@@ -383,63 +734,129 @@ class MovieCutter(MovieProcessor):
         new_name = self.MOVIE_PREFIX + 'frame_' + str(self.counter) + '_coords_' + centroid_str + '_fish' + \
                    str(self.fish_idx) + self.movie_format
         movie_path = self.folder_name + os.path.sep + new_name  # Create the full path for the video segment
+        self.segment_names[contour] = new_name
         # Create a list with the VideoWriter object for the new fish and the video file path:
-        if self.save_movies:
+        if self.save_movies and self.pack_movies:
+            # The segment is buffered in memory and added to the archive when it's done:
+            self.movie_dict[contour] = [self.archive.segment(), movie_path]
+        elif self.save_movies:
             self.movie_dict[contour] = [cv2.VideoWriter(movie_path, self.fourcc, self.fps,
                                                     (self.padding * 2, self.padding * 2), False), movie_path]
+        if self.tensor_export:
+            if contour in self.tensor_slots:
+                # This fish got a new segment before the last one ended, keep what was written so far:
+                self.tensor_writer.finish_clip(self.tensor_slots.pop(contour))
+            self.tensor_slots[contour] = self.tensor_writer.new_clip(new_name)
         # Create a new log entry:
         self.log.loc[self.movie_counter, :] = {'movie_name': new_name, 'parent_video': self.vid_path,
                                                'frame': self.counter, 'coordinates': centroid,
-                                               'comments': '', 'label': None}
+                                               'comments': '', 'label': None,
+                                               **({'track_id': track_id} if self.track_fish else {})}
 
     def close_segment(self,laplacian,key):
         """Close a movie segment, release resources and check if it is too blurry."""
         self.med_laplacian.append(np.mean(laplacian))  # Add the mean Laplacian value for this video to the list
-        self.contour_dict.pop(key)  # Take the contour/fish-bounds out of the dictionary
+        entry = self.contour_dict.pop(key)  # Take the contour/fish-bounds out of the dictionary
+        if entry[4] is not None:
+            self.track_segments.pop(entry[4], None)  # the fish can get a new segment
+        # Filter out blurry videos:
+        # if the mean laplacian is 1.5 point below the mean of all videos, remove it.
+        # This is an experimental value that needs testing.
+        blurry = self.med_laplacian[-1] < np.mean(self.med_laplacian) - 1.5
+        name = self.segment_names.pop(key)
+        if blurry:
+            # Remove the log entry, the segment isn't saved nor exported:
+            self.log.drop(self.log[self.log.movie_name == name].index, inplace=True)
+        if self.tensor_export:
+            slot = self.tensor_slots.pop(key)
+            if blurry:
+                self.tensor_writer.discard_clip(slot)
+            else:
+                self.tensor_writer.finish_clip(slot)
+        if not self.save_movies:
+            return
         tmp = self.movie_dict.pop(key)   # Take the video capture object out
         tmp[0].release()  # Release it
-        # Filter out blurry videos:
-        if self.med_laplacian[-1] < np.mean(self.med_laplacian) - 1.5:
-            # if the mean laplacian is 1.5 point below the mean of all videos, remove it.
-            # This is an experimental value that needs testing.
-            # Remove the video file:
-            os.remove(tmp[1])
-            # Remove the log entry:
-            self.log.drop(self.log[self.log.movie_name == os.path.basename(tmp[1])].index, inplace=True)
+        if blurry:
+            # Remove the video file (a packed segment is simply not added to the archive):
+            if not self.pack_movies:
+                os.remove(tmp[1])
+        elif self.pack_movies:
+            self.archive.add_clip(os.path.basename(tmp[1]), tmp[0].frames)
 
     def write_movies(self):
         """ Main loop for writing the video segments for the detected fish."""
-        # For each detected fish:
-        for key in list(self.contour_dict):
-            entry = self.contour_dict[key]
-            # Check if the length of the current video segment has reached the desired length:
-            if entry[2] == self.movie_length:
-                # Close the video segment to release resources:
-                self.close_segment(entry[3], key)
-                continue  # And move on to the next video
-            # If it hasn't reached desired length, write movies:
+        # Close the video segments that have reached the desired length, to release resources:
+        for key in [key for key, entry in self.contour_dict.items() if entry[2] == self.movie_length]:
+            self.close_segment(self.contour_dict[key][3], key)
+        if not self.contour_dict:
+            return
+        keys = list(self.contour_dict)
+        entries = [self.contour_dict[key] for key in keys]
+        if self.track_fish:
+            self.follow_tracks(entries)
+        # Cut out the frames of all the segments at once, padded to the same size - (padding*2 X padding*2) - and
+        # brightened if needed (see the CropEngine class):
+        crops = self.crop_engine.crop(self.frame, [entry[0][0] for entry in entries],
+                                      [entry[0][1] for entry in entries], [entry[1][0] for entry in entries],
+                                      [entry[1][1] for entry in entries])
+        for key, entry, output in zip(keys, entries, crops):
             x, y, w, h = key  # Get the current fish bounding box dimensions
-            # Get the object subframe and calculate laplacian on it:
-            subframe = self.frame[y:(y + h), x:(x + w)]
-            lap = cv2.Laplacian(subframe, cv2.CV_64F).var()
-            # Cutout the video segment subframe:
-            cutout = self.frame[entry[1][0]:entry[1][1], entry[0][0]:entry[0][1]]
-            if self.apply_brightness:
-                cutout = cv2.convertScaleAbs(cutout, alpha=1, beta=self.brighten)
-            # Add the laplacian calculation to the dictionary entry
-            entry[3].append(lap)
-            # Deal with cases where the centroid is too close to the edges of the original frame,
-            # this makes sure all videos will be the same size - (padding*2 X padding*2):
-            output = np.zeros((self.padding * 2, self.padding * 2), dtype="uint8")  # create a frame the desired size
-            output[0:cutout.shape[0], 0:cutout.shape[1]] = cutout  # Paste in our cutout from the original frame
-            self.movie_dict[key][0].write(output)  # Write the frame to file
+            if entry[4] is not None and self.tracker.position(entry[4]) is not None:
+                # The fish moved, center its bounding box on its track:
+                cx, cy = self.tracker.position(entry[4])
+                x, y = max(cx - w // 2, 0), max(cy - h // 2, 0)
+            # Get the object subframe and add its laplacian to the dictionary entry:
+            entry[3].append(cv2.Laplacian(self.frame[y:(y + h), x:(x + w)], cv2.CV_64F).var())
+            if self.save_movies:
+                self.movie_dict[key][0].write(output)  # Write the frame to file
+            if self.tensor_export:
+                self.tensor_writer.write_frame(self.tensor_slots[key], output)
             entry[2] += 1  # Add a frame to the segment frame count
 
+    def follow_tracks(self, entries):
+        """ Move the crops of the segments that follow a fish to its tracked position."""
+        followed = [i for i, entry in enumerate(entries)
+                    if entry[4] is not None and self.tracker.position(entry[4]) is not None]
+        if not followed:
+            return
+        x1, x2, y1, y2 = compute_bounds([self.tracker.position(entries[i][4]) for i in followed], self.padding,
+                                        self.SHAPE)
+        for j, i in enumerate(followed):
+            entries[i][0] = (int(x1[j]), int(x2[j]))
+            entries[i][1] = (int(y1[j]), int(y2[j]))
+
+    def post(self, kind, **data):
+        """ Post an event to the events queue, if there is one."""
+        if self.events is not None:
+            self.events.put((kind, data))
+
+    def cancel(self):
+        """ Stop cutting at the next frame, can be called from any thread."""
+        self.cancel_event.set()
+
     def update_gui_lbl(self,msg):
         """ Update a LabelerGUI with a message to the user."""
+        if self.events is not None:
+            self.post('stage', message=msg)
+            return
+        if not self.trainlabel:
+            return
         self.trainlabel.configure(text=msg)
         self.trainlabel.update()
 
+    def update_progress(self):
+        """ Update the GUI with the cutting progress, the processing rate and the estimated time left."""
+        if self.events is not None:
+            elapsed = time.perf_counter() - self.cut_start[0]
+            fps = (self.counter - self.cut_start[1]) / elapsed if elapsed > 0 else 0.0
+            eta = (self.num_frames - self.counter) / fps if fps > 0 else None
+            self.post('progress', value=self.counter, maximum=self.num_frames - self.num_train_frames, fps=fps,
+                      eta=eta)
+        elif self.progressbar:
+            self.progressbar["value"] = self.counter
+            self.progressbar.update()
+
     def create_saving_dir(self):
         """ Create a directory to save movie segments in, name it after video file name."""
         try:
@@ -455,15 +872,53 @@ class MovieCutter(MovieProcessor):
         """ Does the logistics before starting to cut the videos, create directory for segments, train background
         subtractor, update GUI if applicable."""
         self.create_saving_dir()  # set up new directory
+        # Cuts the segment frames, with the final padding and brightness settings:
+        self.crop_engine = CropEngine(self.padding, self.SHAPE, self.brighten, self.apply_brightness)
+        if self.track_fish and 'track_id' not in self.log:
+            self.log['track_id'] = None  # the fish each segment follows
+        if self.save_movies and self.pack_movies:
+            # One archive for all the segments, named after the segments folder:
+            archive_path = os.path.join(self.folder_name, os.path.basename(self.folder_name) + ClipArchive.EXTENSION)
+            self.archive = ClipArchiveWriter(archive_path, self.fps, (self.padding * 2, self.padding * 2))
+        if self.tensor_export:
+            self.tensor_writer = ClipTensorWriter(self.folder_name, self.movie_length,
+                                                  (self.padding * 2, self.padding * 2), sizes=self.tensor_sizes,
+                                                  fps=self.fps)
         # If there is GUI integration, update the progress bar:
-        if self.progressbar:
+        if self.progressbar and self.events is None:
             # set the maximal value for the progress bar:
             self.progressbar["maximum"] = self.num_frames - self.num_train_frames
         self.fps_timer = FPS().start()  # Start timing
-        if self.trainlabel:
-            # Update the GUI label to inform user of the stage of the processing:
-            self.update_gui_lbl(self.BG_SUB_TRAIN_MSG)
-        self.train_bg_subtractor()  # Train the background subtractor
+        # Update the GUI label to inform user of the stage of the processing:
+        self.update_gui_lbl(self.BG_SUB_TRAIN_MSG)
+        self.train_bg_subtractor()  # Train the background subtractor, from the frames cached by the preview if any
+        self.free_train_cache()  # the subtractor isn't trained again while cutting
+        if self.activity_gate:
+            self.build_activity_index()
+
+    def build_activity_index(self):
+        """ Find the idle stretches of the video from the compressed frame sizes, see the ActivityIndex class."""
+        if self.avi:
+            print('[INFO] the activity gate needs the frame sizes of a SEQ file, cutting all the frames')
+            return
+        # A fish that moves is followed for a segment, so frames within a segment length of activity aren't idle:
+        index = ActivityIndex(self.cap.compressed_sizes(), pad=self.movie_length)
+        self.idle_stop = index.idle_stop(min_length=self.movie_length * self.MIN_IDLE_SEGMENTS)
+        print(f'[INFO] activity gate: {index.idle_fraction:.1%} of the frames are idle')
+
+    def skip_idle(self):
+        """ Skip the rest of the idle stretch the video is in, by whole check intervals so fish are still checked
+        for at the same frames."""
+        idx = self.tell()
+        if idx >= len(self.idle_stop) or self.idle_stop[idx] < 0:
+            return
+        skip = (self.idle_stop[idx] - idx) // self.check_every * self.check_every
+        if skip <= 0:
+            return
+        self.seek(idx + skip)
+        self.counter += skip
+        self.gate_log.append({'start_frame': idx, 'stop_frame': idx + skip, 'decision': 'skipped',
+                              'frames': skip})
 
     def cut(self):
         """ Main loop for cutting the original video file to segments."""
@@ -471,28 +926,49 @@ class MovieCutter(MovieProcessor):
         self.pre_cutting()
         # Set the gap between checks for fish, this is roughly 80% of the length of a video segment.
         # As an example, if video segments are to be a 100 frames in length, then check for fish every 80 frames:
-        check_every = round(self.movie_length * 1) # changed to 100% because there were too many overlapping vids
-        if self.trainlabel:
-            # Update the GUI label to inform user of the stage of the processing:
-            self.update_gui_lbl(self.CUTTING_MSG)
+        self.check_every = round(self.movie_length * 1) # changed to 100% because there were too many overlapping vids
+        self.check_interval = self.check_every
+        # The first check is on the next multiple of check_every:
+        self.next_check = -(-self.counter // self.check_every) * self.check_every
+        # Update the GUI label to inform user of the stage of the processing:
+        self.update_gui_lbl(self.CUTTING_MSG)
+        writing = self.save_movies or self.tensor_export
+        self.cancelled = False
+        self.cut_start = (time.perf_counter(), self.counter)
         # Now for the main cutting event:
         while True:
-            grabbed, self.frame = self.cap.read()  # get frame from the main video
-            if not grabbed:
-                # if the video is finished, stop:
+            if self.cancel_event.is_set():
+                # Stop here, the segments cut so far are closed and logged as usual:
+                self.cancelled = True
                 break
-            # Convert to grayscale to optimize:
-            if self.avi:
-                self.frame = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)
-            if self.counter % check_every == 0:
-                # If we need to check for fish:
-                self.initiate_movies()  # create the fish movie segments for this frame
-            if self.save_movies:
-                self.write_movies()  # Write a frame to the movie segments initiated
-            if self.progressbar and self.counter % 10 == 0:
+            check_frame = self.counter >= self.next_check
+            if self.idle_stop is not None and check_frame and not (writing and self.contour_dict):
+                # No segment is being written, jump over idle stretches:
+                self.skip_idle()
+            if not check_frame and not (writing and self.contour_dict):
+                # Nothing uses this frame, skip it without decoding:
+                if not self.cap.grab():
+                    break
+            else:
+                grabbed, self.frame = self.cap.read()  # get frame from the main video
+                if not grabbed:
+                    # if the video is finished, stop:
+                    break
+                # Convert to grayscale to optimize:
+                if self.avi:
+                    self.frame = self.to_gray(self.frame)
+                if check_frame:
+                    # If we need to check for fish:
+                    self.initiate_movies()  # create the fish movie segments for this frame
+                    self.next_check = self.counter + self.check_interval
+                elif self.track_fish and self.contour_dict and self.counter % self.TRACK_EVERY == 0:
+                    # Follow the fish between checks:
+                    self.tracker.update(self.track_detections(), create=False)
+                if writing:
+                    self.write_movies()  # Write a frame to the movie segments initiated
+            if self.counter % self.PROGRESS_EVERY == 0:
                 # Update the progress bar in decimal increments:
-                self.progressbar["value"] = self.counter
-                self.progressbar.update()
+                self.update_progress()
 
             self.counter += 1  # Monitor the number of frames in the original vid
             self.fps_timer.update()   # update the fps timer
@@ -505,6 +981,10 @@ class MovieCutter(MovieProcessor):
         for movie in self.movie_dict.values():
             # Release all remaining segments
             movie[0].release()
+            if self.pack_movies:
+                self.archive.add_clip(os.path.basename(movie[1]), movie[0].frames)
+        if self.archive is not None:
+            self.archive.close()  # Write the archive index
         self.cap.release()  # Release the original video
         self.videos_released = True
 
@@ -512,12 +992,24 @@ class MovieCutter(MovieProcessor):
         """ Release resources, save log and display end message."""
         if self.save_movies:
             self.release_videos()
+        self.close_tile_pool()
         self.fps_timer.stop()  # Stop the fps_timer
         self.log.to_csv(os.path.join(self.folder_name,'log.csv'), index=False)  # Save the log dataframe to file
+        if self.tensor_writer is not None:
+            # Finish the remaining segments and save the tensor metadata along with the log columns:
+            self.tensor_writer.close(self.log.rename(columns={'movie_name': 'clip_name'}))
+        if self.activity_gate:
+            # Save the gating decisions along with the log:
+            pd.DataFrame(self.gate_log, columns=['start_frame', 'stop_frame', 'decision', 'frames']).to_csv(
+                os.path.join(self.folder_name, 'activity_gate.csv'), index=False)
         f=open(os.path.join(self.folder_name,'cutter_profile.txt'),'w')
         f.write(self.__repr__())
+        if self.cancelled:
+            f.write(f'\nCancelled at frame {self.counter}')
+        if self.motion_gate:
+            f.write(f'\nMotion Gate: {self.motion_hits} checks with motion, {self.motion_skips} static checks skipped')
         f.close()
-        self.update_gui_lbl(self.END_MSG)  # Inform the user cutting is done
+        self.update_gui_lbl(self.CANCEL_MSG if self.cancelled else self.END_MSG)  # Inform the user cutting is done
         # Print the timing results:
         print("[INFO] elasped time: {:.2f}".format(self.fps_timer.elapsed()))
         print("[INFO] approx. FPS: {:.2f}".format(self.fps_timer.fps()))
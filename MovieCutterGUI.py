@@ -4,7 +4,11 @@ from tkinter.filedialog import askopenfilenames, askdirectory
 from tkinter.ttk import Progressbar
 from tkinter import messagebox
 import os
+import queue
+import threading
+import traceback
 from AdvanceMovieCutterGUI import AdvanceMovieCutterGUI
+from BackgroundCache import BackgroundCache
 import warnings
 import sys
 import logging
@@ -16,11 +20,15 @@ class CutterApp():
     To do this the app uses the MovieCutter class to detect the fish and cut movie segments, see the MovieCutter class
     documentation for more details.
     The user chooses a file to cut and a directory into which the files will be saved. When cutting starts progress
-    will be displayed on a progress bar."""
+    will be displayed on a progress bar.
+    Cutting runs on a worker thread, which never touches the tkinter widgets: the movie cutters post their progress to
+    an event queue that the window polls with after(), so it stays responsive and cutting can be cancelled."""
     # Define some class variables of messages with user instruction:
     INIT_MSG = 'Choose a video file first'
     SAVE_MSG = 'Choose where to save the videos'
     CUT_MSG = "You're all good, start cutting!"
+    CANCELLING_MSG = 'Cancelling, saving the segments cut so far...'
+    POLL_INTERVAL = 100  # ms between polls of the cutting events queue
 
     def __init__(self):
         """ Initialize the main GUI window."""
@@ -36,8 +44,29 @@ class CutterApp():
         self.write_movies.set(1)
         self.btn_write_movies = tk.Checkbutton(self.frm_btn,text='Just Log',variable=self.write_movies,
                                                onvalue=0, offvalue=1,command=self.set_logging)
+        # Save the segments of each video in a single clip archive instead of thousands of small files:
+        self.pack_movies = tk.BooleanVar()
+        self.btn_pack_movies = tk.Checkbutton(self.frm_btn, text='Pack Clips', variable=self.pack_movies,
+                                              command=self.set_packing)
+        # Skip long idle stretches of SEQ videos, found from the compressed frame sizes:
+        self.activity_gate = tk.BooleanVar()
+        self.btn_activity_gate = tk.Checkbutton(self.frm_btn, text='Skip Idle', variable=self.activity_gate,
+                                                command=self.set_activity_gate)
+        # Only run the fish detection on frames that changed since the last check:
+        self.motion_gate = tk.BooleanVar()
+        self.btn_motion_gate = tk.Checkbutton(self.frm_btn, text='Motion Gate', variable=self.motion_gate,
+                                              command=self.set_motion_gate)
+        # Follow each fish with a tracker so its segment crop moves with it:
+        self.track_fish = tk.BooleanVar()
+        self.btn_track_fish = tk.Checkbutton(self.frm_btn, text='Track Fish', variable=self.track_fish,
+                                             command=self.set_track_fish)
+        # Background models trained for a video are reused when it is cut again, unless retraining is requested:
+        self.bg_cache = BackgroundCache()
+        self.retrain_bg = tk.BooleanVar()
+        self.btn_retrain_bg = tk.Checkbutton(self.frm_btn, text='Retrain Background', variable=self.retrain_bg)
         # Button to start the video cutting proccess
         self.btn_start = tk.Button(self.frm_btn, text="Start Cutting", command=self.cut_movies)
+        self.btn_cancel = tk.Button(self.frm_btn, text="Cancel", command=self.cancel_cutting, state=tk.DISABLED)
         # This label shows some info to direct user actions:
         self.lbl_training = tk.Label(self.window, text=self.INIT_MSG)
         self.lbl_movie_counter = tk.Label(self.window, text='')
@@ -48,8 +77,14 @@ class CutterApp():
         self.savepath = None  # will contain a path selected by user where cut videos will be saved
         self.movie_cutters = []  # Movie cutter objects will be stored here
         self.num_vids_selected=None
+        # The cutting worker thread posts (kind, data) events to this queue, see MovieCutter.post:
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()  # shared by all the movie cutters, set to cancel cutting
+        self.worker = None  # the cutting worker thread
+        self.video_msg = ''  # which video is being cut
         self.define_layout()
         self.window.wm_title("Fish Movie Cutter")
+        self.window.protocol("WM_DELETE_WINDOW", self.on_close)
         # Set a closing procedure for the GUI window and start the mainloop:
         self.window.mainloop()
 
@@ -60,7 +95,13 @@ class CutterApp():
         self.btn_save.grid(row=0,column=1,sticky="ew",padx=5,pady=2)
         self.btn_advance.grid(row=0, column=2, sticky="ew", padx=5, pady=2)
         self.btn_write_movies.grid(row=0,column=3,sticky="ew", padx=5, pady=2)
-        self.btn_start.grid(row=0,column=4, sticky="ew",padx=5,pady=2)
+        self.btn_pack_movies.grid(row=0, column=4, sticky="ew", padx=5, pady=2)
+        self.btn_activity_gate.grid(row=0, column=5, sticky="ew", padx=5, pady=2)
+        self.btn_motion_gate.grid(row=0, column=6, sticky="ew", padx=5, pady=2)
+        self.btn_retrain_bg.grid(row=0, column=7, sticky="ew", padx=5, pady=2)
+        self.btn_track_fish.grid(row=0, column=8, sticky="ew", padx=5, pady=2)
+        self.btn_start.grid(row=0,column=9, sticky="ew",padx=5,pady=2)
+        self.btn_cancel.grid(row=0, column=10, sticky="ew", padx=5, pady=2)
         self.frm_btn.grid(row=0)
         self.lbl_movie_counter.grid(row=2,column=0,sticky="nsew")
         self.lbl_training.grid(row=1,column=0,sticky="nsew")
@@ -70,8 +111,28 @@ class CutterApp():
         if len(self.movie_cutters)>0:
             for i in range(len(self.movie_cutters)):
                 self.movie_cutters[i] = MovieCutter(self.vidpaths[i], self.savepath,
-                                                      trainlabel=self.lbl_training, progressbar=self.bar,
-                                                      save_movies=self.write_movies.get())
+                                                      events=self.events, cancel_event=self.cancel_event,
+                                                      save_movies=self.write_movies.get(),
+                                                      pack_movies=self.pack_movies.get(), bg_cache=self.bg_cache,
+                                                      activity_gate=self.activity_gate.get(),
+                                                      motion_gate=self.motion_gate.get(),
+                                                      track_fish=self.track_fish.get())
+
+    def set_packing(self):
+        for movie_cutter in self.movie_cutters:
+            movie_cutter.pack_movies = self.pack_movies.get()
+
+    def set_activity_gate(self):
+        for movie_cutter in self.movie_cutters:
+            movie_cutter.activity_gate = self.activity_gate.get()
+
+    def set_motion_gate(self):
+        for movie_cutter in self.movie_cutters:
+            movie_cutter.motion_gate = self.motion_gate.get()
+
+    def set_track_fish(self):
+        for movie_cutter in self.movie_cutters:
+            movie_cutter.track_fish = self.track_fish.get()
 
     def open_vid(self):
         """Get the video file for cutting from the user."""
@@ -114,8 +175,12 @@ class CutterApp():
                     self.savepath = os.path.dirname(self.vidpaths[i])
                 # Define a new movie cutter object:
                 self.movie_cutters.append(MovieCutter(self.vidpaths[i], self.savepath,
-                                                      trainlabel=self.lbl_training, progressbar=self.bar,
-                                                      save_movies=True))
+                                                      events=self.events, cancel_event=self.cancel_event,
+                                                      save_movies=True, pack_movies=self.pack_movies.get(),
+                                                      bg_cache=self.bg_cache,
+                                                      activity_gate=self.activity_gate.get(),
+                                                      motion_gate=self.motion_gate.get(),
+                                                      track_fish=self.track_fish.get()))
                 print(self.movie_cutters[i])
             # Display the next set of user instructions on the GUI:
             self.lbl_training.configure(text=self.CUT_MSG)
@@ -128,21 +193,96 @@ class CutterApp():
             messagebox.showinfo(title="Oops!", message="You need to choose a saving directory first")
 
     def cut_movies(self):
-        """Start the movie cutting operation."""
+        """Start the movie cutting operation on a worker thread."""
         for i in self.movie_cutters:
             print(i)
-        if self.movie_cutters:
+        if not self.movie_cutters:
+            messagebox.showinfo('Oops!', 'An Error occurred. Did you forget to choose files for cutting?')
+            return
+        if self.worker is not None and self.worker.is_alive():
+            return
+        self.cancel_event.clear()
+        self.set_cutting(True)
+        # tkinter variables are read here, the worker thread doesn't touch tkinter:
+        self.worker = threading.Thread(target=self.run_cutters, args=(self.retrain_bg.get(),), daemon=True)
+        self.worker.start()
+        self.window.after(self.POLL_INTERVAL, self.poll_events)
+
+    def run_cutters(self, retrain_bg):
+        """ Cut the videos one after the other, runs on the worker thread and reports to the GUI only through the
+        events queue."""
+        try:
             for i in range(self.num_vids_selected):
+                if self.cancel_event.is_set():
+                    break
                 # Keep track of which movie we're cutting
-                self.lbl_movie_counter.configure(text=f'Video {i+1} / {self.num_vids_selected}')
-                # Cut movies one after the other:
+                self.events.put(('video', {'index': i}))
+                if retrain_bg:
+                    # Drop the cached background models of this video and train a new one:
+                    self.bg_cache.invalidate(self.vidpaths[i])
+                    self.movie_cutters[i].reset_bg_subtractor()
                 self.movie_cutters[i].cut()  # see the MovieCutter class for more details
+        except Exception:
+            self.events.put(('error', {'message': traceback.format_exc()}))
+            return
+        self.events.put(('done', {'cancelled': self.cancel_event.is_set()}))
+
+    def poll_events(self):
+        """ Apply the events posted by the cutting worker to the GUI, and keep polling until it is done."""
+        finished = False
+        while True:
+            try:
+                kind, data = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'stage':
+                self.lbl_training.configure(text=data['message'])
+            elif kind == 'video':
+                self.video_msg = f'Video {data["index"] + 1} / {self.num_vids_selected}'
+                self.lbl_movie_counter.configure(text=self.video_msg)
+                self.bar['value'] = 0
+            elif kind == 'progress':
+                self.bar['maximum'] = data['maximum']
+                self.bar['value'] = data['value']
+                eta = '' if data['eta'] is None else f', {int(data["eta"]) // 60}:{int(data["eta"]) % 60:02d} left'
+                self.lbl_movie_counter.configure(text=f'{self.video_msg} - {data["fps"]:.1f} fps{eta}')
+            elif kind == 'error':
+                finished = True
+                print(data['message'])
+                messagebox.showerror('Cutting Failed', data['message'].strip().splitlines()[-1])
+            elif kind == 'done':
+                finished = True
                 self.bar['value'] = 0
-            # Note: the progress bar is updated inside the cut method of the MovieCutter class
-            # Prompt user when done, show where the video segments were saved:
-            messagebox.showinfo('Done Cutting', f'Videos saved to subdirectories at: {self.savepath} ')
+                # Prompt user when done, show where the video segments were saved:
+                title = 'Cutting Cancelled' if data['cancelled'] else 'Done Cutting'
+                messagebox.showinfo(title, f'Videos saved to subdirectories at: {self.savepath} ')
+        if finished:
+            self.set_cutting(False)
         else:
-            messagebox.showinfo('Oops!', 'An Error occurred. Did you forget to choose files for cutting?')
+            self.window.after(self.POLL_INTERVAL, self.poll_events)
+
+    def set_cutting(self, cutting):
+        """ Enable only the cancel button while cutting, the cutter settings can't change mid cut."""
+        state = tk.DISABLED if cutting else tk.NORMAL
+        for button in (self.btn_open, self.btn_save, self.btn_advance, self.btn_write_movies, self.btn_pack_movies,
+                       self.btn_activity_gate, self.btn_motion_gate, self.btn_track_fish, self.btn_retrain_bg,
+                       self.btn_start):
+            button.configure(state=state)
+        self.btn_cancel.configure(state=tk.NORMAL if cutting else tk.DISABLED)
+
+    def cancel_cutting(self):
+        """ Stop cutting, the current video is closed cleanly and the rest are skipped."""
+        self.cancel_event.set()
+        self.btn_cancel.configure(state=tk.DISABLED)
+        self.lbl_training.configure(text=self.CANCELLING_MSG)
+
+    def on_close(self):
+        """ Cancel a running cut before closing the window, waiting for it so the log of the current video is
+        saved."""
+        if self.worker is not None and self.worker.is_alive():
+            self.cancel_event.set()
+            self.worker.join()
+        self.window.destroy()
 
 
 if __name__ == '__main__':
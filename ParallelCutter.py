@@ -0,0 +1,320 @@
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import time
+import traceback
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+import pandas as pd
+from BackgroundCache import BackgroundCache
+from MovieCutter import MovieCutter
+from SEQReader import SEQReader
+
+
+class RingReader:
+    """ Frame source of a RangeCutter, serves the frames the decoder process writes into the worker's slots of the
+    shared memory ring. Looks like a SEQReader to the cutting loop (read, grab, frame_pointer and release).
+    Frames are returned as views of the ring, without copying. A slot is handed back to the decoder when the next
+    frame is read, so the frame stays valid while the cutter works on it."""
+
+    def __init__(self, slots, frame_queue, free_slots, first_frame):
+        """ inputs:
+        slots - (num_slots, height, width) view of the worker's part of the ring
+        frame_queue - queue of (frame index, slot) messages from the decoder, None when there are no more frames
+        free_slots - queue the used slots are handed back on
+        first_frame - index of the first frame the decoder sends"""
+        self.slots = slots
+        self.frame_queue = frame_queue
+        self.free_slots = free_slots
+        self.frame_pointer = first_frame - 1
+        self.slot = None  # slot of the current frame
+        self.finished = lambda: False  # set by the cutter, stops reading once it needs no more frames
+
+    def release_slot(self):
+        if self.slot is not None:
+            self.free_slots.put(self.slot)
+            self.slot = None
+
+    def read(self):
+        self.release_slot()
+        if self.finished():
+            return False, None
+        message = self.frame_queue.get()
+        if message is None:
+            return False, None
+        self.frame_pointer, self.slot = message
+        return True, self.slots[self.slot]
+
+    def grab(self):
+        return self.read()[0]
+
+    def release(self):
+        self.release_slot()
+
+
+class RangeCutter(MovieCutter):
+    """ A MovieCutter for one frame range of a parallel cut. It checks for fish only inside its range and goes on
+    past the range end just long enough to finish the segments it started. Frames come from a RingReader, and the
+    background subtractor is warm started from the background trained by the ParallelCutter."""
+
+    def __init__(self, vid_path, save_dir, reader, background, start, stop):
+        """ inputs:
+        reader - RingReader of the worker
+        background - background image to warm start the background subtractor from
+        start, stop - frame counter range to check for fish in"""
+        super().__init__(vid_path, save_dir)
+        self.cap.release()
+        self.cap = reader
+        self.avi = False  # the decoder sends grayscale frames
+        self.background = background
+        self.counter = start
+        self.stop = stop
+        reader.finished = lambda: self.counter >= self.stop and not self.contour_dict
+
+    def create_saving_dir(self):
+        """ All the workers save to the folder created by the ParallelCutter."""
+
+    def train_bg_subtractor(self):
+        self.reset_bg_subtractor()
+        BackgroundCache.warm_start(self.bg_sub, self.background)
+
+    def initiate_movies(self):
+        if self.counter < self.stop:
+            super().initiate_movies()
+
+    def close_everything(self):
+        """ Release the segments, the ParallelCutter saves the merged log."""
+        if self.save_movies:
+            self.release_videos()
+        self.close_tile_pool()
+        self.fps_timer.stop()
+
+
+def open_reader(vid_path, idx):
+    """ Open a video positioned at frame idx."""
+    if vid_path.endswith('.seq'):
+        reader = SEQReader(vid_path)
+        reader.frame_pointer = idx - 1
+    else:
+        reader = cv2.VideoCapture(vid_path)
+        reader.set(cv2.CAP_PROP_POS_FRAMES, idx)
+    return reader
+
+
+def decode(vid_path, ranges, ring_name, ring_shape, frame_queues, free_slots, finished):
+    """ Decoder process: read the frame range of every worker with its own reader, round robin, into the worker's
+    slots of the ring. inputs:
+    ranges - (first frame, stop frame) of every worker
+    ring_name, ring_shape - name and (num_workers, num_slots, height, width) shape of the shared memory ring
+    frame_queues, free_slots - the queues of every worker, see RingReader
+    finished - events set by the workers once they need no more frames"""
+    ring = shared_memory.SharedMemory(name=ring_name)
+    frames = np.ndarray(ring_shape, dtype='uint8', buffer=ring.buf)
+    try:
+        readers = [open_reader(vid_path, first) for first, _ in ranges]
+        positions = [first for first, _ in ranges]
+        active = set(range(len(ranges)))
+        while active:
+            progressed = False
+            for k in list(active):
+                if finished[k].is_set() or positions[k] >= ranges[k][1]:
+                    frame_queues[k].put(None)
+                    active.discard(k)
+                    continue
+                try:
+                    slot = free_slots[k].get_nowait()
+                except queue.Empty:
+                    continue  # the worker is behind, serve the others
+                grabbed, frame = readers[k].read()
+                if not grabbed:
+                    frame_queues[k].put(None)
+                    active.discard(k)
+                    continue
+                if frame.ndim == 3:
+                    cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=frames[k, slot])
+                else:
+                    frames[k, slot] = frame
+                frame_queues[k].put((positions[k], slot))
+                positions[k] += 1
+                progressed = True
+            if not progressed:
+                time.sleep(0.001)  # all the workers are behind
+        for reader in readers:
+            reader.release()
+    finally:
+        del frames  # the ring can't be closed while arrays use it
+        ring.close()
+
+
+def cut_range(vid_path, save_dir, folder_name, settings, worker, start, stop, background, ring_name, ring_shape,
+              frame_queue, free_slots, finished, results):
+    """ Worker process: cut the segments of the fish found in a frame counter range, puts (worker, log, error) on
+    the results queue."""
+    ring = shared_memory.SharedMemory(name=ring_name)
+    frames = np.ndarray(ring_shape, dtype='uint8', buffer=ring.buf)
+    reader = cutter = None
+    try:
+        for slot in range(ring_shape[1]):
+            free_slots.put(slot)
+        reader = RingReader(frames[worker], frame_queue, free_slots, start + settings['offset'])
+        cutter = RangeCutter(vid_path, save_dir, reader, background, start, stop)
+        ParallelCutter.apply_settings(cutter, settings)
+        cutter.folder_name = folder_name
+        cutter.tracker.next_id = worker * ParallelCutter.TRACK_ID_STRIDE  # unique track ids across the workers
+        cutter.cut()
+        results.put((worker, cutter.log, None))
+    except Exception:
+        results.put((worker, None, traceback.format_exc()))
+    finally:
+        finished.set()
+        # The ring can't be closed while arrays use it:
+        if cutter is not None:
+            cutter.frame = None
+        if reader is not None:
+            reader.slots = None
+        del frames
+        ring.close()
+
+
+class ParallelCutter:
+    """ Cut a video with a pool of worker processes, for a throughput that scales with the number of cores.
+    One decoder process decodes the frames into a multiprocessing.shared_memory ring buffer, which the workers read
+    without copying. Every worker cuts a contiguous range of the video (whole check intervals, so fish are checked
+    for at the same frames as a serial cut), and the decoder reads all the ranges in parallel, round robin, so every
+    worker gets frames from the start. A worker goes on past its range end until the segments it started are done.
+    The background subtractor is trained once and the workers warm start from its background image, and the worker
+    logs are merged, sorted by frame, into a single log.
+    Settings are copied from a configured MovieCutter (e.g. by the advance options GUI). Packing, tensor export and
+    the activity gate need a single writer and aren't supported, and the blurry segment filter compares segments
+    with the other segments of the same worker only.
+    With track_fish, every worker has its own tracker, and its track ids start at worker * TRACK_ID_STRIDE so they
+    are unique in the merged log. A worker starts with no tracks, so a fish that is followed by a segment of the
+    previous worker when the range starts gets a second, overlapping segment at the first check of the range,
+    where a serial cut would skip it."""
+    SETTINGS = ('brighten', 'blur', 'min_width', 'min_height', 'apply_brightness', 'num_train_frames', 'padding',
+                'movie_length', 'fps', 'movie_format', 'save_movies', 'motion_gate', 'track_fish', 'edge_scale',
+                'tiles')
+    SLOTS = 16  # ring slots per worker
+    TRACK_ID_STRIDE = 10**6  # track ids of the worker k tracker start at k * TRACK_ID_STRIDE
+
+    def __init__(self, movie_cutter, num_workers=None, slots=SLOTS):
+        """ inputs:
+        movie_cutter - a MovieCutter with the cutting settings
+        num_workers - number of worker processes, by default one per core with one core left for the decoder
+        slots - number of frames in the ring per worker"""
+        if movie_cutter.pack_movies or movie_cutter.tensor_export or movie_cutter.activity_gate:
+            raise ValueError('Packing, tensor export and the activity gate are not supported by the parallel cutter')
+        self.cutter = movie_cutter
+        self.num_workers = num_workers if num_workers else max((os.cpu_count() or 2) - 1, 1)
+        self.slots = slots
+        self.log = None
+
+    @classmethod
+    def get_settings(cls, movie_cutter):
+        settings = {name: getattr(movie_cutter, name) for name in cls.SETTINGS}
+        settings['roi'] = movie_cutter.roi
+        return settings
+
+    @staticmethod
+    def apply_settings(movie_cutter, settings):
+        for name in ParallelCutter.SETTINGS:
+            setattr(movie_cutter, name, settings[name])
+        movie_cutter.set_roi(settings['roi'])
+
+    def split(self, first, last, check_every):
+        """ Split the frame counter range [first, last) into a range of whole check intervals per worker."""
+        checks = np.arange(-(-first // check_every) * check_every, last, check_every)
+        bounds = [first] + [int(group[0]) for group in np.array_split(checks, self.num_workers)[1:] if len(group)]
+        return list(zip(bounds, bounds[1:] + [last]))
+
+    def cut(self):
+        """ Cut the video, returns the merged log."""
+        cutter = self.cutter
+        cutter.create_saving_dir()
+        cutter.set_start_frame()
+        cutter.train_bg_subtractor()
+        cutter.free_train_cache()
+        background = cutter.bg_sub.getBackgroundImage()
+        # Frame index = frame counter + offset, the counter is num_train_frames at the first frame after training:
+        offset = cutter.tell() - cutter.num_train_frames
+        settings = self.get_settings(cutter)
+        settings['offset'] = offset
+        cutter.cap.release()
+        check_every = cutter.movie_length
+        ranges = self.split(cutter.num_train_frames, int(cutter.num_frames) - offset, check_every)
+        # The decoder reads each range up to a segment length past its end, for the segments started last:
+        frame_ranges = [(start + offset, min(stop + offset + cutter.movie_length, int(cutter.num_frames)))
+                        for start, stop in ranges]
+        width, height = cutter.SHAPE
+        ring_shape = (len(ranges), self.slots, height, width)
+        ring = shared_memory.SharedMemory(create=True, size=int(np.prod(ring_shape)))
+        context = mp.get_context('spawn')  # no OpenCV threads are forked
+        frame_queues = [context.Queue() for _ in ranges]
+        free_slots = [context.Queue() for _ in ranges]
+        finished = [context.Event() for _ in ranges]
+        results = context.Queue()
+        processes = [context.Process(target=decode, args=(cutter.vid_path, frame_ranges, ring.name, ring_shape,
+                                                          frame_queues, free_slots, finished), daemon=True)]
+        processes += [context.Process(target=cut_range,
+                                      args=(cutter.vid_path, cutter.folder_path, cutter.folder_name, settings, k,
+                                            start, stop, background, ring.name, ring_shape, frame_queues[k],
+                                            free_slots[k], finished[k], results), daemon=True)
+                      for k, (start, stop) in enumerate(ranges)]
+        started = time.perf_counter()
+        try:
+            for process in processes:
+                process.start()
+            logs = [None] * len(ranges)
+            errors = []
+            received = 0
+            while received < len(ranges):
+                try:
+                    worker, log, error = results.get(timeout=1)
+                except queue.Empty:
+                    if any(process.exitcode not in (None, 0) for process in processes):
+                        raise RuntimeError('A cutting process died')
+                    continue
+                received += 1
+                logs[worker] = log
+                if error is not None:
+                    errors.append(error)
+            for process in processes:
+                process.join()
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            ring.close()
+            ring.unlink()
+        elapsed = time.perf_counter() - started
+        if errors:
+            raise RuntimeError('A cutting worker failed:\n' + errors[0])
+        # Restore the frame order of the segments:
+        self.log = pd.concat(logs, ignore_index=True).sort_values('frame', kind='stable').reset_index(drop=True)
+        self.log.to_csv(os.path.join(cutter.folder_name, 'log.csv'), index=False)
+        with open(os.path.join(cutter.folder_name, 'cutter_profile.txt'), 'w') as f:
+            f.write(cutter.__repr__())
+            f.write(f'\nParallel: {len(ranges)} workers, frame counter ranges {ranges}')
+        num_frames = int(cutter.num_frames) - offset - cutter.num_train_frames
+        print("[INFO] elasped time: {:.2f}".format(elapsed))
+        print("[INFO] approx. FPS: {:.2f}".format(num_frames / elapsed))
+        return self.log
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Cut fish larvae videos into segments with a pool of processes')
+    parser.add_argument('videos', nargs='+', help='videos to cut, AVI or SEQ')
+    parser.add_argument('--save_dir', help='directory to save the segments in, by default next to each video')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--slots', type=int, default=ParallelCutter.SLOTS, help='ring slots per worker')
+    parser.add_argument('--just_log', action='store_true', help="only write the log, don't save the segments")
+    parser.add_argument('--motion_gate', action='store_true', help='only detect on frames with motion')
+    parser.add_argument('--track_fish', action='store_true', help='follow each fish with a tracker')
+    args = parser.parse_args()
+    for vid_path in args.videos:
+        movie_cutter = MovieCutter(vid_path, args.save_dir or os.path.dirname(os.path.abspath(vid_path)),
+                                   save_movies=not args.just_log, motion_gate=args.motion_gate,
+                                   track_fish=args.track_fish)
+        ParallelCutter(movie_cutter, args.workers, args.slots).cut()
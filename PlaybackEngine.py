@@ -0,0 +1,253 @@
+import threading
+import queue
+import time
+import cv2
+
+
+class PlaybackEngine:
+    """ Frame-rate driven video playback for the tkinter GUIs.
+    A decoder thread reads frames from a video reader (SEQReader, VidReader or cv2.VideoCapture) into a bounded
+    ring buffer, while a scheduler on the tkinter main loop pops frames from the buffer and hands them to a display
+    callback at the recording's frame rate. The decoder thread never touches tkinter widgets.
+    If the GUI falls behind, frames that are already late are dropped so playback stays in sync with the clock.
+    Playback speed can be set between MIN_SPEED and MAX_SPEED times the recording's frame rate, and the achieved
+    frame rate is tracked so it can be reported against the target frame rate.
+    Videos can also be played backwards and looped. These seek the reader for every frame played backwards or
+    wrapped around, so they are meant for readers with cheap random access such as DecodedClip."""
+    MIN_SPEED = 0.25
+    MAX_SPEED = 8
+    POLL_INTERVAL = 2  # milliseconds to wait before checking the buffer again when the decoder is behind
+    STATS_INTERVAL = 1  # seconds between calls to the stats callback
+    _END = object()  # marks the end of the video in the buffer
+
+    def __init__(self, window, reader, frame_callback, fps=30, speed=1, buffer_size=32,
+                 end_callback=None, stats_callback=None, reverse=False, loop=False):
+        """ Initialize a playback engine. inputs:
+        window - the tkinter window whose main loop drives the display
+        reader - a video reader with a read() method returning (ret, frame)
+        frame_callback - called on the main loop with (frame_idx, frame) for every frame displayed
+        fps - the recording's frame rate, e.g. SEQReader.properties['FrameRate']
+        speed - playback speed relative to the recording's frame rate
+        buffer_size - number of decoded frames held in the ring buffer
+        end_callback - optional, called on the main loop when the video ends
+        stats_callback - optional, called on the main loop with the stats dictionary about once a second
+        reverse - play the video backwards
+        loop - start over from the first frame (or the last frame if playing backwards) when the video ends"""
+        self.window = window
+        self.reader = reader
+        self.frame_callback = frame_callback
+        self.end_callback = end_callback
+        self.stats_callback = stats_callback
+        self.fps = fps if fps and fps > 0 else 30
+        self.speed = self.clamp_speed(speed)
+        self.buffer_size = buffer_size
+        self.reverse = reverse
+        self.loop = loop  # read by the decoder thread, so it can be toggled while playing
+        self.buffer = None
+        self.running = False
+        self.last_idx = None  # index of the last frame displayed
+        self._start_idx = 0
+        self._resume_idx = 0  # reader position when playback started
+        self._last_seq = -1
+        self.frames_shown = 0
+        self.frames_dropped = 0
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._after_id = None
+        self._pending = None
+        self._clock_start = 0.0
+        self._clock_seq = 0
+        self._play_start = 0.0
+        self._last_stats = 0.0
+
+    @classmethod
+    def clamp_speed(cls, speed):
+        """ Keep the playback speed within the supported range."""
+        return min(max(speed, cls.MIN_SPEED), cls.MAX_SPEED)
+
+    def tell(self):
+        """ Get the index of the next frame the reader will return."""
+        if hasattr(self.reader, 'frame_pointer'):
+            return self.reader.frame_pointer + 1
+        return int(self.reader.get(cv2.CAP_PROP_POS_FRAMES))
+
+    def seek(self, idx):
+        """ Set the reader so the next read returns frame idx."""
+        if hasattr(self.reader, 'frame_pointer'):
+            self.reader.frame_pointer = idx - 1
+        else:
+            self.reader.set(cv2.CAP_PROP_POS_FRAMES, idx)
+
+    def num_frames(self):
+        """ Get the number of frames in the video."""
+        if hasattr(self.reader, '__len__'):
+            return len(self.reader)
+        return int(self.reader.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    def start(self):
+        """ Start playing from the reader's current position. When playing backwards, start from the frame before
+        the last frame read, i.e. the one before the frame on display."""
+        if self.running:
+            return
+        self.running = True
+        self.buffer = queue.Queue(maxsize=self.buffer_size)
+        self._pending = None
+        self._stop_event.clear()
+        self._resume_idx = self.tell()
+        self._start_idx = self._resume_idx - 2 if self.reverse else self._resume_idx
+        self.last_idx = None
+        self._last_seq = -1
+        self._thread = threading.Thread(target=self._decode, args=(self._start_idx,), daemon=True)
+        self._thread.start()
+        self._reset_clock(0)
+        self._play_start = self._last_stats = self._clock_start
+        self.frames_shown = 0
+        self.frames_dropped = 0
+        self._schedule(0)
+
+    def stop(self):
+        """ Stop playing and leave the reader positioned right after the last frame displayed,
+        so stepping through frames manually continues from what the user sees."""
+        if not self.running:
+            return
+        self.running = False
+        self._stop_event.set()
+        if self._after_id is not None:
+            self.window.after_cancel(self._after_id)
+            self._after_id = None
+        self._thread.join()
+        self._thread = None
+        # The decoder reads ahead of the display, rewind the reader:
+        self.seek(self._resume_idx if self.last_idx is None else self.last_idx + 1)
+
+    def set_reverse(self, reverse):
+        """ Change the playback direction, playback is restarted from the frame on display."""
+        running = self.running
+        self.stop()
+        self.reverse = reverse
+        if running:
+            self.start()
+
+    def set_speed(self, speed):
+        """ Change the playback speed, the clock is restarted from the current frame so playback doesn't jump."""
+        self.speed = self.clamp_speed(speed)
+        if self.running:
+            self._reset_clock(self._last_seq + 1)
+            self._play_start = self._clock_start
+            self.frames_shown = 0
+            self.frames_dropped = 0
+        return self.speed
+
+    def stats(self):
+        """ Get the target and achieved frame rates, and the number of frames shown and dropped."""
+        elapsed = time.perf_counter() - self._play_start
+        achieved = self.frames_shown / elapsed if elapsed > 0 else 0.0
+        return {'target_fps': self.fps * self.speed, 'achieved_fps': achieved,
+                'frames_shown': self.frames_shown, 'frames_dropped': self.frames_dropped}
+
+    def report(self):
+        """ Get a short text summary of the playback stats to display in the GUI."""
+        stats = self.stats()
+        direction = ' reverse' if self.reverse else ''
+        loop = ' loop' if self.loop else ''
+        return f'{self.speed:g}x{direction}{loop}  {stats["achieved_fps"]:.1f}/{stats["target_fps"]:.1f} fps  ' \
+               f'dropped {stats["frames_dropped"]}'
+
+    def _decode(self, idx):
+        """ Decoder thread, fill the ring buffer with (sequence number, frame index, frame) tuples."""
+        step = -1 if self.reverse else 1
+        wrapped = False  # guards against looping forever over a video with no readable frames
+        seq = 0
+        num_frames = self.num_frames() if self.reverse else 0
+        while not self._stop_event.is_set():
+            if idx < 0:
+                ret, frame = False, None
+            else:
+                if self.reverse or wrapped:
+                    self.seek(idx)
+                ret, frame = self.reader.read()
+            if not ret or frame is None:
+                if self.loop and seq > 0 and not wrapped:
+                    # Wrap around to the other end of the video:
+                    idx = num_frames - 1 if self.reverse else 0
+                    wrapped = True
+                    continue
+                self._put(self._END)
+                return
+            wrapped = False
+            if not self._put((seq, idx, frame)):
+                return
+            seq += 1
+            idx += step
+
+    def _put(self, item):
+        """ Put an item in the ring buffer, waiting for free space unless playback is stopped."""
+        while not self._stop_event.is_set():
+            try:
+                self.buffer.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _reset_clock(self, seq):
+        self._clock_start = time.perf_counter()
+        self._clock_seq = seq
+
+    def _due_time(self, seq):
+        """ The time at which the frame with sequence number seq should be displayed."""
+        return self._clock_start + (seq - self._clock_seq) / (self.fps * self.speed)
+
+    def _schedule(self, delay):
+        """ Call the scheduler again after delay seconds."""
+        self._after_id = self.window.after(max(1, int(delay * 1000)), self._tick)
+
+    def _tick(self):
+        """ Main loop scheduler, display the frame that is due and drop frames that are already late."""
+        self._after_id = None
+        if not self.running:
+            return
+        now = time.perf_counter()
+        target = self._clock_seq + int((now - self._clock_start) * self.fps * self.speed)
+        item, ended = self._pending, False
+        self._pending = None
+        while item is None or item[0] < target:
+            try:
+                next_item = self.buffer.get_nowait()
+            except queue.Empty:
+                break
+            if next_item is self._END:
+                ended = True
+                break
+            if item is not None:
+                # We fell behind, skip the late frame:
+                self.frames_dropped += 1
+            item = next_item
+        if item is not None and item[0] > target and not ended:
+            # Woke up early, hold on to the frame until it is due:
+            self._pending = item
+            self._schedule(self._due_time(item[0]) - now)
+            return
+        if item is not None:
+            self._show(item)
+        if ended:
+            self.stop()
+            if self.end_callback:
+                self.end_callback()
+            return
+        if item is None:
+            # The decoder is behind, check again shortly:
+            self._after_id = self.window.after(self.POLL_INTERVAL, self._tick)
+            return
+        self._schedule(self._due_time(item[0] + 1) - time.perf_counter())
+
+    def _show(self, item):
+        seq, idx, frame = item
+        self.last_idx = idx
+        self._last_seq = seq
+        self.frames_shown += 1
+        self.frame_callback(idx, frame)
+        now = time.perf_counter()
+        if self.stats_callback and now - self._last_stats >= self.STATS_INTERVAL:
+            self._last_stats = now
+            self.stats_callback(self.stats())
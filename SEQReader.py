@@ -119,6 +119,20 @@ class SEQReader:
             ret = False
         return ret, frame
 
+    def grab(self):
+        """ Skip the next frame without reading or decoding it, same as cv2.VideoCapture.grab"""
+        if self.frame_pointer < self.properties['AllocatedFrames'] - 1:
+            self.frame_pointer += 1
+            return True
+        return False
+
+    def compressed_sizes(self):
+        """ Get the compressed (JPEG) size of every frame in bytes. Only the frame headers are read, no frame is
+        decoded."""
+        if len(self.image_buffers) < len(self):
+            self.get_imagebuffers(len(self) - 1)
+        return self.image_buffers
+
     def __len__(self):
         return self.properties['AllocatedFrames']
 
@@ -1,4 +1,5 @@
 import os
+import re
 import pandas as pd
 import tkinter as tk
 from tkinter.filedialog import askdirectory
@@ -33,6 +34,7 @@ class UncuratedLabeler(Labeler):
         # If a video file is currently open, release it:
         if self.player:
             if self.player.curr_vid:
+                self.player.stop_playback()
                 self.player.curr_vid.release()
                 if not self.log_saved:
                     # If the log has been change without saving, open a window prompt:
@@ -43,6 +45,9 @@ class UncuratedLabeler(Labeler):
                 # Delete videos tagged for deletion and move the swim videos to a new folder
 
 
+        if self.player:
+            self.player.prefetcher.shutdown()  # Stop decoding clips in the background
+            self.player.close_label_store()
         self.window.quit()
 
     def get_dir(self):
@@ -54,11 +59,14 @@ class UncuratedLabeler(Labeler):
                                                              "this will delete any unsaved labels. Are you sure?")
             if result != "yes":
                 return
+            self.player.stop_playback()
+            self.player.prefetcher.shutdown()
+            self.player.close_label_store()
         # Define the movie player that will handle video display and navigation,
         # we pass the label var and comment widget so that their values can be set when we load a new
         # video to the GUI:
         self.player = UncuratedMoviePlayer(self.window, label_var=self.label, comment_widget=self.ent_comment,
-                                  multichoice=self.LABEL_MULTICHOICE)
+                                  multichoice=self.LABEL_MULTICHOICE, use_label_store=self.USE_LABEL_STORE)
         self.player.load_directory()  # See the Movie Player class for details
         self.bind_keystrokes()
 
@@ -68,6 +76,8 @@ class UncuratedMoviePlayer(MoviePlayer):
     LOG_FILENAME = 'labeled_preds.csv'
     FOLDERNAME_TO_IGNORE = 'removed_doubles'
     COORDINATE_COLUMN_NAME = 'centroid'
+    CLIP_NAME_PATTERN = re.compile(r'_midframe_(?P<frame>\d+)_fish_(?P<fish_id>\d+)'
+                                   r'_coordinate_(?P<x>[\d.]+)-(?P<y>[\d.]+)(?:\.avi)?$')
     #def __init__(self,window, label_var=[],comment_widget=[], multichoice=False):
     #    super().__init__(window,label_var,comment_widget,multichoice)
 
@@ -94,27 +104,27 @@ class UncuratedMoviePlayer(MoviePlayer):
 
 
 
-    def get_entry(self,clip_name):
-        # name format is [experiment_name]_midframe_[frame_num]_fish_[fish_id]_coordinate_[centroidx-centroidy].avi
-        processed_name = clip_name.strip('.avi').split('_')
-        frame_num = int(processed_name[-5])
-        fish_id = int(processed_name[-3])
-        coords = processed_name[-1].split('-')
+    @classmethod
+    def parse_clip_names(cls, clip_names):
+        """ Build log entries for a list of clip file names in one vectorized pass, overrides the MoviePlayer
+        method for the uncurated clip name format:
+        [experiment_name]_midframe_[frame_num]_fish_[fish_id]_coordinate_[centroidx-centroidy].avi"""
+        names = pd.Series(list(clip_names), dtype=object)
+        parsed = names.str.extract(cls.CLIP_NAME_PATTERN)
+        coords = [[x, y] if x == x else np.NaN for x, y in zip(parsed['x'].values, parsed['y'].values)]
         # As we don't have any of the data about the parent video, we'll leave it blank for the user to fill later:
-        entry = {'frame': frame_num,
-        'fish_id': fish_id,
-        'centroid': coords,
-        'bboxs': np.NaN,
-        'detection_scores': np.NaN,
-        'detection_pred_class': np.NaN,
-        'action_preds': np.NaN,
-        'strike_scores': np.NaN,
-        'strike_labels': np.NaN,
-        'spit_labels': np.NaN,
-        'clip_name': clip_name,
-        'reviewer_label':None}
-        return entry
-
+        return pd.DataFrame({'frame': pd.to_numeric(parsed['frame']).astype('Int64'),
+                             'fish_id': pd.to_numeric(parsed['fish_id']).astype('Int64'),
+                             'centroid': coords,
+                             'bboxs': np.NaN,
+                             'detection_scores': np.NaN,
+                             'detection_pred_class': np.NaN,
+                             'action_preds': np.NaN,
+                             'strike_scores': np.NaN,
+                             'strike_labels': np.NaN,
+                             'spit_labels': np.NaN,
+                             'clip_name': names,
+                             'reviewer_label': None})
 
 if __name__ == '__main__':
     UncuratedLabeler()
\ No newline at end of file
@@ -0,0 +1,61 @@
+""" Measure the ClipDataLoader throughput, in clips per second, over one epoch of a labeled clip folder.
+Without a folder, a folder of synthetic MJPG clips and a log is created in a temporary directory.
+Usage: python benchmarks/clip_loader_benchmark.py [folder] [--workers N] [--batch_size B] [--size S]"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import cv2
+import numpy as np
+import pandas as pd
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ClipDataLoader import ClipDataset, ClipDataLoader
+
+
+def make_clips(folder, num_clips=256, num_frames=200, frame_size=650):
+    """ Write synthetic clips in the Movie Cutter format, with a log labeling them."""
+    rng = np.random.default_rng(0)
+    fourcc = cv2.VideoWriter_fourcc(*'MJPG')
+    background = rng.integers(0, 256, (frame_size, frame_size), dtype='uint8')
+    names = []
+    for i in range(num_clips):
+        name = f'cutoutframe_{i}_coords_{frame_size}-{frame_size}_fish0.avi'
+        writer = cv2.VideoWriter(os.path.join(folder, name), fourcc, 30, (frame_size, frame_size), False)
+        for t in range(num_frames):
+            writer.write(np.roll(background, t, axis=1))
+        writer.release()
+        names.append(name)
+    labels = rng.choice(['Swimming', 'Feeding Success', 'Feeding Fail'], num_clips)
+    pd.DataFrame({'clip_name': names, 'parent_video': 'video.seq', 'frame': np.arange(num_clips),
+                  'coordinates': '(325, 325)', 'comments': '', 'reviewer_label': labels}
+                 ).to_csv(os.path.join(folder, 'log.csv'), index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('folder', nargs='?', default=None)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--batch_size', type=int, default=16)
+    parser.add_argument('--size', type=int, default=112)
+    parser.add_argument('--clip_length', type=int, default=200)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        folder = args.folder
+        if folder is None:
+            print('[INFO] writing synthetic clips...')
+            make_clips(tmp_dir)
+            folder = tmp_dir
+        dataset = ClipDataset(folder, clip_length=args.clip_length, size=args.size)
+        with ClipDataLoader(dataset, batch_size=args.batch_size, num_workers=args.workers,
+                            prefetch_batches=2 * args.workers) as loader:
+            start = time.perf_counter()
+            for clips, labels, lengths in loader:
+                pass
+            elapsed = time.perf_counter() - start
+            print(f"[INFO] {len(dataset)} clips, {args.workers} workers, batch shape {loader.batch_shape}")
+            print(f"[INFO] {len(dataset) / elapsed:.0f} clips/s ({elapsed:.2f} s per epoch)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+""" Compare the per frame detection path of MovieProcessor (get_filter, get_contours and draw_boxes), which reuses
+preallocated image buffers, with the previous implementation that allocated new images for every step, on a
+synthetic video (see synthetic.py). Reports the time per frame and the image memory allocated per frame, as traced
+by tracemalloc (NumPy arrays, including the ones OpenCV returns).
+Usage: python benchmarks/detection_alloc_benchmark.py [num_frames] [width] [height]"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import cv2
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from MovieCutter import MovieProcessor
+from synthetic import write_video
+
+
+def legacy_get_filter(processor):
+    """ The get_filter implementation before the buffers were introduced."""
+    gray = processor.frame.copy()
+    if processor.blur[0] != 0:
+        gray = cv2.GaussianBlur(gray, processor.blur, 0)
+    gray = cv2.convertScaleAbs(gray, alpha=1, beta=processor.brighten)
+    processor.fg_mask = processor.bg_sub.apply(gray, None, 0.001)
+    denoise_background = cv2.GaussianBlur(gray, (71, 71), 0)
+    img = cv2.Canny(denoise_background, 10, 10)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (10, 10))
+    closing = cv2.morphologyEx(img, cv2.MORPH_CLOSE, kernel)
+    opening = cv2.morphologyEx(closing, cv2.MORPH_OPEN, kernel)
+    dilation = cv2.dilate(opening, kernel, iterations=2)
+    processor.combined = cv2.bitwise_and(processor.fg_mask, closing)
+
+
+def legacy_draw_boxes(processor):
+    """ The draw_boxes implementation before the buffers were introduced."""
+    gray = processor.frame.copy()
+    if processor.apply_brightness:
+        processor.processed_frame = cv2.convertScaleAbs(processor.frame, alpha=1, beta=processor.brighten)
+    else:
+        processor.processed_frame = processor.frame
+    for bbox, centroid in processor.bbox_dict.items():
+        x, y, w, h = bbox
+        lap = cv2.Laplacian(gray[y:y + h, x:x + w], cv2.CV_64F).var()
+        cv2.rectangle(processor.processed_frame, (x, y), (x + w - 1, y + h - 1), (255, 10, 0), 4)
+        cv2.circle(processor.processed_frame, centroid, 2, (255, 192, 0), -1)
+        cv2.putText(processor.processed_frame, f'{lap:.2f}', (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9,
+                    (36, 255, 12), 2)
+
+
+def current_get_filter(processor):
+    processor.get_filter()
+
+
+def current_draw_boxes(processor):
+    processor.draw_boxes()
+
+
+def run(vid_path, get_filter, draw_boxes, num_train_frames):
+    """ Train a processor and run the detection on the rest of the video, returns ms per frame, bytes allocated
+    per frame and the number of detections."""
+    with tempfile.TemporaryDirectory() as save_dir:
+        processor = MovieProcessor(vid_path, save_dir, num_train_frame=num_train_frames, apply_brightness=True)
+    processor.train_bg_subtractor()
+    frames = []
+    while True:
+        grabbed, frame = processor.cap.read()
+        if not grabbed:
+            break
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    processor.cap.release()
+    detections = 0
+    allocated = 0
+    elapsed = 0.0
+    tracemalloc.start()
+    for frame in frames:
+        processor.frame = frame
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        get_filter(processor)
+        processor.get_contours()
+        draw_boxes(processor)
+        elapsed += time.perf_counter() - start
+        allocated += tracemalloc.get_traced_memory()[1] - before
+        detections += len(processor.bbox_dict)
+    tracemalloc.stop()
+    return 1000 * elapsed / len(frames), allocated / len(frames), detections
+
+
+def main(num_frames=300, width=1920, height=1080):
+    num_train_frames = 100
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vid_path = os.path.join(tmp_dir, 'synthetic.avi')
+        write_video(vid_path, num_train_frames + num_frames, size=(width, height))
+        legacy_ms, legacy_bytes, legacy_detections = run(vid_path, legacy_get_filter, legacy_draw_boxes,
+                                                         num_train_frames)
+        current_ms, current_bytes, current_detections = run(vid_path, current_get_filter, current_draw_boxes,
+                                                            num_train_frames)
+    print(f"[INFO] {num_frames} frames of {width}x{height}")
+    print(f"[INFO] allocating: {legacy_ms:.1f} ms/frame, {legacy_bytes / 2**20:.1f} MB allocated per frame, "
+          f"{legacy_detections} detections")
+    print(f"[INFO] buffers: {current_ms:.1f} ms/frame, {current_bytes / 2**20:.2f} MB allocated per frame, "
+          f"{current_detections} detections ({legacy_ms / current_ms:.2f}x faster)")
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:4]])
@@ -0,0 +1,93 @@
+""" Check that the downsampled edge branch of the detection (MovieProcessor edge_scale) finds the same fish as the
+full resolution one, and time both. Runs on a synthetic video (see synthetic.py), where detections are also
+checked against the true larva positions, and on any real videos given.
+Usage: python benchmarks/edge_scale_parity.py [video ...] [--scales 2 4] [--frames 300]"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import cv2
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from MovieCutter import MovieProcessor
+from synthetic import write_video
+
+TOLERANCE = 20  # maximal distance in pixels between matching detections
+
+
+def detect(vid_path, edge_scale, num_frames, num_train_frames):
+    """ Run the detection on every frame after the training frames, returns the detected centroids of every frame
+    and the average get_filter time in ms."""
+    with tempfile.TemporaryDirectory() as save_dir:
+        processor = MovieProcessor(vid_path, save_dir, num_train_frame=num_train_frames, edge_scale=edge_scale)
+    processor.train_bg_subtractor()
+    detections = []
+    filter_time = 0.0
+    for _ in range(num_frames):
+        grabbed, frame = processor.cap.read()
+        if not grabbed:
+            break
+        processor.frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if processor.avi else frame
+        start = time.perf_counter()
+        processor.get_filter()
+        filter_time += time.perf_counter() - start
+        processor.get_contours()
+        detections.append(list(processor.bbox_dict.values()))
+    processor.cap.release()
+    return detections, 1000 * filter_time / max(len(detections), 1)
+
+
+def count_matches(points, others, tolerance=TOLERANCE):
+    """ Greedily pair points with the nearest other point within tolerance, returns the number of pairs."""
+    others = list(others)
+    matches = 0
+    for x, y in points:
+        if not others:
+            break
+        distances = [np.hypot(x - ox, y - oy) for ox, oy in others]
+        nearest = int(np.argmin(distances))
+        if distances[nearest] <= tolerance:
+            others.pop(nearest)
+            matches += 1
+    return matches
+
+
+def compare(vid_path, scales, num_frames, num_train_frames, truth=None):
+    reference, reference_time = detect(vid_path, 1, num_frames, num_train_frames)
+    total = sum(len(frame) for frame in reference)
+    print(f"[INFO] {os.path.basename(vid_path)}: full resolution edges {reference_time:.1f} ms/frame, "
+          f"{total} detections")
+    if truth is not None:
+        found = sum(count_matches(fish, frame) for fish, frame in zip(truth, reference))
+        print(f"[INFO]     larvae found: {found} / {sum(len(fish) for fish in truth[:len(reference)])}")
+    for scale in scales:
+        detections, scaled_time = detect(vid_path, scale, num_frames, num_train_frames)
+        matched = sum(count_matches(frame, ref) for frame, ref in zip(detections, reference))
+        scaled_total = sum(len(frame) for frame in detections)
+        print(f"[INFO]   edge_scale {scale}: {scaled_time:.1f} ms/frame "
+              f"({reference_time / scaled_time:.2f}x faster), {scaled_total} detections, "
+              f"{matched / max(total, 1):.1%} of the full resolution detections matched, "
+              f"{scaled_total - matched} extra")
+        if truth is not None:
+            found = sum(count_matches(fish, frame) for fish, frame in zip(truth, detections))
+            print(f"[INFO]     larvae found: {found} / {sum(len(fish) for fish in truth[:len(detections)])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Detection parity of the downsampled edge branch')
+    parser.add_argument('videos', nargs='*', help='real videos to compare on, AVI or SEQ')
+    parser.add_argument('--scales', type=int, nargs='*', default=[2, 4], help='edge scales to compare')
+    parser.add_argument('--frames', type=int, default=300, help='number of frames to detect on')
+    parser.add_argument('--train', type=int, default=100, help='number of background training frames')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        synthetic_path = os.path.join(tmp_dir, 'synthetic.avi')
+        positions = write_video(synthetic_path, args.train + args.frames)
+        compare(synthetic_path, args.scales, args.frames, args.train, truth=positions[args.train:])
+    for vid_path in args.videos:
+        compare(vid_path, args.scales, args.frames, args.train)
+
+
+if __name__ == '__main__':
+    main()
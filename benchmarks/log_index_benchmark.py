@@ -0,0 +1,63 @@
+""" Compare clip log lookups by boolean mask (the old MoviePlayer/Labeler approach) with the LogIndex lookups,
+on a synthetic log with 100k clips.
+Usage: python benchmarks/log_index_benchmark.py [num_clips] [num_steps]"""
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from LogIndex import LogIndex
+
+
+def make_log(num_clips):
+    """ Create a log with the same columns as the Movie Cutter log.csv file."""
+    frames = np.arange(num_clips) * 10
+    return pd.DataFrame({'clip_name': [f'cutoutframe_{f}_coords_100-200_fish0.avi' for f in frames],
+                         'parent_video': 'video.seq', 'frame': frames, 'coordinates': '(100, 200)',
+                         'comments': np.nan, 'reviewer_label': np.nan})
+
+
+def navigation_step_mask(log, clip_name):
+    """ One navigation step plus a label and a comment change, filtering the whole log every time."""
+    log.loc[log.clip_name == clip_name].reviewer_label.values[0]
+    log.loc[log.clip_name == clip_name].comments.values[0]
+    log.loc[log.clip_name == clip_name, ['frame', 'coordinates']].to_string(index=False)
+    log.loc[log.clip_name == clip_name, ['reviewer_label']] = 'Swimming'
+    log.loc[log.clip_name == clip_name, ['comments']] = 'ok'
+
+
+def navigation_step_index(log_index, clip_name):
+    """ The same step using the clip_name -> row index."""
+    log_index.get(clip_name, 'reviewer_label')
+    log_index.get(clip_name, 'comments')
+    log_index.get_row(clip_name, ['frame', 'coordinates']).to_string(index=False)
+    log_index.set(clip_name, 'reviewer_label', 'Swimming')
+    log_index.set(clip_name, 'comments', 'ok')
+
+
+def main(num_clips=100000, num_steps=200):
+    rng = np.random.default_rng(0)
+    log = make_log(num_clips)
+    clip_names = log.clip_name.values[rng.integers(0, num_clips, num_steps)]
+    start = time.perf_counter()
+    for clip_name in clip_names:
+        navigation_step_mask(log, clip_name)
+    mask_time = (time.perf_counter() - start) / num_steps
+
+    log = make_log(num_clips)
+    start = time.perf_counter()
+    log_index = LogIndex(log)
+    build_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for clip_name in clip_names:
+        navigation_step_index(log_index, clip_name)
+    index_time = (time.perf_counter() - start) / num_steps
+    print(f"[INFO] log rows: {num_clips}, navigation steps: {num_steps}")
+    print(f"[INFO] index build time: {1000 * build_time:.1f} ms")
+    print(f"[INFO] mask lookups: {1000 * mask_time:.2f} ms/step")
+    print(f"[INFO] indexed lookups: {1000 * index_time:.2f} ms/step ({mask_time / index_time:.0f}x faster)")
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,64 @@
+""" Compare cutting a video with MovieCutter (serially) and with ParallelCutter pools of increasing size, reports the
+throughput and how many of the serial segments the parallel cuts also found. Runs on a synthetic 1080p video (see
+synthetic.py) and on any real videos given, e.g. 1080p SEQ recordings. Segments are saved into temporary
+directories.
+Usage: python benchmarks/parallel_cutter_benchmark.py [video ...] [--workers 1 2 4] [--frames 2000]"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from MovieCutter import MovieCutter
+from ParallelCutter import ParallelCutter
+from synthetic import write_video
+
+
+def cut(vid_path, num_workers, just_log):
+    """ Cut a video into a temporary directory, serially if num_workers is 0. Returns the log and the cutting
+    time."""
+    with tempfile.TemporaryDirectory() as save_dir:
+        cutter = MovieCutter(vid_path, save_dir, save_movies=not just_log)
+        start = time.perf_counter()
+        if num_workers:
+            log = ParallelCutter(cutter, num_workers).cut()
+        else:
+            cutter.cut()
+            log = cutter.log
+        elapsed = time.perf_counter() - start
+    return log, elapsed
+
+
+def segments(log):
+    """ The (frame, coordinates) pairs of the segments in a log."""
+    return set(zip(log['frame'], log['coordinates'].astype(str)))
+
+
+def compare(vid_path, workers, just_log):
+    serial_log, serial_time = cut(vid_path, 0, just_log)
+    serial = segments(serial_log)
+    print(f"[INFO] {os.path.basename(vid_path)}: serial {serial_time:.1f} s, {len(serial)} segments")
+    for num_workers in workers:
+        log, elapsed = cut(vid_path, num_workers, just_log)
+        found = segments(log)
+        print(f"[INFO]   {num_workers} workers: {elapsed:.1f} s ({serial_time / elapsed:.2f}x faster), "
+              f"{len(found)} segments, {len(serial & found)} of the serial segments, {len(found - serial)} new")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput of the parallel cutter')
+    parser.add_argument('videos', nargs='*', help='real videos to cut, AVI or SEQ')
+    parser.add_argument('--workers', type=int, nargs='*', default=[1, 2, 4], help='pool sizes to compare')
+    parser.add_argument('--frames', type=int, default=2000, help='number of frames of the synthetic video')
+    parser.add_argument('--just_log', action='store_true', help="only write the logs, don't save the segments")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        synthetic_path = os.path.join(tmp_dir, 'synthetic.avi')
+        write_video(synthetic_path, args.frames, size=(1920, 1080))
+        compare(synthetic_path, args.workers, args.just_log)
+    for vid_path in args.videos:
+        compare(vid_path, args.workers, args.just_log)
+
+
+if __name__ == '__main__':
+    main()
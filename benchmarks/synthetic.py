@@ -0,0 +1,60 @@
+""" Synthetic fish larvae videos for the Movie Cutter benchmarks: a textured tank background with slowly drifting
+elongated blobs (the larvae) and small floating particles, plus sensor noise. The frames are grayscale, and the
+positions of the larvae are returned so detections can be checked against them."""
+import cv2
+import numpy as np
+
+
+def make_background(size, rng):
+    """ A smooth uneven illumination plus fine texture, like the tank floor."""
+    width, height = size
+    x = np.linspace(-1, 1, width)[None, :]
+    y = np.linspace(-1, 1, height)[:, None]
+    background = 110 + 25 * (1 - x ** 2 - y ** 2)
+    texture = cv2.GaussianBlur(rng.normal(0, 12, (height, width)), (0, 0), 3)
+    return np.clip(background + texture, 0, 255).astype('float32')
+
+
+def make_frames(num_frames, size=(1280, 720), num_fish=5, num_particles=40, seed=0):
+    """ Generate the frames of a synthetic video. inputs:
+    num_frames - number of frames
+    size - (width, height) of the frames
+    num_fish - number of larvae, each about 110x25 pixels, so they pass the Movie Cutter's default blob size filter
+    num_particles - number of small floating particles, which the detection should ignore
+    seed - random seed
+    Yields (frame, fish) pairs, frame is a (height, width) uint8 image and fish a list of the (x, y) larva centers."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    background = make_background(size, rng)
+    margin = 80
+    fish = rng.uniform([margin, margin], [width - margin, height - margin], (num_fish, 2))
+    fish_velocity = rng.normal(0, 2, (num_fish, 2))
+    # Diagonal larvae, so both sides of their bounding box are large enough:
+    fish_angle = rng.uniform(40, 50, num_fish) * rng.choice([-1, 1], num_fish)
+    particles = rng.uniform([0, 0], [width, height], (num_particles, 2))
+    for _ in range(num_frames):
+        frame = background.copy()
+        for (x, y), angle in zip(fish, fish_angle):
+            cv2.ellipse(frame, (int(x), int(y)), (55, 12), angle, 0, 360, 40, -1)
+        for x, y in particles:
+            cv2.circle(frame, (int(x), int(y)), 2, 60, -1)
+        frame += rng.normal(0, 3, frame.shape).astype('float32')
+        yield np.clip(frame, 0, 255).astype('uint8'), [(int(x), int(y)) for x, y in fish]
+        # Larvae swim in bursts and bounce off the tank walls, particles drift:
+        fish_velocity = 0.9 * fish_velocity + rng.normal(0, 0.8, fish_velocity.shape)
+        fish += fish_velocity
+        out = (fish < margin) | (fish > np.array([width, height]) - margin)
+        fish_velocity[out] *= -1
+        fish = np.clip(fish, margin, np.array([width, height]) - margin)
+        particles = (particles + rng.normal(0, 0.5, particles.shape)) % np.array([width, height])
+
+
+def write_video(path, num_frames, size=(1280, 720), num_fish=5, num_particles=40, seed=0, fps=30):
+    """ Write a synthetic video as a grayscale MJPG AVI file, returns the larva centers of every frame."""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, size, False)
+    positions = []
+    for frame, fish in make_frames(num_frames, size, num_fish, num_particles, seed):
+        writer.write(frame)
+        positions.append(fish)
+    writer.release()
+    return positions
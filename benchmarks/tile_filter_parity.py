@@ -0,0 +1,64 @@
+""" Check that the tiled edge mask of the detection (MovieProcessor tiles) gives the same foreground mask as the
+untiled one, and compare the get_filter latency. Runs on a synthetic 4K video (see synthetic.py) and on any real
+videos given.
+Usage: python benchmarks/tile_filter_parity.py [video ...] [--tiles 2 3 4] [--frames 100]"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import cv2
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from MovieCutter import MovieProcessor
+from synthetic import write_video
+
+
+def filter_masks(vid_path, tiles, num_frames, num_train_frames):
+    """ Run get_filter on the frames after the training frames, returns the foreground masks and the average
+    get_filter time in ms."""
+    with tempfile.TemporaryDirectory() as save_dir:
+        processor = MovieProcessor(vid_path, save_dir, num_train_frame=num_train_frames, tiles=tiles)
+    processor.train_bg_subtractor()
+    masks = []
+    filter_time = 0.0
+    for _ in range(num_frames):
+        grabbed, frame = processor.cap.read()
+        if not grabbed:
+            break
+        processor.frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if processor.avi else frame
+        start = time.perf_counter()
+        processor.get_filter()
+        filter_time += time.perf_counter() - start
+        masks.append(processor.combined.copy())
+    processor.cap.release()
+    return masks, 1000 * filter_time / max(len(masks), 1)
+
+
+def compare(vid_path, grids, num_frames, num_train_frames):
+    reference, reference_time = filter_masks(vid_path, None, num_frames, num_train_frames)
+    print(f"[INFO] {os.path.basename(vid_path)}: untiled {reference_time:.1f} ms/frame")
+    for grid in grids:
+        masks, tiled_time = filter_masks(vid_path, (grid, grid), num_frames, num_train_frames)
+        different = sum(np.count_nonzero(mask != ref) for mask, ref in zip(masks, reference))
+        print(f"[INFO]   {grid}x{grid} tiles: {tiled_time:.1f} ms/frame ({reference_time / tiled_time:.2f}x faster), "
+              f"{different} mask pixels differ in {len(masks)} frames")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mask parity and latency of the tiled edge mask')
+    parser.add_argument('videos', nargs='*', help='real videos to compare on, AVI or SEQ')
+    parser.add_argument('--tiles', type=int, nargs='*', default=[2, 3, 4], help='tile grids (n x n) to compare')
+    parser.add_argument('--frames', type=int, default=100, help='number of frames to filter')
+    parser.add_argument('--train', type=int, default=50, help='number of background training frames')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        synthetic_path = os.path.join(tmp_dir, 'synthetic.avi')
+        write_video(synthetic_path, args.train + args.frames, size=(3840, 2160), num_fish=10, num_particles=150)
+        compare(synthetic_path, args.tiles, args.frames, args.train)
+    for vid_path in args.videos:
+        compare(vid_path, args.tiles, args.frames, args.train)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+import numpy as np
+from ActivityIndex import ActivityIndex
+
+
+def burst_sizes(num_frames=2000, start=1000, stop=1005):
+    """ Frame sizes of a still video with a short burst of activity."""
+    sizes = np.full(num_frames, 10000)
+    sizes[start:stop] = 20000
+    return sizes
+
+
+def test_active_frames_padded():
+    index = ActivityIndex(burst_sizes(), window=250, threshold=3.0, pad=100)
+    # The size changes at frames 1000 and 1005 are active, padded by 100 frames on both sides:
+    assert np.flatnonzero(index.active).tolist() == list(range(900, 1106))
+    assert index.idle_stretches() == [(0, 900), (1106, 2000)]
+
+
+def test_idle_stop():
+    stop = ActivityIndex(burst_sizes(), pad=100).idle_stop()
+    assert stop.dtype == np.int64
+    assert (stop[:900] == 900).all()
+    assert (stop[900:1106] == -1).all()
+    assert (stop[1106:] == 2000).all()
+
+
+def test_idle_stop_min_length():
+    index = ActivityIndex(burst_sizes(), pad=100)
+    stop = index.idle_stop(min_length=895)  # the second stretch is only 894 frames long
+    assert (stop[:900] == 900).all()
+    assert (stop[900:] == -1).all()
+    assert (index.idle_stop(min_length=901) == -1).all()
+
+
+def test_idle_stop_still_video():
+    index = ActivityIndex(np.full(500, 10000))
+    assert (index.idle_stop() == 500).all()
+    assert index.idle_fraction == 1
+
+
+def test_idle_stop_empty():
+    index = ActivityIndex([])
+    assert len(index.idle_stop()) == 0
+    assert index.idle_stretches() == []
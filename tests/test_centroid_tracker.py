@@ -0,0 +1,70 @@
+import numpy as np
+from CentroidTracker import CentroidTracker
+
+
+def test_new_detections_start_tracks():
+    tracker = CentroidTracker()
+    assert tracker.update([(0, 0), (500, 500)]).tolist() == [0, 1]
+    assert tracker.position(0) == (0, 0)
+    assert tracker.position(1) == (500, 500)
+
+
+def test_greedy_association_closest_pair_first():
+    tracker = CentroidTracker(max_distance=100, smoothing=1)
+    tracker.update([(0, 0), (50, 0)])
+    # Track 1 is closest to the first detection (10 pixels) and takes it, track 0 is left with the second one
+    # (95 pixels) although matching track 0 with the first detection would move the tracks less in total:
+    ids = tracker.update([(40, 0), (95, 0)])
+    assert ids.tolist() == [1, 0]
+    assert tracker.position(0) == (95, 0)
+    assert tracker.position(1) == (40, 0)
+
+
+def test_detection_too_far_starts_new_track():
+    tracker = CentroidTracker(max_distance=100)
+    tracker.update([(0, 0)])
+    assert tracker.update([(150, 0)]).tolist() == [1]
+    assert set(tracker.tracks) == {0, 1}
+
+
+def test_smoothing():
+    tracker = CentroidTracker(smoothing=0.5)
+    tracker.update([(0, 0)])
+    tracker.update([(10, 20)])
+    assert np.allclose(tracker.tracks[0][0], (5, 10))
+    assert tracker.position(0) == (5, 10)
+
+
+def test_max_missed_expiry():
+    tracker = CentroidTracker(max_missed=2)
+    tracker.update([(0, 0)])
+    tracker.update([])
+    tracker.update([])
+    assert tracker.position(0) == (0, 0)  # missed max_missed updates, still alive
+    tracker.update([])
+    assert tracker.position(0) is None
+    assert not tracker.tracks
+
+
+def test_match_resets_missed_count():
+    tracker = CentroidTracker(max_missed=1)
+    tracker.update([(0, 0)])
+    tracker.update([])
+    assert tracker.update([(5, 0)]).tolist() == [0]
+    tracker.update([])
+    assert tracker.position(0) is not None
+
+
+def test_create_false():
+    tracker = CentroidTracker(max_distance=100)
+    tracker.update([(0, 0)])
+    ids = tracker.update([(10, 0), (300, 300)], create=False)
+    assert ids.tolist() == [0, -1]
+    assert list(tracker.tracks) == [0]
+    assert tracker.next_id == 1
+
+
+def test_next_id_offset():
+    tracker = CentroidTracker()
+    tracker.next_id = 2000000  # as set by the parallel cutter workers
+    assert tracker.update([(0, 0)]).tolist() == [2000000]
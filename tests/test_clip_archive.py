@@ -0,0 +1,91 @@
+import os
+import cv2
+import numpy as np
+import pytest
+from ClipArchive import ClipArchive, ClipArchiveWriter, open_capture
+
+
+def make_clip(num_frames, value):
+    """ Smooth gradient frames, so JPEG compression changes them very little."""
+    ramp = np.add.outer(np.arange(64), np.arange(80)).astype('uint8')
+    return [cv2.add(ramp, value + i) for i in range(num_frames)]
+
+
+def write_archive(path, clips):
+    """ Pack clips (clip name -> frames) the way the Movie Cutter does."""
+    writer = ClipArchiveWriter(path, 30, (80, 64))
+    for clip_name, frames in clips.items():
+        segment = writer.segment()
+        for frame in frames:
+            segment.write(frame)
+        segment.release()
+        writer.add_clip(clip_name, segment.frames)
+    writer.close()
+
+
+def read_frames(cap):
+    frames = []
+    while True:
+        grabbed, frame = cap.read()
+        if not grabbed:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def assert_close(frames, expected):
+    assert len(frames) == len(expected)
+    for frame, original in zip(frames, expected):
+        assert frame.shape == original.shape
+        assert np.abs(frame.astype('int16') - original).max() <= 8
+
+
+@pytest.fixture
+def clips():
+    return {'cutoutframe_100_coords_10-20_fish0.avi': make_clip(5, 10),
+            'cutoutframe_300_coords_30-40_fish1.avi': make_clip(3, 100)}
+
+
+def test_round_trip(tmp_path, clips):
+    path = os.path.join(tmp_path, 'video' + ClipArchive.EXTENSION)
+    write_archive(path, clips)
+    archive = ClipArchive(path)
+    assert archive.fps == 30
+    assert archive.frame_size == (80, 64)
+    assert archive.clip_names() == list(clips)
+    for clip_name, frames in clips.items():
+        assert_close(read_frames(archive.open_clip(clip_name)), frames)
+
+
+def test_open_capture_virtual_path(tmp_path, clips):
+    path = os.path.join(tmp_path, 'video' + ClipArchive.EXTENSION)
+    write_archive(path, clips)
+    clip_path = ClipArchive.open(path).clip_paths()[1]
+    assert ClipArchive.split_path(clip_path) == (path, 'cutoutframe_300_coords_30-40_fish1.avi')
+    cap = open_capture(clip_path)
+    assert cap.get(cv2.CAP_PROP_FRAME_COUNT) == 3
+    assert cap.grab()
+    assert cap.get(cv2.CAP_PROP_POS_FRAMES) == 1
+    assert_close(read_frames(cap), clips['cutoutframe_300_coords_30-40_fish1.avi'][1:])
+
+
+def test_export(tmp_path, clips):
+    path = os.path.join(tmp_path, 'video' + ClipArchive.EXTENSION)
+    write_archive(path, clips)
+    exported = ClipArchive(path).export(os.path.join(tmp_path, 'exported'))
+    assert [os.path.basename(exported_path) for exported_path in exported] == list(clips)
+    frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in read_frames(cv2.VideoCapture(exported[0]))]
+    assert len(frames) == 5
+    assert np.abs(frames[0].astype('int16') - clips['cutoutframe_100_coords_10-20_fish0.avi'][0]).mean() < 4
+
+
+@pytest.mark.parametrize('frame_size', [5, 1000])  # shorter and longer than the footer
+def test_unclosed_archive(tmp_path, frame_size):
+    path = os.path.join(tmp_path, 'video' + ClipArchive.EXTENSION)
+    writer = ClipArchiveWriter(path, 30, (80, 64))
+    writer.add_clip('cutoutframe_100_coords_10-20_fish0.avi', [b'x' * frame_size])
+    writer.file.flush()
+    with pytest.raises(ValueError):
+        ClipArchive(path)
+    writer.close()
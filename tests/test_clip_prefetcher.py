@@ -0,0 +1,35 @@
+import os
+import numpy as np
+import pytest
+from ClipArchive import ClipArchiveWriter
+from ClipPrefetcher import ClipPrefetcher
+
+
+def write_archive(path):
+    writer = ClipArchiveWriter(path, 30, (80, 64))
+    segment = writer.segment()
+    for value in (50, 100, 150):
+        segment.write(np.full((64, 80), value, dtype='uint8'))
+    writer.add_clip('cutoutframe_100_coords_10-20_fish0.avi', segment.frames)
+    writer.close()
+
+
+def test_failed_clip_not_cached(tmp_path):
+    archive_path = os.path.join(tmp_path, 'video.clips')
+    clip_path = os.path.join(archive_path, 'cutoutframe_100_coords_10-20_fish0.avi')
+    with open(archive_path, 'wb') as file:
+        file.write(b'still being written')
+    prefetcher = ClipPrefetcher()
+    try:
+        with pytest.raises(ValueError):
+            prefetcher.get(clip_path)
+        assert clip_path not in prefetcher.cache
+        # A failed prefetch is decoded again when the clip is requested:
+        prefetcher.prefetch_neighbours([clip_path], 0)
+        prefetcher.cache[clip_path].exception()  # wait for the prefetch
+        write_archive(archive_path)
+        clip = prefetcher.get(clip_path)
+        assert clip.num_frames == 3
+        assert clip_path in prefetcher.cache
+    finally:
+        prefetcher.shutdown()
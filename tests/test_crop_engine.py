@@ -0,0 +1,47 @@
+import numpy as np
+from CropEngine import CropEngine, compute_bounds
+
+
+def test_bounds_inside_frame():
+    x1, x2, y1, y2 = compute_bounds([(100, 200)], 50, (640, 480))
+    assert (x1.tolist(), x2.tolist(), y1.tolist(), y2.tolist()) == ([50], [150], [150], [250])
+
+
+def test_bounds_pushed_back_from_near_edge():
+    x1, x2, y1, y2 = compute_bounds([(10, 20)], 50, (640, 480))
+    assert (x1.tolist(), x2.tolist(), y1.tolist(), y2.tolist()) == ([0], [100], [0], [100])
+
+
+def test_bounds_pushed_back_from_far_edge():
+    x1, x2, y1, y2 = compute_bounds([(630, 470)], 50, (640, 480))
+    assert (x1.tolist(), x2.tolist(), y1.tolist(), y2.tolist()) == ([540], [640], [380], [480])
+
+
+def test_bounds_keep_full_size():
+    centers = np.array([(0, 0), (639, 479), (320, 5), (3, 240), (600, 100)])
+    x1, x2, y1, y2 = compute_bounds(centers, 50, (640, 480))
+    assert (x2 - x1 == 100).all() and (y2 - y1 == 100).all()
+    assert (x1 >= 0).all() and (x2 <= 640).all() and (y1 >= 0).all() and (y2 <= 480).all()
+
+
+def test_bounds_frame_smaller_than_window():
+    x1, x2, y1, y2 = compute_bounds([(30, 20)], 50, (60, 40))
+    assert (x1.tolist(), x2.tolist(), y1.tolist(), y2.tolist()) == ([0], [60], [0], [40])
+
+
+def test_crop_windows():
+    frame = np.arange(480 * 640, dtype='int64').reshape(480, 640).astype('uint8')
+    engine = CropEngine(50, (640, 480))
+    crops = engine.crop(frame, *engine.bounds([(100, 200), (630, 470)]))
+    assert crops.shape == (2, 100, 100)
+    assert (crops[0] == frame[150:250, 50:150]).all()
+    assert (crops[1] == frame[380:480, 540:640]).all()
+
+
+def test_crop_zero_padded_and_brightened():
+    engine = CropEngine(50, (60, 40), brighten=10, apply_brightness=True)
+    # Fill the reused buffer first, the padding of the next crop must not keep these values:
+    engine.crop(np.full((200, 200), 255, dtype='uint8'), [0], [100], [0], [100])
+    crops = engine.crop(np.full((40, 60), 100, dtype='uint8'), *engine.bounds([(30, 20)]))
+    assert (crops[0, :40, :60] == 110).all()
+    assert not crops[0, 40:].any() and not crops[0, :, 60:].any()
@@ -0,0 +1,19 @@
+import pytest
+from MovieCutter import MovieProcessor
+
+
+@pytest.mark.parametrize('edge_scale', [1, 2, 4])
+def test_valid_edge_scale(edge_scale):
+    MovieProcessor.check_edge_settings(edge_scale, None)
+
+
+@pytest.mark.parametrize('edge_scale', [0, 3, 6, 8])
+def test_invalid_edge_scale(edge_scale):
+    with pytest.raises(ValueError):
+        MovieProcessor.check_edge_settings(edge_scale, None)
+
+
+def test_tiles_only_at_full_resolution():
+    MovieProcessor.check_edge_settings(1, (2, 2))
+    with pytest.raises(ValueError):
+        MovieProcessor.check_edge_settings(2, (2, 2))
@@ -0,0 +1,43 @@
+import os
+import time
+import pytest
+from LabelStore import LabelStore
+from LogIndex import LogIndex
+from LabelerGUI import MoviePlayer
+
+
+def test_annotators_share_labels(tmp_path):
+    log_path = os.path.join(tmp_path, 'log.csv')
+    first, second = LabelStore.for_log(log_path, 'first'), LabelStore.for_log(log_path, 'second')
+    first.set('cutoutframe_100_coords_10-20_fish0.avi', 'reviewer_label', 'feeding')
+    second.set('cutoutframe_300_coords_30-40_fish1.avi', 'comments', 'blurry')
+    log_index = LogIndex(MoviePlayer.parse_clip_names(['cutoutframe_100_coords_10-20_fish0.avi',
+                                                       'cutoutframe_300_coords_30-40_fish1.avi']))
+    second.apply(log_index)
+    assert log_index.get('cutoutframe_100_coords_10-20_fish0.avi', 'reviewer_label') == 'feeding'
+    assert log_index.get('cutoutframe_300_coords_30-40_fish1.avi', 'comments') == 'blurry'
+    assert first.connection.execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
+    assert not os.path.exists(first.lock_path)
+    first.close()
+    second.close()
+
+
+def test_locked_store_times_out(tmp_path, monkeypatch):
+    store = LabelStore(os.path.join(tmp_path, 'log.sqlite'))
+    monkeypatch.setattr(LabelStore, 'BUSY_TIMEOUT_MS', 200)
+    open(store.lock_path, 'w').close()  # held by another annotator
+    with pytest.raises(TimeoutError):
+        store.set('cutoutframe_100_coords_10-20_fish0.avi', 'reviewer_label', 'feeding')
+    assert os.path.exists(store.lock_path)
+    store.close()
+
+
+def test_stale_lock_removed(tmp_path):
+    store = LabelStore(os.path.join(tmp_path, 'log.sqlite'))
+    open(store.lock_path, 'w').close()
+    old = time.time() - LabelStore.STALE_LOCK_SECONDS - 1
+    os.utime(store.lock_path, (old, old))  # left behind by a crashed annotator
+    store.set('cutoutframe_100_coords_10-20_fish0.avi', 'reviewer_label', 'feeding')
+    assert store.get_clip('cutoutframe_100_coords_10-20_fish0.avi') == {'reviewer_label': 'feeding'}
+    assert not os.path.exists(store.lock_path)
+    store.close()
@@ -0,0 +1,61 @@
+import os
+import LabelerGUI
+from ClipArchive import ClipArchiveWriter
+from ClipFileOps import ClipFileOps
+from LabelerGUI import Labeler, MoviePlayer
+
+
+def make_labeler(clip_names):
+    """ A Labeler and Movie Player with a log of clip_names, without the GUI."""
+    player = MoviePlayer.__new__(MoviePlayer)
+    player.log = MoviePlayer.parse_clip_names(clip_names)
+    player.label_store = None
+    player.curr_clip_name = None
+    player.index_log()
+    labeler = Labeler.__new__(Labeler)
+    labeler.player = player
+    labeler.log_saved = True
+    return labeler
+
+
+def test_label_clip_in_log():
+    labeler = make_labeler(['cutoutframe_100_coords_10-20_fish0.avi'])
+    labeler.set_clip_label('cutoutframe_100_coords_10-20_fish0.avi', 'feeding')
+    assert labeler.player.log_index.get('cutoutframe_100_coords_10-20_fish0.avi', 'reviewer_label') == 'feeding'
+    assert not labeler.log_saved
+
+
+def test_label_clip_not_in_log():
+    labeler = make_labeler(['cutoutframe_100_coords_10-20_fish0.avi'])
+    labeler.set_clip_label('cutoutframe_300_coords_30-40_fish1.avi', 'feeding')
+    log_index = labeler.player.log_index
+    assert 'cutoutframe_300_coords_30-40_fish1.avi' in log_index
+    assert log_index.get('cutoutframe_300_coords_30-40_fish1.avi', 'reviewer_label') == 'feeding'
+    assert log_index.get('cutoutframe_300_coords_30-40_fish1.avi', 'comments') == 'Video not found in log'
+    assert log_index.get('cutoutframe_300_coords_30-40_fish1.avi', 'frame') == 300
+    assert len(labeler.player.log) == 2
+
+
+def test_delete_skips_archived_clips(tmp_path, monkeypatch):
+    monkeypatch.setattr(LabelerGUI.messagebox, 'showinfo', lambda *args: None)
+    directory = str(tmp_path)
+    archive_path = os.path.join(directory, 'video.clips')
+    ClipArchiveWriter(archive_path, 30, (80, 64)).close()
+    open(os.path.join(directory, 'cutoutframe_100_coords_10-20_fish0.avi'), 'wb').close()
+    labeler = make_labeler(['cutoutframe_100_coords_10-20_fish0.avi', 'cutoutframe_300_coords_30-40_fish1.avi'])
+    player = labeler.player
+    player.directory = directory
+    player.file_paths = [os.path.join(directory, 'cutoutframe_100_coords_10-20_fish0.avi'),
+                         os.path.join(archive_path, 'cutoutframe_300_coords_30-40_fish1.avi')]
+    player.log_filepath = os.path.join(player.clip_directory(player.file_paths[-1]), 'log.csv')
+    assert player.log_filepath == os.path.join(directory, 'log.csv')
+    labeler.file_ops = ClipFileOps()
+    for clip_name in player.log['clip_name']:
+        labeler.set_clip_label(clip_name, 'Delete Video')
+    labeler.delete_videos()
+    assert not os.path.exists(player.file_paths[0])
+    # The packed clip is left in its archive, with its label and without a failure comment:
+    assert player.log['clip_name'].tolist() == ['cutoutframe_300_coords_30-40_fish1.avi']
+    assert player.log_index.get('cutoutframe_300_coords_30-40_fish1.avi', 'reviewer_label') == 'Delete Video'
+    assert player.log_index.get('cutoutframe_300_coords_30-40_fish1.avi', 'comments') == ''
+    assert os.path.isfile(os.path.join(directory, 'log.csv'))
@@ -0,0 +1,37 @@
+import os
+import cv2
+import numpy as np
+import pytest
+from MovieCutter import MovieCutter
+
+
+@pytest.fixture
+def cutter(tmp_path):
+    path = os.path.join(tmp_path, 'video.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30, (160, 120), False)
+    for value in range(20):
+        writer.write(np.full((120, 160), 100 + value, dtype='uint8'))
+    writer.release()
+    cutter = MovieCutter(path, os.path.join(tmp_path, 'cuts'))  # trains on a quarter of the 20 frames
+    yield cutter
+    cutter.cap.release()
+
+
+def test_tiny_roi(cutter):
+    # e.g. a short accidental drag in the GUI, smaller than the motion and track scales:
+    cutter.set_roi([(50, 50), (53, 50), (53, 52)])
+    assert cutter.roi_rect == (50, 50, 54, 53)
+    cutter.train_bg_subtractor()
+    grabbed, frame = cutter.cap.read()
+    cutter.frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    assert cutter.motion_detected()  # the first check frame
+    assert not cutter.motion_detected()
+    cutter.update_track_background()
+    assert len(cutter.track_detections()) == 0
+
+
+def test_roi_outside_frame(cutter):
+    with pytest.raises(ValueError):
+        cutter.set_roi([(200, 200), (300, 200), (300, 300)])
+    assert cutter.roi is None
+    assert cutter.roi_rect == (0, 0, 160, 120)